@@ -13,8 +13,10 @@ from flask_jwt_extended import JWTManager
 
 # Import services
 from services.image_service import ImageService
+from services.remote_image_service import RemoteImageService
 from services.voice_service import VoiceService
 from services.user_service import UserService
+from services.job_service import JobService
 from utils.translation import TranslationService
 
 # Import route factories
@@ -23,9 +25,11 @@ from routes.image_routes import create_image_routes
 from routes.voice_routes import create_voice_routes
 from routes.text_routes import create_text_routes
 from routes.system_routes import create_system_routes
+from routes.job_routes import create_job_routes
 
 # Import middleware
 from middleware.error_handler import handle_errors
+from config import GENERATION_MODE
 
 # Configure logging
 logging.basicConfig(
@@ -59,25 +63,30 @@ def create_app():
     bcrypt.init_app(app)
     jwt.init_app(app)
     
-    # Initialize services
-    image_service = ImageService()
+    # Initialize services; in remote mode the models live in model_server.py
+    image_service = RemoteImageService() if GENERATION_MODE == 'remote' else ImageService()
     image_service.set_mongo(mongo)  # Set mongo reference for database operations
+    image_service.start_warm_pool()  # Preload WARM_POOL_STYLES without blocking startup
+    image_service.start_retention()  # Keep IMAGES_DIR within its count and byte limits
+    job_service = JobService(image_service)
     voice_service = VoiceService()
     user_service = UserService(mongo, bcrypt)
     translation_service = TranslationService()
     
     # Register blueprints
     auth_bp = create_auth_routes(user_service, mongo, bcrypt)
-    image_bp = create_image_routes(image_service, user_service)
+    image_bp = create_image_routes(image_service, user_service, job_service)
     voice_bp = create_voice_routes(voice_service)
     text_bp = create_text_routes(translation_service)
-    system_bp = create_system_routes(image_service, user_service, mongo)
+    system_bp = create_system_routes(image_service, user_service, mongo, job_service)
+    job_bp = create_job_routes(job_service, user_service)
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(image_bp)
     app.register_blueprint(voice_bp)
     app.register_blueprint(text_bp)
     app.register_blueprint(system_bp)
+    app.register_blueprint(job_bp)
     
     # JWT error handlers
     @jwt.expired_token_loader
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark generation throughput against micro-batch size
+
+Fires a burst of concurrent requests at ImageService.schedule_generation
+for each batch size and reports images per minute. Run from the backend
+directory:
+
+    python benchmarks/batch_throughput.py --style dreamshaper --requests 16 --batch-sizes 1,2,4,8
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.image_service import ImageService
+from services.batch_scheduler import BatchScheduler
+
+PROMPTS = [
+    "a lighthouse on a cliff at sunset",
+    "a cat sleeping on a pile of books",
+    "a futuristic city skyline at night",
+    "a bowl of fruit on a wooden table",
+    "a mountain lake surrounded by pine trees",
+    "an old steam train crossing a bridge",
+    "a hot air balloon over green hills",
+    "a cozy cabin in the snow"
+]
+
+
+def run_burst(service, style, requests, size, steps):
+    """Submit `requests` concurrent generations and return (seconds, successes)"""
+    # Bypass the result cache, which would serve every burst after the first
+    kwargs = {'width': size, 'height': size, 'num_inference_steps': steps, 'use_cache': False}
+    # Earlier images still being written would compete with the timed calls
+    service.encoder.flush()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        futures = [
+            pool.submit(service.schedule_generation, PROMPTS[i % len(PROMPTS)], style, **kwargs)
+            for i in range(requests)
+        ]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(1 for result in results if result.get('success'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--style', default='dreamshaper')
+    parser.add_argument('--requests', type=int, default=16, help='concurrent requests per burst')
+    parser.add_argument('--batch-sizes', default='1,2,4,8')
+    parser.add_argument('--max-wait-ms', type=int, default=100)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--steps', type=int, default=10)
+    args = parser.parse_args()
+
+    service = ImageService()
+    images_dir = tempfile.mkdtemp(prefix='batch_bench_')
+
+    # Warm the model so the first burst does not pay the load time
+    service.generate_image(PROMPTS[0], args.style, images_dir=images_dir,
+                           width=args.size, height=args.size, num_inference_steps=args.steps, use_cache=False)
+
+    print(f"style={args.style} size={args.size} steps={args.steps} requests={args.requests}")
+    print(f"{'batch':>6} {'seconds':>9} {'ok':>4} {'img/min':>9} {'batches':>8}")
+
+    for batch_size in [int(value) for value in args.batch_sizes.split(',')]:
+        service.batch_scheduler.shutdown()
+        service.batch_scheduler = BatchScheduler(
+            lambda style, requests: service._generate_batch(style, requests, images_dir),
+            max_batch_size=batch_size,
+            max_wait=args.max_wait_ms / 1000
+        )
+        elapsed, ok = run_burst(service, args.style, args.requests, args.size, args.steps)
+        print(f"{batch_size:>6} {elapsed:>9.2f} {ok:>4} {ok / elapsed * 60:>9.2f} "
+              f"{service.batch_scheduler.stats['batches_run']:>8}")
+
+    service.batch_scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    main()
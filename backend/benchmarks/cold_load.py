@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Cold-load time and peak RSS per model, from_pretrained against fast-load snapshots
+
+Every measurement runs in a fresh subprocess, so nothing is cached in the
+interpreter and ru_maxrss is the peak of that one load. The snapshot is
+written first if it does not exist yet. Run from the backend directory:
+
+    python benchmarks/cold_load.py --styles realistic_vision,dreamshaper --runs 3
+
+Drop the OS page cache between runs (sync; echo 3 > /proc/sys/vm/drop_caches)
+to measure loads from disk rather than from memory.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_child(args):
+    """Load one model once and print JSON timings"""
+    sys.path.append(BACKEND_DIR)
+    import model_loader
+
+    start = time.perf_counter()
+    pipe = model_loader.load_model(args.style, backend='pytorch', mode='default',
+                                   device=args.device, fast_load=args.path == 'snapshot')
+    load_seconds = time.perf_counter() - start
+
+    print(json.dumps({
+        'style': args.style,
+        'path': args.path,
+        'load_seconds': load_seconds,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'device': str(pipe.device)
+    }))
+
+
+def measure(style, path, device):
+    command = [sys.executable, os.path.abspath(__file__), '--child',
+               '--style', style, '--path', path, '--device', device]
+    output = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True)
+    if output.returncode != 0:
+        raise SystemExit(f"{style}/{path}: load failed\n{output.stderr[-2000:]}")
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--styles', default='realistic_vision,dreamshaper')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--style', help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    print(f"device={args.device} runs={args.runs}")
+    print(f"{'style':>18} {'path':>11} {'median s':>9} {'min s':>7} {'peak MB':>8}")
+    for style in args.styles.split(','):
+        # Writes the snapshot when missing, so the timed runs below only read it
+        measure(style, 'snapshot', args.device)
+        for path in ('pretrained', 'snapshot'):
+            rows = [measure(style, path, args.device) for _ in range(args.runs)]
+            seconds = [row['load_seconds'] for row in rows]
+            print(f"{style:>18} {path:>11} {statistics.median(seconds):>9.2f} {min(seconds):>7.2f} "
+                  f"{max(row['peak_rss_mb'] for row in rows):>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
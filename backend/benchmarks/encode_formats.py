@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Encode time and file size per output format
+
+Compares the PNG settings used before off-thread encoding (optimize=True)
+with every format ImageEncoder can write. Uses a generated image from the
+images directory when one is given, otherwise a synthetic gradient with
+noise. Run from the backend directory:
+
+    python benchmarks/encode_formats.py --image generated_images/example.png --runs 5
+"""
+
+import os
+import sys
+import io
+import time
+import argparse
+import statistics
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+from services.image_encoder import OUTPUT_FORMATS, available_formats, encode_image
+
+
+def sample_image(size):
+    """Smooth gradients plus noise, roughly as hard to compress as a photo"""
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:size, 0:size] / size
+    channels = [np.sin(6 * x + 2 * c) * np.cos(4 * y - c) for c in range(3)]
+    pixels = (np.stack(channels, axis=-1) + 1) * 110 + rng.normal(0, 12, (size, size, 3))
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), 'RGB')
+
+
+def legacy_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', optimize=True, quality=95)
+    return buffer.getvalue()
+
+
+def time_encoder(encode, image, runs):
+    timings = []
+    data = b''
+    for _ in range(runs):
+        start = time.perf_counter()
+        data = encode(image)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--image', help='Image to encode (default: synthetic sample)')
+    parser.add_argument('--size', type=int, default=512, help='Synthetic sample size')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    image = Image.open(args.image).convert('RGB') if args.image else sample_image(args.size)
+    print(f"image={args.image or 'synthetic'} size={image.width}x{image.height} runs={args.runs}")
+
+    encoders = [('png (optimize=True)', legacy_png)]
+    encoders += [(name, lambda img, name=name: encode_image(img, name)) for name in available_formats()]
+    missing = [name for name in OUTPUT_FORMATS if name not in available_formats()]
+
+    print(f"{'format':>20} {'median ms':>10} {'bytes':>10}")
+    for name, encode in encoders:
+        seconds, size = time_encoder(encode, image, args.runs)
+        print(f"{name:>20} {1000 * seconds:>10.1f} {size:>10}")
+    if missing:
+        print(f"skipped (codec not installed): {', '.join(missing)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Trace-replay simulator for model eviction policies
+
+Replays a request trace (one style per line, or a JSONL file with a "style"
+field per line) against ModelBudget with each eviction policy and reports
+hit rate, loads and total reload seconds. Model sizes and reload times are
+given per style; without a trace a skewed synthetic one is generated, whose
+popular set shifts halfway through. Run from the backend directory:
+
+    python benchmarks/eviction_replay.py --budget-gb 12 \\
+        --models realistic_vision:4.1:38,dreamshaper:4.1:35,sdxl_turbo:7.0:70,tiny:1.0:6
+    python benchmarks/eviction_replay.py --trace requests.jsonl --models ...
+
+The 'count-lru' row is the behavior before the byte budget: plain LRU
+bounded only by MAX_MODELS_IN_MEMORY.
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_budget import ModelBudget, ModelBudgetExceeded, POLICIES
+
+
+def parse_models(spec):
+    """'name:size_gb:reload_seconds,...' -> {name: (size_bytes, reload_seconds)}"""
+    models = {}
+    for item in spec.split(','):
+        name, size_gb, reload_seconds = item.split(':')
+        models[name] = (int(float(size_gb) * 1024 ** 3), float(reload_seconds))
+    return models
+
+
+def load_trace(path):
+    styles = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            styles.append(json.loads(line)['style'] if line.startswith('{') else line)
+    return styles
+
+
+def synthetic_trace(models, length, skew, seed):
+    """Zipf-like popularity over the models; the ranking is reshuffled halfway through"""
+    rng = random.Random(seed)
+    names = list(models)
+    trace = []
+    for phase in range(2):
+        rng.shuffle(names)
+        weights = [1 / (rank + 1) ** skew for rank in range(len(names))]
+        trace += rng.choices(names, weights=weights, k=length // 2)
+    return trace
+
+
+def replay(trace, models, budget_bytes, policy, max_models):
+    budget = ModelBudget(budget_bytes=budget_bytes, policy=policy, max_models=max_models)
+    resident = {}
+    hits = loads = rejections = 0
+    reload_seconds = 0.0
+    for style in trace:
+        if style in resident:
+            hits += 1
+            budget.hit(style)
+            continue
+        size, cost = models[style]
+        try:
+            victims = budget.plan_admission(style, size, resident)
+        except ModelBudgetExceeded:
+            rejections += 1
+            continue
+        for victim in victims:
+            del resident[victim]
+            budget.evicted(victim)
+        # Stand-in pipeline: no torch modules, so the budget charges the given size
+        resident[style] = object()
+        budget.loaded(style, resident[style], cost, size)
+        loads += 1
+        reload_seconds += cost
+    return {
+        'hit_rate': hits / len(trace),
+        'loads': loads,
+        'reload_seconds': reload_seconds,
+        'rejections': rejections
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--models', default='realistic_vision:4.1:38,dreamshaper:4.1:35,sdxl_turbo:7.0:70,tiny:1.0:6',
+                        help='name:size_gb:reload_seconds,...')
+    parser.add_argument('--budget-gb', type=float, default=12)
+    parser.add_argument('--max-models', type=int, default=2, help='MAX_MODELS_IN_MEMORY for count-lru')
+    parser.add_argument('--trace', help='Request trace; synthetic when omitted')
+    parser.add_argument('--length', type=int, default=20000)
+    parser.add_argument('--skew', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    models = parse_models(args.models)
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(models, args.length, args.skew, args.seed)
+    unknown = set(trace) - set(models)
+    if unknown:
+        raise SystemExit(f"Trace styles without --models entries: {', '.join(sorted(unknown))}")
+
+    budget_bytes = int(args.budget_gb * 1024 ** 3)
+    runs = [('count-lru', float('inf'), 'lru', args.max_models)]
+    # The byte budget replaces the count limit, so it is lifted for these runs
+    runs += [(name, budget_bytes, name, len(models)) for name in POLICIES]
+
+    print(f"requests={len(trace)} models={len(models)} budget={args.budget_gb} GB")
+    print(f"{'policy':>10} {'hit rate':>9} {'loads':>7} {'reload s':>10} {'rejected':>9}")
+    for label, run_budget, policy, max_models in runs:
+        result = replay(trace, models, run_budget, policy, max_models)
+        print(f"{label:>10} {result['hit_rate']:>9.3f} {result['loads']:>7} "
+              f"{result['reload_seconds']:>10.0f} {result['rejections']:>9}")
+
+
+if __name__ == "__main__":
+    main()
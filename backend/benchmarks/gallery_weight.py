@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Gallery page weight with full-size originals against thumbnail derivatives
+
+Takes the newest images in the images directory as one gallery page and
+reports the bytes a client downloads for each size, plus the time to
+create the derivatives. Derivatives go to a temporary directory so the real
+cache is left alone. Run from the backend directory:
+
+    python benchmarks/gallery_weight.py --per-page 50
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import IMAGES_DIR, DERIVATIVE_SIZES
+from services.image_derivatives import DerivativeStore
+from services.image_storage import LocalImageStorage
+from services.retention import IMAGE_EXTENSIONS
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images-dir', default=IMAGES_DIR)
+    parser.add_argument('--per-page', type=int, default=50)
+    args = parser.parse_args()
+
+    storage = LocalImageStorage(args.images_dir)
+    files = sorted(storage.scan(IMAGE_EXTENSIONS), reverse=True)[:args.per_page]
+    if not files:
+        raise SystemExit(f"No images in {args.images_dir}; generate some first")
+
+    original_bytes = sum(size for _, _, size in files)
+    print(f"page of {len(files)} images from {args.images_dir}")
+    print(f"{'size':>10} {'page KB':>10} {'reduction':>10} {'create ms/img':>14}")
+    print(f"{'original':>10} {original_bytes / 1024:>10.0f} {'1.0x':>10} {'-':>14}")
+
+    derivatives_dir = tempfile.mkdtemp(prefix='derivatives-')
+    try:
+        store = DerivativeStore(storage, derivatives_dir=derivatives_dir)
+        for size in DERIVATIVE_SIZES:
+            start = time.perf_counter()
+            names = [store.get(filename, size) for _, filename, _ in files]
+            elapsed = time.perf_counter() - start
+            page_bytes = sum(os.path.getsize(os.path.join(derivatives_dir, name)) for name in names)
+            print(f"{size:>10} {page_bytes / 1024:>10.0f} {original_bytes / page_bytes:>9.1f}x "
+                  f"{1000 * elapsed / len(files):>14.1f}")
+    finally:
+        shutil.rmtree(derivatives_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
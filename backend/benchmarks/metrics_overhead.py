@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Hot-path cost of the metrics subsystem
+
+Times Histogram.observe and Counter.inc from several threads at once, and
+the /metrics export of a registry holding a realistic number of series.
+Run from the backend directory:
+
+    python benchmarks/metrics_overhead.py --threads 8 --ops 200000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.metrics import MetricsRegistry
+
+
+def run_threads(threads, ops, operation):
+    """Nanoseconds per call of operation(i), split over `threads` threads"""
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        barrier.wait()
+        for i in range(ops // threads):
+            operation(i)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for worker_thread in workers:
+        worker_thread.join()
+    return (time.perf_counter() - start) / ops * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200000)
+    parser.add_argument('--endpoints', type=int, default=30, help='Distinct route label values')
+    args = parser.parse_args()
+
+    registry = MetricsRegistry(enabled=True)
+    histogram = registry.histogram('bench_seconds', 'Benchmark latencies', ('endpoint', 'status'))
+    counter = registry.counter('bench_total', 'Benchmark count', ('cache', 'result'))
+    disabled = MetricsRegistry(enabled=False).histogram('bench_seconds', 'Disabled', ('endpoint', 'status'))
+
+    rng = random.Random(0)
+    values = [rng.lognormvariate(-2, 1.5) for _ in range(4096)]
+    endpoints = [f"/api/route_{index}" for index in range(args.endpoints)]
+
+    observe = run_threads(args.threads, args.ops, lambda i: histogram.observe(
+        values[i & 4095], endpoint=endpoints[i % len(endpoints)], status=200))
+    inc = run_threads(args.threads, args.ops, lambda i: counter.inc(cache='result', result='hit'))
+    off = run_threads(args.threads, args.ops, lambda i: disabled.observe(
+        values[i & 4095], endpoint=endpoints[i % len(endpoints)], status=200))
+
+    start = time.perf_counter()
+    text = registry.render()
+    render_ms = (time.perf_counter() - start) * 1000
+    summary = histogram.summary()
+
+    print(f"threads={args.threads} ops={args.ops} series={len(histogram.series)}")
+    print(f"histogram observe: {observe:8.0f} ns/op")
+    print(f"counter inc:       {inc:8.0f} ns/op")
+    print(f"disabled observe:  {off:8.0f} ns/op")
+    print(f"render:            {render_ms:8.2f} ms ({len(text.splitlines())} lines)")
+    print(f"observations counted: {sum(entry['count'] for entry in summary.values())}")
+
+
+if __name__ == "__main__":
+    main()
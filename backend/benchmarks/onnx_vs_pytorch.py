@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Side-by-side latency and memory benchmark of the PyTorch and ONNX backends
+
+Each backend runs in its own subprocess (INFERENCE_BACKEND is read at import
+time, and peak RSS is per process) and generates through
+ImageService.generate_image. Run from the backend directory:
+
+    python benchmarks/onnx_vs_pytorch.py --style realistic --runs 3
+
+The first ONNX run exports the model to ONNX_EXPORT_DIR; run once beforehand
+if the export time should not count as load time.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import statistics
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_child(args):
+    """Benchmark the backend selected through INFERENCE_BACKEND and print JSON"""
+    sys.path.append(BACKEND_DIR)
+    import psutil
+    from services.image_service import ImageService
+
+    service = ImageService()
+    images_dir = tempfile.mkdtemp(prefix='backend_bench_')
+    kwargs = {'width': args.size, 'height': args.size, 'num_inference_steps': args.steps, 'use_cache': False}
+
+    start = time.perf_counter()
+    service.get_model(args.style)
+    load_seconds = time.perf_counter() - start
+    rss_after_load = psutil.Process().memory_info().rss
+
+    latencies = []
+    for run in range(args.runs + 1):
+        # Earlier images still being written would compete with the timed calls
+        service.encoder.flush()
+        start = time.perf_counter()
+        result = service.generate_image(args.prompt, args.style, images_dir=images_dir, seed=run, **kwargs)
+        if not result['success']:
+            raise SystemExit(f"generation failed: {result['error']}")
+        if run > 0:  # first call is warm-up
+            latencies.append(time.perf_counter() - start)
+
+    print(json.dumps({
+        'backend': os.environ.get('INFERENCE_BACKEND'),
+        'load_seconds': load_seconds,
+        'median_seconds': statistics.median(latencies),
+        'min_seconds': min(latencies),
+        'rss_after_load_mb': rss_after_load / 1024 / 1024,
+        # ru_maxrss is in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--style', default='realistic')
+    parser.add_argument('--backends', default='pytorch,onnx')
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--prompt', default='a lighthouse on a cliff at sunset, photograph')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    rows = []
+    for backend in args.backends.split(','):
+        env = {**os.environ, 'INFERENCE_BACKEND': backend, 'BATCHING_ENABLED': 'False'}
+        command = [sys.executable, os.path.abspath(__file__), '--child',
+                   '--style', args.style, '--runs', str(args.runs), '--size', str(args.size),
+                   '--steps', str(args.steps), '--prompt', args.prompt]
+        output = subprocess.run(command, env=env, cwd=BACKEND_DIR, capture_output=True, text=True)
+        if output.returncode != 0:
+            print(f"{backend}: failed\n{output.stderr[-2000:]}")
+            continue
+        rows.append(json.loads(output.stdout.strip().splitlines()[-1]))
+
+    print(f"style={args.style} size={args.size} steps={args.steps} runs={args.runs}")
+    print(f"{'backend':>8} {'load s':>8} {'median s':>9} {'min s':>7} {'rss MB':>8} {'peak MB':>8}")
+    for row in rows:
+        print(f"{row['backend']:>8} {row['load_seconds']:>8.1f} {row['median_seconds']:>9.2f} "
+              f"{row['min_seconds']:>7.2f} {row['rss_after_load_mb']:>8.0f} {row['peak_rss_mb']:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Quality and latency check of the quantized load mode against fp32
+
+Generates the same prompts with fixed seeds from an fp32 and a dynamically
+int8-quantized copy of one model on CPU, then reports PSNR and mean
+absolute pixel difference per image, per-step latency, the serialized size
+of the quantized components and how many of their Linear layers were
+converted. Dynamic quantization derives activation scales at run time, so
+no calibration dataset is needed; this script is the acceptance check
+instead. It exits non-zero when any image falls below
+--min-psnr. Run from the backend directory:
+
+    python benchmarks/quantization_check.py --style realistic_vision --min-psnr 20
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import torch
+import model_loader
+from config import QUANTIZED_COMPONENTS
+
+PROMPTS = [
+    "a lighthouse on a cliff at sunset, photograph",
+    "portrait of an old fisherman, detailed, cinematic lighting",
+    "anime girl with a red umbrella in the rain",
+    "a bowl of fruit on a wooden table, natural light"
+]
+
+
+def serialized_mb(module):
+    """Size of a module's state dict as saved to disk"""
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell() / 1024 / 1024
+
+
+def generate(pipe, args):
+    """Generate every prompt with its fixed seed; returns (images, seconds per step)"""
+    images = []
+    elapsed = 0.0
+    for seed, prompt in enumerate(PROMPTS[:args.prompts]):
+        start = time.perf_counter()
+        result = pipe(
+            prompt=prompt,
+            num_inference_steps=args.steps,
+            width=args.size,
+            height=args.size,
+            generator=torch.Generator(device="cpu").manual_seed(seed)
+        )
+        elapsed += time.perf_counter() - start
+        images.append(np.asarray(result.images[0], dtype=np.float64))
+    return images, elapsed / (len(images) * args.steps)
+
+
+def psnr(reference, candidate):
+    mse = np.mean((reference - candidate) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--style', default='realistic_vision')
+    parser.add_argument('--prompts', type=int, default=len(PROMPTS))
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--min-psnr', type=float, default=20.0)
+    args = parser.parse_args()
+
+    if torch.cuda.is_available():
+        print("note: quantized mode is CPU only; both runs use the CPU pipeline")
+
+    results = {}
+    sizes = {}
+    layers = {}
+    for mode in ('default', 'quantized'):
+        pipe = model_loader.load_model(args.style, backend='pytorch', mode=mode)
+        pipe = pipe.to("cpu")
+        sizes[mode] = {component: serialized_mb(getattr(pipe, component)) for component in QUANTIZED_COMPONENTS}
+        layers[mode] = {component: model_loader.count_linear_layers(getattr(pipe, component))
+                        for component in QUANTIZED_COMPONENTS}
+        results[mode] = generate(pipe, args)
+        model_loader.unload_model(pipe)
+        del pipe
+
+    reference, fp32_step = results['default']
+    quantized, int8_step = results['quantized']
+
+    print(f"style={args.style} size={args.size} steps={args.steps} threads={torch.get_num_threads()}")
+    print(f"{'component':>14} {'fp32 MB':>9} {'int8 MB':>9} {'Linear':>7} {'int8':>6} {'left fp32':>10}")
+    for component in QUANTIZED_COMPONENTS:
+        quantized, remaining = layers['quantized'][component]
+        print(f"{component:>14} {sizes['default'][component]:>9.0f} {sizes['quantized'][component]:>9.0f} "
+              f"{sum(layers['default'][component]):>7} {quantized:>6} {remaining:>10}")
+    print(f"seconds/step: fp32 {fp32_step:.3f}, int8 {int8_step:.3f} ({fp32_step / int8_step:.2f}x)")
+
+    failures = 0
+    print(f"{'seed':>5} {'psnr dB':>8} {'mean abs diff':>14}  prompt")
+    for seed, (ref, cand) in enumerate(zip(reference, quantized)):
+        score = psnr(ref, cand)
+        failures += score < args.min_psnr
+        print(f"{seed:>5} {score:>8.2f} {np.mean(np.abs(ref - cand)):>14.2f}  {PROMPTS[seed][:50]}")
+
+    if failures:
+        print(f"{failures} image(s) below {args.min_psnr} dB")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Image cleanup cost at large directory sizes: glob-and-sort against the retention index
+
+Fills a temporary directory with small files, then times one cleanup run
+that removes the `--evict` oldest files with the old approach (glob every
+extension, getmtime every file, sort) and with RetentionManager (one
+startup scan, then O(k) eviction from the index). Run from the backend
+directory:
+
+    python benchmarks/retention_cleanup.py --files 100000 --evict 100
+"""
+
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.retention import RetentionManager
+from services.image_storage import LocalImageStorage
+
+
+def populate(directory, count, start=0):
+    """Create `count` small files with increasing mtimes"""
+    base = time.time() - 10 * (start + count)
+    names = []
+    for index in range(start, start + count):
+        name = f"generated_{index:08d}.png"
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            f.write(b'\0' * 64)
+        os.utime(path, (base + 10 * index, base + 10 * index))
+        names.append(name)
+    return names
+
+
+def legacy_cleanup(directory, max_images):
+    """cleanup_old_images as it was before the retention index"""
+    image_files = []
+    for ext in ["*.png", "*.jpg", "*.jpeg", "*.webp"]:
+        image_files.extend(glob.glob(os.path.join(directory, ext)))
+    if len(image_files) > max_images:
+        image_files.sort(key=os.path.getmtime)
+        for old_file in image_files[:-max_images]:
+            os.remove(old_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--evict', type=int, default=100, help='Files over the limit per cleanup run')
+    parser.add_argument('--runs', type=int, default=3)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='retention-')
+    try:
+        print(f"populating {args.files} files in {directory}")
+        populate(directory, args.files)
+        next_index = args.files
+
+        legacy_seconds = []
+        for _ in range(args.runs):
+            populate(directory, args.evict, next_index)
+            next_index += args.evict
+            start = time.perf_counter()
+            legacy_cleanup(directory, args.files)
+            legacy_seconds.append(time.perf_counter() - start)
+
+        manager = RetentionManager(LocalImageStorage(directory), max_images=args.files, max_bytes=0)
+        start = time.perf_counter()
+        manager.rescan()
+        scan_seconds = time.perf_counter() - start
+
+        indexed_seconds = []
+        for _ in range(args.runs):
+            names = populate(directory, args.evict, next_index)
+            next_index += args.evict
+            for name in names:
+                manager.add(name, 64)
+            start = time.perf_counter()
+            removed = manager.enforce()
+            indexed_seconds.append(time.perf_counter() - start)
+            assert removed == args.evict, removed
+
+        print(f"{'approach':>24} {'best ms':>10}")
+        print(f"{'glob + getmtime + sort':>24} {1000 * min(legacy_seconds):>10.1f}")
+        print(f"{'index scan (startup)':>24} {1000 * scan_seconds:>10.1f}")
+        print(f"{'index eviction':>24} {1000 * min(indexed_seconds):>10.1f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
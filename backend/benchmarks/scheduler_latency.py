@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Record generation latency against step count for each speed-mode sampler
+
+Loads one model, then times a single generation for every (scheduler, steps)
+pair and prints a markdown table. Run from the backend directory on the
+target CPU host and keep the output with the deployment notes:
+
+    python benchmarks/scheduler_latency.py --style realistic --steps 4,8,12,20,30
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+import model_loader
+from config import SPEED_MODES
+from services.image_service import ImageService
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--style', default='realistic')
+    parser.add_argument('--steps', default='4,8,12,20,30')
+    parser.add_argument('--schedulers', default=','.join(['default', *model_loader.SCHEDULER_FACTORIES]))
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--prompt', default='a lighthouse on a cliff at sunset, photograph')
+    args = parser.parse_args()
+
+    service = ImageService()
+    images_dir = tempfile.mkdtemp(prefix='scheduler_bench_')
+    schedulers = args.schedulers.split(',')
+    steps_list = [int(value) for value in args.steps.split(',')]
+
+    for name in schedulers:
+        if name != 'default' and name not in model_loader.SCHEDULER_FACTORIES:
+            parser.error(f"unknown scheduler: {name}")
+
+    # Warm-up run pays the model load and first-call overheads
+    service.generate_image(args.prompt, args.style, images_dir=images_dir,
+                           width=args.size, height=args.size, num_inference_steps=2, use_cache=False)
+
+    modes = {mode['scheduler']: name for name, mode in SPEED_MODES.items()}
+    print(f"device={'cuda' if torch.cuda.is_available() else 'cpu'} threads={torch.get_num_threads()} "
+          f"style={args.style} size={args.size}x{args.size}")
+    print()
+    print("| scheduler | mode | " + " | ".join(f"{steps} steps" for steps in steps_list) + " |")
+    print("|---|---|" + "---|" * len(steps_list))
+
+    for name in schedulers:
+        speed_mode = modes.get(name)
+        cells = []
+        for steps in steps_list:
+            kwargs = {'width': args.size, 'height': args.size, 'num_inference_steps': steps,
+                      'scheduler': name, 'use_cache': False, 'seed': 1234}
+            # Earlier images still being written would compete with the timed calls
+            service.encoder.flush()
+            start = time.perf_counter()
+            result = service.generate_image(args.prompt, args.style, images_dir=images_dir, **kwargs)
+            elapsed = time.perf_counter() - start
+            cells.append(f"{elapsed:.2f}s" if result['success'] else "failed")
+        print(f"| {name} | {speed_mode or '-'} | " + " | ".join(cells) + " |")
+
+
+if __name__ == "__main__":
+    main()
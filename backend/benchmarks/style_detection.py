@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Style detection microbenchmark: substring scans against the compiled StyleDetector
+
+Times the old per-keyword `in` scan, the compiled matcher without its memo,
+memoized single calls and detect_batch over a prompt set with repeats, and
+detect_batch against single calls on unique prompts only, in microseconds
+per prompt. Run from the backend directory:
+
+    python benchmarks/style_detection.py --prompts 100000 --unique 2000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DREAMSHAPER_KEYWORDS, REALISTIC_KEYWORDS
+from utils.style_detector import StyleDetector
+
+FILLER = ['a', 'of', 'the', 'woman', 'city', 'at', 'night', 'forest', 'dragon', 'surreal', 'filmmaker',
+          'street', 'old', 'man', 'cat', 'sunset', 'with', 'rain', 'neon', 'castle']
+
+
+def legacy_detect(prompt):
+    """detect_visual_style scoring before the compiled matcher"""
+    prompt_lower = prompt.lower()
+    dreamshaper_score = 0
+    realistic_score = 0
+    for keyword, score in DREAMSHAPER_KEYWORDS.items():
+        if keyword in prompt_lower:
+            dreamshaper_score += score
+    for keyword, score in REALISTIC_KEYWORDS.items():
+        if keyword in prompt_lower:
+            realistic_score += score
+    if any(word in prompt_lower for word in ['anime', 'cartoon', 'manga', 'illustration']):
+        dreamshaper_score += 5
+    if any(word in prompt_lower for word in ['photograph', 'photo', 'realistic', 'real']):
+        realistic_score += 5
+    return 'dreamshaper' if dreamshaper_score > realistic_score else 'realistic_vision'
+
+
+def make_prompts(count, unique, seed=0):
+    rng = random.Random(seed)
+    keywords = list(DREAMSHAPER_KEYWORDS) + list(REALISTIC_KEYWORDS)
+    pool = [' '.join(rng.sample(FILLER, 8) + rng.sample(keywords, 3)) for _ in range(unique)]
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def per_prompt_us(function, prompts):
+    start = time.perf_counter()
+    function(prompts)
+    return 1e6 * (time.perf_counter() - start) / len(prompts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prompts', type=int, default=100000)
+    parser.add_argument('--unique', type=int, default=2000)
+    args = parser.parse_args()
+
+    prompts = make_prompts(args.prompts, args.unique)
+    uncached = StyleDetector(cache_size=0)
+    memoized = StyleDetector()
+    batched = StyleDetector()
+
+    print(f"prompts={args.prompts} unique={args.unique}")
+    print(f"{'method':>24} {'us/prompt':>10}")
+    print(f"{'substring scan (old)':>24} {per_prompt_us(lambda ps: [legacy_detect(p) for p in ps], prompts):>10.2f}")
+    print(f"{'compiled, no memo':>24} {per_prompt_us(lambda ps: [uncached.detect(p) for p in ps], prompts):>10.2f}")
+    print(f"{'compiled, memoized':>24} {per_prompt_us(lambda ps: [memoized.detect(p) for p in ps], prompts):>10.2f}")
+    print(f"{'detect_batch':>24} {per_prompt_us(batched.detect_batch, prompts):>10.2f}")
+    # Every prompt unseen: the matrix scoring path without any memo hits
+    cold = list(dict.fromkeys(prompts))
+    print(f"{'detect_batch, all unique':>24} {per_prompt_us(StyleDetector(cache_size=0).detect_batch, cold):>10.2f}")
+    print(f"{'compiled, all unique':>24} {per_prompt_us(lambda ps: [uncached.detect(p) for p in ps], cold):>10.2f}")
+    print(f"memo: {memoized.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
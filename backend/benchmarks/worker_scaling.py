@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark CPU throughput against the number of inference workers
+
+Sends a burst of requests alternating between styles through
+ImageService.schedule_generation for each worker count and reports images
+per minute. Each worker count gets that many CPU execution slots over the
+available cores. Both models are warmed first so load time is excluded. Run
+from the backend directory on a CPU-only host:
+
+    python benchmarks/worker_scaling.py --workers 1,2 --requests 8
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import torch
+import device_pool
+from services.image_service import ImageService
+from services.batch_scheduler import BatchScheduler
+
+PROMPTS = [
+    "a lighthouse on a cliff at sunset",
+    "a cat sleeping on a pile of books",
+    "a futuristic city skyline at night",
+    "a bowl of fruit on a wooden table"
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--styles', default='realistic,dreamshaper')
+    parser.add_argument('--workers', default='1,2')
+    parser.add_argument('--requests', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--size', type=int, default=512)
+    parser.add_argument('--steps', type=int, default=10)
+    args = parser.parse_args()
+
+    styles = args.styles.split(',')
+    kwargs = {'width': args.size, 'height': args.size, 'num_inference_steps': args.steps, 'use_cache': False}
+    service = ImageService()
+    images_dir = tempfile.mkdtemp(prefix='worker_bench_')
+
+    for style in styles:
+        service.generate_image(PROMPTS[0], style, images_dir=images_dir, **kwargs)
+
+    cpu_count = os.cpu_count() or 1
+    print(f"cpus={cpu_count} styles={styles} size={args.size} steps={args.steps} requests={args.requests}")
+    print(f"{'workers':>8} {'threads':>8} {'seconds':>9} {'ok':>4} {'img/min':>9}")
+
+    for workers in [int(value) for value in args.workers.split(',')]:
+        service.batch_scheduler.shutdown()
+        service.device_pool.shutdown()
+        service.device_pool = device_pool.DevicePool(device_pool.parse_slots('', cpu_slots=workers))
+        for style in styles:
+            service.device_pool.place(style)
+        service.batch_scheduler = BatchScheduler(
+            lambda style, requests: service._generate_batch(style, requests, images_dir),
+            max_batch_size=args.batch_size,
+            workers=workers,
+            capacity=service.device_pool.capacity
+        )
+        threads = min(slot.threads for slot in service.device_pool.slots)
+        torch.set_num_threads(threads)
+
+        # Earlier images still being written would compete with the timed calls
+        service.encoder.flush()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.requests) as pool:
+            futures = [
+                pool.submit(service.schedule_generation, PROMPTS[i % len(PROMPTS)], styles[i % len(styles)], **kwargs)
+                for i in range(args.requests)
+            ]
+            ok = sum(1 for future in futures if future.result().get('success'))
+        elapsed = time.perf_counter() - start
+        print(f"{workers:>8} {threads:>8} {elapsed:>9.2f} {ok:>4} {ok / elapsed * 60:>9.2f}")
+
+    service.batch_scheduler.shutdown()
+
+
+if __name__ == "__main__":
+    main()
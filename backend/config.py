@@ -11,11 +11,58 @@ BASE_DIR = Path(__file__).parent
 # Images directory
 IMAGES_DIR = os.path.join(BASE_DIR, 'images')
 os.makedirs(IMAGES_DIR, exist_ok=True)
+# Image storage backend; 'local' shards IMAGES_DIR into <root>/ab/cd/ directories by image uuid
+IMAGE_STORAGE = os.environ.get('IMAGE_STORAGE', 'local')
 
 # Model configurations
 MODELS_DIR = os.path.join(BASE_DIR, 'models')
 MAX_MODELS_IN_MEMORY = int(os.environ.get('MAX_MODELS_IN_MEMORY', 2))
 MODEL_TIMEOUT = int(os.environ.get('MODEL_TIMEOUT', 300))  # 5 minutes
+# Bytes of model weights allowed in memory; 0 derives it from device memory (see model_budget.py)
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get('MODEL_MEMORY_BUDGET_MB', 0))
+MODEL_MEMORY_BUDGET_FRACTION = float(os.environ.get('MODEL_MEMORY_BUDGET_FRACTION', 0.6))
+# Which resident model makes room for a new one: 'gds' (GreedyDual-Size with frequency) or 'lru'
+EVICTION_POLICY = os.environ.get('EVICTION_POLICY', 'gds').lower()
+# Extra idle seconds before unloading per second a model takes to reload
+IDLE_SECONDS_PER_RELOAD_SECOND = int(os.environ.get('IDLE_SECONDS_PER_RELOAD_SECOND', 60))
+# Inference backend: 'pytorch' or 'onnx' (ONNX Runtime, needs optimum[onnxruntime])
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'pytorch').lower()
+ONNX_EXPORT_DIR = os.environ.get('ONNX_EXPORT_DIR', os.path.join(MODELS_DIR, 'onnx'))
+ONNX_PROVIDER = os.environ.get('ONNX_PROVIDER', 'CPUExecutionProvider')
+
+# Model load mode: 'default' or 'quantized' (dynamic int8 Linear layers in the
+# UNet and text encoder; CPU only)
+MODEL_LOAD_MODE = os.environ.get('MODEL_LOAD_MODE', 'default').lower()
+QUANTIZED_COMPONENTS = ('unet', 'text_encoder')
+
+# Fast-load snapshots: single-file, pre-converted copies of each pipeline,
+# written on the first from_pretrained load (see model_snapshot.py)
+FAST_LOAD_ENABLED = os.environ.get('FAST_LOAD_ENABLED', 'True').lower() == 'true'
+SNAPSHOT_DIR = os.environ.get('SNAPSHOT_DIR', os.path.join(MODELS_DIR, 'snapshots'))
+
+# Residency tiers below the device (see model_tiers.py): models evicted from an
+# accelerator are kept in host RAM up to HOST_TIER_MB, then fall back to
+# their snapshot; DISK_TIER_MB bounds SNAPSHOT_DIR (0 = unbounded). CPU-only
+# hosts skip the host tier, since their device tier already is host RAM.
+HOST_TIER_MB = int(os.environ.get('HOST_TIER_MB', 4096))
+# Page-locked memory speeds up promotion but cannot be swapped or reclaimed
+# by the OS; only enable it on hosts with RAM to spare
+PIN_HOST_MEMORY = os.environ.get('PIN_HOST_MEMORY', 'False').lower() == 'true'
+DISK_TIER_MB = int(os.environ.get('DISK_TIER_MB', 0))
+
+# Residency-aware routing: when auto-detected style scores differ by less than
+# ROUTING_MARGIN, a model that is already loaded (or loading) wins over a cold one
+RESIDENCY_ROUTING_ENABLED = os.environ.get('RESIDENCY_ROUTING_ENABLED', 'True').lower() == 'true'
+ROUTING_MARGIN = int(os.environ.get('ROUTING_MARGIN', 5))
+# Recent routing decisions kept for the status endpoint
+ROUTING_HISTORY_SIZE = int(os.environ.get('ROUTING_HISTORY_SIZE', 50))
+
+# Styles preloaded in the background at startup (comma separated, e.g. "realistic,dreamshaper")
+WARM_POOL_STYLES = [style for style in os.environ.get('WARM_POOL_STYLES', '').split(',') if style]
+# Pipeline components that may be shared between models when their weights are identical
+SHAREABLE_COMPONENTS = tuple(
+    os.environ.get('SHAREABLE_COMPONENTS', 'tokenizer,text_encoder,vae,feature_extractor').split(',')
+)
 
 # Model paths for local models
 MODEL_PATHS = {
@@ -28,6 +75,37 @@ IMAGE_SIZE = int(os.environ.get('IMAGE_SIZE', 1024))
 DEFAULT_INFERENCE_STEPS = int(os.environ.get('DEFAULT_INFERENCE_STEPS', 20))
 DEFAULT_GUIDANCE_SCALE = float(os.environ.get('DEFAULT_GUIDANCE_SCALE', 7.5))
 MAX_IMAGES_TO_KEEP = int(os.environ.get('MAX_IMAGES_TO_KEEP', 1000))
+# Byte budget for IMAGES_DIR enforced alongside MAX_IMAGES_TO_KEEP; 0 disables it
+MAX_IMAGES_MB = int(os.environ.get('MAX_IMAGES_MB', 0))
+
+# Output encoding: 'png', 'webp', 'jpeg' or 'avif' (needs pillow-avif-plugin);
+# encoding runs on its own pool and files are written in the background
+OUTPUT_FORMAT = os.environ.get('OUTPUT_FORMAT', 'png').lower()
+ENCODER_WORKERS = int(os.environ.get('ENCODER_WORKERS', 2))
+PNG_COMPRESS_LEVEL = int(os.environ.get('PNG_COMPRESS_LEVEL', 1))
+WEBP_QUALITY = int(os.environ.get('WEBP_QUALITY', 90))
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', 92))
+AVIF_QUALITY = int(os.environ.get('AVIF_QUALITY', 60))
+# format -> (file extension, mimetype, Pillow format, save options)
+OUTPUT_FORMATS = {
+    # zlib level 1 instead of optimize=True: several times faster, a little larger
+    'png': ('png', 'image/png', 'PNG', {'compress_level': PNG_COMPRESS_LEVEL}),
+    'webp': ('webp', 'image/webp', 'WEBP', {'quality': WEBP_QUALITY, 'method': 4}),
+    'jpeg': ('jpg', 'image/jpeg', 'JPEG', {'quality': JPEG_QUALITY, 'optimize': False}),
+    'avif': ('avif', 'image/avif', 'AVIF', {'quality': AVIF_QUALITY})
+}
+
+# Gallery derivatives: longest side in pixels per size name, served via /images/<filename>?size=<name>
+DERIVATIVE_SIZES = {
+    'thumb': int(os.environ.get('THUMBNAIL_SIZE', 256)),
+    'preview': int(os.environ.get('PREVIEW_SIZE', 768))
+}
+DERIVATIVES_DIR = os.environ.get('DERIVATIVES_DIR', os.path.join(IMAGES_DIR, 'derivatives'))
+DERIVATIVE_QUALITY = int(os.environ.get('DERIVATIVE_QUALITY', 80))
+# Make derivatives when an image is saved; otherwise they are made on first request
+DERIVATIVES_ON_SAVE = os.environ.get('DERIVATIVES_ON_SAVE', 'True').lower() == 'true'
+# Derivative filenames never change content, so browsers may cache them for long
+DERIVATIVE_MAX_AGE = int(os.environ.get('DERIVATIVE_MAX_AGE', 30 * 24 * 3600))
 
 # API settings
 MAX_FILE_SIZE = int(os.environ.get('MAX_FILE_SIZE', 25 * 1024 * 1024))  # 25MB
@@ -50,9 +128,60 @@ LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 
 # Performance settings
 GENERATION_TIMEOUT = int(os.environ.get('GENERATION_TIMEOUT', 300))  # 5 minutes
-CLEANUP_INTERVAL = int(os.environ.get('CLEANUP_INTERVAL', 3600))  # 1 hour
+CLEANUP_INTERVAL = int(os.environ.get('CLEANUP_INTERVAL', 3600))  # 1 hour; 0 disables scheduled image cleanup
 MEMORY_CHECK_INTERVAL = int(os.environ.get('MEMORY_CHECK_INTERVAL', 300))  # 5 minutes
 
+# Micro-batching settings for concurrent generation requests
+BATCHING_ENABLED = os.environ.get('BATCHING_ENABLED', 'True').lower() == 'true'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 4))
+BATCH_MAX_WAIT_MS = int(os.environ.get('BATCH_MAX_WAIT_MS', 50))
+
+# Inference worker pool: batches for different models run concurrently. On
+# CPU-only hosts each worker gets its share of the cores, so more than one only
+# pays off under concurrent load; a single request then runs on all cores
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 1))
+INFERENCE_THREADS_PER_WORKER = int(os.environ.get('INFERENCE_THREADS_PER_WORKER', 0))  # 0 = cpu_count / workers
+# Execution slots, e.g. "cuda:0,cuda:1" or "cpu:0-3,cpu:4-7"; empty = every GPU,
+# or INFERENCE_WORKERS CPU slots over the available cores (see device_pool.py)
+DEVICE_SLOTS = os.environ.get('DEVICE_SLOTS', '')
+
+# Offline batch generation (batch_generate / /api/generate/batch)
+BATCH_GENERATE_MAX_PROMPTS = int(os.environ.get('BATCH_GENERATE_MAX_PROMPTS', 500))
+BATCH_GENERATE_MAX_CHUNK = int(os.environ.get('BATCH_GENERATE_MAX_CHUNK', 8))
+BATCH_MEMORY_PER_IMAGE_MB = int(os.environ.get('BATCH_MEMORY_PER_IMAGE_MB', 1024))  # per 512x512 image
+# Batch jobs run batch_generate this many prompts at a time, reporting progress,
+# charging credits and checking for cancellation between chunks
+BATCH_JOB_CHUNK = int(os.environ.get('BATCH_JOB_CHUNK', 32))
+
+# Asynchronous generation jobs
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 32))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))  # 1 hour
+JOB_STREAM_KEEPALIVE = int(os.environ.get('JOB_STREAM_KEEPALIVE', 15))  # seconds
+
+# Live previews decoded from the latents during denoising (not the full VAE)
+PREVIEW_INTERVAL = int(os.environ.get('PREVIEW_INTERVAL', 5))  # steps between previews, 0 disables
+PREVIEW_MAX_SIZE = int(os.environ.get('PREVIEW_MAX_SIZE', 256))  # pixels, longest side
+PREVIEW_JPEG_QUALITY = int(os.environ.get('PREVIEW_JPEG_QUALITY', 60))
+
+# Draft-then-refine: a fast low-resolution draft whose final latents are kept,
+# then on request a latent upscale and a short img2img pass at the target size
+DRAFT_MAX_SIZE = int(os.environ.get('DRAFT_MAX_SIZE', 512))  # longest side of the draft
+DRAFT_SPEED_MODE = os.environ.get('DRAFT_SPEED_MODE', 'fast')
+REFINE_STRENGTH = float(os.environ.get('REFINE_STRENGTH', 0.4))  # fraction of the refine steps actually run
+DRAFT_STORE_SIZE = int(os.environ.get('DRAFT_STORE_SIZE', 64))
+DRAFT_TTL = int(os.environ.get('DRAFT_TTL', 3600))  # 1 hour
+
+# Generation mode: 'local' loads the models inside every web worker process;
+# 'remote' forwards generation to a single model server (model_server.py) so
+# the weights are held once per host however many web workers run
+GENERATION_MODE = os.environ.get('GENERATION_MODE', 'local').lower()
+MODEL_SERVER_ADDRESS = os.environ.get('MODEL_SERVER_ADDRESS', os.path.join(BASE_DIR, 'model_server.sock'))  # socket path or host:port
+# Connections carry pickled calls, so the key must be its own secret; the server refuses to start without one
+MODEL_SERVER_AUTHKEY = os.environ.get('MODEL_SERVER_AUTHKEY', '')
+# host:port addresses are refused unless explicitly allowed; the unix socket is only reachable by this user
+MODEL_SERVER_ALLOW_TCP = os.environ.get('MODEL_SERVER_ALLOW_TCP', 'False').lower() == 'true'
+
 # User settings
 DEFAULT_FREE_CREDITS = int(os.environ.get('DEFAULT_FREE_CREDITS', 25))
 DEFAULT_PRO_CREDITS = int(os.environ.get('DEFAULT_PRO_CREDITS', 100))
@@ -116,6 +245,13 @@ REALISTIC_KEYWORDS = {
     'composition': 3
 }
 
+# Extra score per style when any of its context words appears in the prompt
+STYLE_CONTEXT_BONUSES = {
+    'dreamshaper': (['anime', 'cartoon', 'manga', 'illustration'], 5),
+    'realistic_vision': (['photograph', 'photo', 'realistic', 'real'], 5)
+}
+STYLE_DETECTION_CACHE_SIZE = int(os.environ.get('STYLE_DETECTION_CACHE_SIZE', 4096))
+
 # Quality presets
 QUALITY_PRESETS = {
     'standard': {
@@ -141,6 +277,23 @@ QUALITY_PRESETS = {
     }
 }
 
+# Speed modes: faster multistep schedulers at lower step counts. The
+# scheduler is swapped on the loaded pipeline, reusing its UNet and VAE.
+SPEED_MODES = {
+    'turbo': {
+        'scheduler': 'dpmpp_2m_karras',
+        'steps': 8
+    },
+    'fast': {
+        'scheduler': 'unipc',
+        'steps': 12
+    },
+    'quality': {
+        'scheduler': 'default',
+        'steps': DEFAULT_INFERENCE_STEPS
+    }
+}
+
 # Negative prompt presets
 NEGATIVE_PROMPT_PRESETS = {
     'default': 'blurry, low quality, distorted, deformed, ugly, bad anatomy',
@@ -171,6 +324,7 @@ ERROR_MESSAGES = {
     'invalid_file_type': 'Invalid file type. Please upload: {allowed_types}',
     'file_too_large': 'File too large. Maximum allowed size is {max_size}MB',
     'generation_failed': 'Image generation failed. Please try again.',
+    'generation_cancelled': 'Image generation was cancelled.',
     'model_loading_error': 'Model loading failed. Please try again.',
     'invalid_prompt': 'Prompt is required and cannot be empty.',
     'rate_limit_exceeded': 'Rate limit exceeded. Please wait before making another request.',
@@ -199,6 +353,9 @@ CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 'http://localhost:3000,http://loca
 # Cache settings
 CACHE_ENABLED = os.environ.get('CACHE_ENABLED', 'True').lower() == 'true'
 CACHE_TIMEOUT = int(os.environ.get('CACHE_TIMEOUT', 3600))  # 1 hour
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 1000))
+RESULT_CACHE_MAX_MB = int(os.environ.get('RESULT_CACHE_MAX_MB', 2048))
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 256))  # prompts per model
 
 # Monitoring settings
 ENABLE_MONITORING = os.environ.get('ENABLE_MONITORING', 'True').lower() == 'true'
@@ -0,0 +1,250 @@
+"""
+Execution slots for inference and placement of models onto them
+
+A slot is one place a pipeline call can run: a GPU, or a set of CPU cores.
+GPU slots hold their own copy of the models placed on them, so different
+models are spread across GPUs. CPU slots share host-memory weights and only
+differ in the cores their calls are pinned to, so a model loaded once is
+resident on every CPU slot and requests for it run on several slots at once.
+Calls on a pinned CPU slot run on that slot's own worker thread, which is
+pinned once when it starts: request threads never change their affinity, and
+the OpenMP threads a worker spawns inherit its cores and keep them.
+
+Slots come from DEVICE_SLOTS, e.g. "cuda:0,cuda:1" or "cpu:0-3,cpu:4-7".
+When it is empty, every visible GPU becomes a slot, or without GPUs the
+available cores are split into INFERENCE_WORKERS CPU slots.
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from config import DEVICE_SLOTS, INFERENCE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionSlot:
+    """One device (or CPU core set) that runs one pipeline call at a time per model"""
+
+    def __init__(self, name, device, cores=None):
+        self.name = name
+        self.device = device
+        self.cores = tuple(cores) if cores else None
+        self.models = set()
+        self.active = 0
+        self.calls = 0
+        self._worker = None
+        self._worker_lock = threading.Lock()
+
+    @property
+    def is_cpu(self):
+        return self.device == 'cpu'
+
+    @property
+    def threads(self):
+        """Intra-op threads a call on this slot should use"""
+        return len(self.cores) if self.cores else (os.cpu_count() or 1)
+
+    @property
+    def pinned(self):
+        return bool(self.cores) and hasattr(os, 'sched_setaffinity')
+
+    def _pin_worker(self):
+        """Restrict the slot's worker thread (and the threads it spawns) to the slot's cores"""
+        try:
+            # pid 0 is the calling thread on Linux
+            os.sched_setaffinity(0, self.cores)
+        except OSError as e:
+            logger.warning(f"Could not pin slot {self.name} to cores {self.cores}: {e}")
+
+    def run(self, function, *args, **kwargs):
+        """Call function on this slot: on its pinned worker thread, or inline for unpinned slots"""
+        if not self.pinned:
+            return function(*args, **kwargs)
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"slot-{self.name}",
+                                                  initializer=self._pin_worker)
+        return self._worker.submit(function, *args, **kwargs).result()
+
+    def shutdown(self):
+        with self._worker_lock:
+            if self._worker is not None:
+                self._worker.shutdown(wait=False)
+                self._worker = None
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'device': self.device,
+            'cores': list(self.cores) if self.cores else None,
+            'models': sorted(self.models),
+            'active': self.active,
+            'calls': self.calls
+        }
+
+
+def available_cores():
+    """CPU ids this process may run on"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(count, cores=None):
+    """Split the available cores into `count` contiguous, near-equal sets"""
+    cores = available_cores() if cores is None else list(cores)
+    count = max(1, min(count, len(cores)))
+    size, extra = divmod(len(cores), count)
+    sets = []
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        sets.append(cores[start:end])
+        start = end
+    return sets
+
+
+def parse_core_range(text):
+    """'0-3+8' style core list -> [0, 1, 2, 3, 8]"""
+    cores = []
+    for part in text.split('+'):
+        if '-' in part:
+            first, last = part.split('-')
+            cores.extend(range(int(first), int(last) + 1))
+        elif part:
+            cores.append(int(part))
+    return cores
+
+
+def parse_slots(spec=DEVICE_SLOTS, cpu_slots=INFERENCE_WORKERS):
+    """Build the slot list from a DEVICE_SLOTS spec; an empty spec discovers slots
+
+    Entries are comma separated: "cuda:N" for a GPU, "cpu:A-B" (ranges may be
+    joined with '+', e.g. "cpu:0-3+8-11") for a pinned CPU slot, or plain
+    "cpu" for an unpinned one.
+    """
+    entries = [entry.strip() for entry in spec.split(',') if entry.strip()]
+    if not entries:
+        import torch
+
+        if torch.cuda.is_available():
+            return [ExecutionSlot(f"cuda:{index}", f"cuda:{index}") for index in range(torch.cuda.device_count())]
+        return [ExecutionSlot(f"cpu:{index}", 'cpu', cores)
+                for index, cores in enumerate(split_cores(cpu_slots))]
+
+    slots = []
+    for index, entry in enumerate(entries):
+        if entry.startswith('cpu'):
+            _, _, cores = entry.partition(':')
+            slots.append(ExecutionSlot(f"cpu:{index}", 'cpu', parse_core_range(cores) if cores else None))
+        else:
+            slots.append(ExecutionSlot(entry, entry))
+    return slots
+
+
+def default_device():
+    """Device of the first configured slot, for callers outside a DevicePool"""
+    return parse_slots()[0].device
+
+
+class DevicePool:
+    """Places models on execution slots and routes calls to the least-loaded one"""
+
+    def __init__(self, slots=None):
+        self.slots = slots if slots is not None else parse_slots()
+        if not self.slots:
+            raise ValueError("DevicePool needs at least one execution slot")
+        self.lock = threading.Lock()
+        self.stats = {
+            'placements': 0,
+            'calls_routed': 0
+        }
+        logger.info(f"Execution slots: {', '.join(slot.name for slot in self.slots)}")
+
+    @property
+    def cpu_only(self):
+        return all(slot.is_cpu for slot in self.slots)
+
+    def place(self, style):
+        """Choose the slot a model is loaded onto (its home) and record its residency"""
+        with self.lock:
+            home = self._home_slot(style)
+            if home is not None:
+                return home
+
+            accelerators = [slot for slot in self.slots if not slot.is_cpu]
+            if accelerators:
+                # Spread models over accelerators: fewest resident models, then least busy
+                home = min(accelerators, key=lambda slot: (len(slot.models), slot.active))
+                home.models.add(style)
+            else:
+                # Host-memory weights are usable from every CPU slot
+                home = self.slots[0]
+                for slot in self.slots:
+                    slot.models.add(style)
+            self.stats['placements'] += 1
+            logger.info(f"Placed {style} on {home.name}")
+            return home
+
+    def evict(self, style):
+        """Forget a model's residency after it is unloaded"""
+        with self.lock:
+            for slot in self.slots:
+                slot.models.discard(style)
+
+    def home_slot(self, style):
+        """Slot a model was loaded onto, or None if it is not placed"""
+        with self.lock:
+            return self._home_slot(style)
+
+    def _home_slot(self, style):
+        for slot in self.slots:
+            if style in slot.models:
+                return slot
+        return None
+
+    def capacity(self, style):
+        """How many calls for a model may run at the same time"""
+        with self.lock:
+            return max(1, sum(1 for slot in self.slots if style in slot.models))
+
+    def acquire(self, style):
+        """Reserve the least-loaded slot holding `style` for one call; pair with release()"""
+        with self.lock:
+            holders = [slot for slot in self.slots if style in slot.models]
+            if not holders:
+                raise RuntimeError(f"Model {style} is not placed on any execution slot")
+            slot = min(holders, key=lambda slot: (slot.active, slot.calls))
+            slot.active += 1
+            slot.calls += 1
+            self.stats['calls_routed'] += 1
+            return slot
+
+    def release(self, slot):
+        """Return a slot reserved by acquire()"""
+        with self.lock:
+            slot.active -= 1
+
+    @contextmanager
+    def use(self, style):
+        """Context manager form of acquire()/release()"""
+        slot = self.acquire(style)
+        try:
+            yield slot
+        finally:
+            self.release(slot)
+
+    def shutdown(self):
+        for slot in self.slots:
+            slot.shutdown()
+
+    def get_status(self):
+        """Slot occupancy for status endpoints"""
+        with self.lock:
+            return {
+                **self.stats,
+                'slots': [slot.to_dict() for slot in self.slots]
+            }
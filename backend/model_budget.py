@@ -0,0 +1,350 @@
+"""
+Byte-based memory budget for loaded models and cost-aware eviction policies
+
+Loaded models are charged for the bytes of their tensors, counting modules
+shared between models (see model_loader.ComponentRegistry) once, against the
+budget of the device holding them: each GPU has its own, and CPU slots share
+one for host memory. Before a load starts, ModelBudget picks victims on the
+target device until the estimated size of the new model fits; if it cannot
+fit even with every other model evicted the load is refused instead of
+running into an out-of-memory error halfway through.
+"""
+
+import os
+import re
+import json
+import math
+import struct
+from config import (MODEL_PATHS, MAX_MODELS_IN_MEMORY, MODEL_TIMEOUT, MODEL_MEMORY_BUDGET_MB,
+                    MODEL_MEMORY_BUDGET_FRACTION, EVICTION_POLICY, IDLE_SECONDS_PER_RELOAD_SECOND)
+
+# Pipeline modules holding nearly all of a model's bytes
+TENSOR_COMPONENTS = ('unet', 'vae', 'text_encoder')
+
+# Bytes per element of safetensors dtypes
+SAFETENSORS_DTYPE_BYTES = {'F64': 8, 'F32': 4, 'F16': 2, 'BF16': 2, 'I64': 8, 'I32': 4, 'I16': 2, 'I8': 1, 'U8': 1, 'BOOL': 1}
+
+
+class ModelBudgetExceeded(Exception):
+    """A model cannot fit in the memory budget even after evicting every other model"""
+
+
+def pipeline_tensors(pipe):
+    """(device, data_ptr) -> bytes of every parameter and buffer in a pipeline's torch modules"""
+    tensors = {}
+    for component in TENSOR_COMPONENTS:
+        module = getattr(pipe, component, None)
+        if module is None or not hasattr(module, 'parameters'):
+            continue
+        for tensor in list(module.parameters()) + list(module.buffers()):
+            if not tensor.is_meta:
+                tensors[(str(tensor.device), tensor.data_ptr())] = tensor.nelement() * tensor.element_size()
+    return tensors
+
+
+def safetensors_bytes(path, element_bytes=None):
+    """Bytes of the tensors in a safetensors file, read from its header; optionally re-typed to element_bytes"""
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    total = 0
+    for name, info in header.items():
+        if name == '__metadata__':
+            continue
+        elements = math.prod(info['shape'])
+        total += elements * (element_bytes or SAFETENSORS_DTYPE_BYTES.get(info['dtype'], 4))
+    return total
+
+
+# Sharded checkpoints end in -00001-of-00003 before the extension
+SHARD_SUFFIX = re.compile(r'-\d+-of-\d+$')
+
+
+def _split_weight_name(name):
+    """(variant or None, extension) of a weight file name such as unet.fp16-00001-of-00002.safetensors"""
+    stem, extension = os.path.splitext(name)
+    stem = SHARD_SUFFIX.sub('', stem)
+    return (stem.rsplit('.', 1)[1] if '.' in stem else None), extension
+
+
+def weight_files(component_dir, variant=None):
+    """
+    The weight files from_pretrained loads from a component directory.
+    Repos often ship the same weights several times (.bin, .safetensors,
+    .fp16.*): only the requested variant (or the plain files when it is
+    missing) counts, and safetensors win over .bin.
+    """
+    files = {}
+    for name in os.listdir(component_dir):
+        file_variant, extension = _split_weight_name(name)
+        if extension in ('.safetensors', '.bin'):
+            files.setdefault((file_variant, extension), []).append(name)
+    for candidate in dict.fromkeys((variant, None)):
+        for extension in ('.safetensors', '.bin'):
+            if (candidate, extension) in files:
+                return candidate, extension, files[(candidate, extension)]
+    return None, None, []
+
+
+def estimate_from_disk(model_key, element_bytes, variant=None):
+    """Expected in-memory bytes of a model never loaded in this process, from the weight files it loads"""
+    model_path = MODEL_PATHS.get(model_key)
+    if model_path is None:
+        return 0
+    total = 0
+    for component in TENSOR_COMPONENTS:
+        component_dir = os.path.join(model_path, component)
+        if not os.path.isdir(component_dir):
+            continue
+        found_variant, extension, names = weight_files(component_dir, variant)
+        for name in names:
+            file_path = os.path.join(component_dir, name)
+            if extension == '.safetensors':
+                total += safetensors_bytes(file_path, element_bytes)
+            else:
+                # Pickled checkpoints have no cheap header; assume fp32 unless they are the fp16 variant
+                stored_bytes = 2 if found_variant == 'fp16' else 4
+                total += os.path.getsize(file_path) * element_bytes // stored_bytes
+    return total
+
+
+def device_key(device):
+    """Device name as torch prints it for tensors: 'cuda' is 'cuda:0'"""
+    device = str(device)
+    return device if device == 'cpu' or ':' in device else f"{device}:0"
+
+
+def default_budget(device):
+    """MODEL_MEMORY_BUDGET_FRACTION of one device's memory; every CPU slot shares the host memory"""
+    if device.startswith('cuda'):
+        import torch
+        total = torch.cuda.get_device_properties(torch.device(device)).total_memory
+    else:
+        import psutil
+        total = psutil.virtual_memory().total
+    return int(total * MODEL_MEMORY_BUDGET_FRACTION)
+
+
+class LRUPolicy:
+    """Evicts the least recently requested model"""
+
+    name = 'lru'
+
+    def __init__(self):
+        self.clock = 0
+        self.last_used = {}
+
+    def admit(self, key, size, cost):
+        self.hit(key)
+
+    def hit(self, key):
+        self.clock += 1
+        self.last_used[key] = self.clock
+
+    def victim(self, candidates):
+        return min(candidates, key=lambda key: self.last_used.get(key, 0))
+
+    def evict(self, key):
+        self.last_used.pop(key, None)
+
+    def priority(self, key):
+        return self.last_used.get(key, 0)
+
+
+class GreedyDualSizePolicy:
+    """GreedyDual-Size with frequency (GDSF)
+
+    Each resident model gets priority L + frequency * reload_seconds / size_gb
+    and the lowest priority is evicted. L rises to the priority of every
+    victim, so models that stop being requested age out even if they were
+    expensive, while cheap, big, rarely used models go first. Request counts
+    survive eviction (there are only a handful of models), which in trace
+    replay cut reload seconds well below resetting them on every load.
+    """
+
+    name = 'gds'
+
+    def __init__(self):
+        self.inflation = 0.0
+        self.priorities = {}
+        self.frequency = {}
+        self.cost = {}
+        self.size = {}
+
+    def admit(self, key, size, cost):
+        self.size[key] = max(size, 1) / 1024 ** 3
+        self.cost[key] = max(cost, 0.001)
+        self._count(key)
+
+    def hit(self, key):
+        if key in self.priorities:
+            self._count(key)
+
+    def _count(self, key):
+        self.frequency[key] = self.frequency.get(key, 0) + 1
+        self.priorities[key] = self.inflation + self.frequency[key] * self.cost[key] / self.size[key]
+
+    def victim(self, candidates):
+        return min(candidates, key=lambda key: self.priorities.get(key, 0.0))
+
+    def evict(self, key):
+        self.inflation = max(self.inflation, self.priorities.pop(key, 0.0))
+
+    def priority(self, key):
+        return self.priorities.get(key, 0.0)
+
+
+POLICIES = {
+    'lru': LRUPolicy,
+    'gds': GreedyDualSizePolicy
+}
+
+
+class ModelBudget:
+    """Admission and eviction of models under per-device byte budgets and MAX_MODELS_IN_MEMORY
+
+    Sizes and reload times are measured on every load and reused for the
+    next admission of the same model; a model never loaded before is
+    estimated from its weight files. budget_bytes (or MODEL_MEMORY_BUDGET_MB)
+    applies to every device; without it each device gets
+    MODEL_MEMORY_BUDGET_FRACTION of its memory. Not thread-safe: ImageService
+    calls it under its generation lock.
+    """
+
+    def __init__(self, budget_bytes=None, policy=EVICTION_POLICY, max_models=MAX_MODELS_IN_MEMORY, devices=('cpu',)):
+        if budget_bytes is None:
+            budget_bytes = MODEL_MEMORY_BUDGET_MB * 1024 * 1024
+        self.budget_bytes = budget_bytes
+        self.budgets = {}
+        for device in devices:
+            self.budget(device)
+        self.policy = POLICIES[policy]()
+        self.max_models = max_models
+        # Device each resident model was admitted to
+        self.devices = {}
+        # Measured on the last load of each model
+        self.sizes = {}
+        self.reload_seconds = {}
+        self.requests = {}
+        self.stats = {
+            'admissions': 0,
+            'rejections': 0,
+            'evictions': 0,
+            'evicted_bytes': 0,
+            'reload_seconds_total': 0.0
+        }
+
+    def estimate(self, style, model_key, element_bytes=4):
+        """Expected bytes of loading `style`, from the last load or from disk"""
+        if style in self.sizes:
+            return self.sizes[style]
+        # model_loader asks for the fp16 variant exactly when it loads in half precision
+        return estimate_from_disk(model_key, element_bytes, 'fp16' if element_bytes == 2 else None)
+
+    def budget(self, device):
+        """Byte budget of one device"""
+        device = device_key(device)
+        if device not in self.budgets:
+            self.budgets[device] = self.budget_bytes or default_budget(device)
+        return self.budgets[device]
+
+    def resident_bytes(self, resident, device=None):
+        """Bytes held by a {style: pipe} mapping, on one device or all of them, shared tensors counted once"""
+        tensors = {}
+        untracked = 0
+        for style, pipe in resident.items():
+            found = pipeline_tensors(pipe)
+            if found:
+                tensors.update(found)
+            elif device is None or self.devices.get(style) == device:
+                # ONNX Runtime sessions hold their weights outside torch
+                untracked += self.sizes.get(style, 0)
+        return sum(size for (tensor_device, _), size in tensors.items()
+                   if device is None or tensor_device == device) + untracked
+
+    def plan_admission(self, style, estimate, resident, device='cpu', busy=()):
+        """
+        Styles to evict, in order, so `style` fits on `device` next to the
+        remaining resident models. Models on other devices are only evicted
+        to stay within MAX_MODELS_IN_MEMORY, and styles in `busy` only once
+        no idle model is left to evict. Raises ModelBudgetExceeded when it
+        cannot fit at all.
+        """
+        device = device_key(device)
+        budget = self.budget(device)
+        remaining = {key: pipe for key, pipe in resident.items() if key != style}
+        victims = []
+        while remaining:
+            over_count = len(remaining) >= self.max_models
+            if not over_count and self.resident_bytes(remaining, device) + estimate <= budget:
+                break
+            # Only models holding memory on the target device make room there
+            candidates = list(remaining) if over_count else [
+                key for key in remaining if self.resident_bytes({key: remaining[key]}, device)]
+            if not candidates:
+                break
+            idle = [key for key in candidates if key not in busy]
+            victim = self.policy.victim(idle or candidates)
+            victims.append(victim)
+            del remaining[victim]
+
+        if self.resident_bytes(remaining, device) + estimate > budget:
+            self.stats['rejections'] += 1
+            raise ModelBudgetExceeded(
+                f"{style} needs about {estimate / 1024 ** 2:.0f} MB, more than the "
+                f"{budget / 1024 ** 2:.0f} MB model memory budget of {device}")
+        self.stats['admissions'] += 1
+        return victims
+
+    def loaded(self, style, pipe, load_seconds, estimate=0, device='cpu'):
+        """Record the measured size and reload cost of a freshly loaded model"""
+        self.devices[style] = device_key(device)
+        # Pipelines without torch modules (ONNX) keep their estimate
+        size = self.resident_bytes({style: pipe}) or self.sizes.get(style, estimate)
+        self.sizes[style] = size
+        self.reload_seconds[style] = load_seconds
+        self.requests[style] = 0
+        self.stats['reload_seconds_total'] += load_seconds
+        self.policy.admit(style, size, load_seconds)
+
+    def hit(self, style):
+        self.requests[style] = self.requests.get(style, 0) + 1
+        self.policy.hit(style)
+
+    def evicted(self, style):
+        self.stats['evictions'] += 1
+        self.stats['evicted_bytes'] += self.sizes.get(style, 0)
+        self.requests.pop(style, None)
+        self.devices.pop(style, None)
+        self.policy.evict(style)
+
+    def idle_timeout(self, style):
+        """MODEL_TIMEOUT stretched for models that are requested often or slow to reload"""
+        requests = self.requests.get(style, 0)
+        return (MODEL_TIMEOUT * (1 + math.log2(1 + requests))
+                + IDLE_SECONDS_PER_RELOAD_SECOND * self.reload_seconds.get(style, 0))
+
+    def get_status(self, resident):
+        return {
+            **self.stats,
+            'policy': self.policy.name,
+            'devices': {
+                device: {
+                    'budget_mb': round(budget / 1024 ** 2),
+                    'used_mb': round(self.resident_bytes(resident, device) / 1024 ** 2)
+                }
+                for device, budget in self.budgets.items()
+            },
+            'max_models': self.max_models,
+            'models': {
+                style: {
+                    'device': self.devices.get(style),
+                    'size_mb': round(self.sizes.get(style, 0) / 1024 ** 2),
+                    'reload_seconds': round(self.reload_seconds.get(style, 0), 2),
+                    'requests': self.requests.get(style, 0),
+                    'priority': round(self.policy.priority(style), 3),
+                    'idle_timeout': round(self.idle_timeout(style))
+                }
+                for style in resident
+            }
+        }
@@ -1,45 +1,259 @@
-from diffusers import StableDiffusionPipeline
+from diffusers import StableDiffusionPipeline, DPMSolverMultistepScheduler, UniPCMultistepScheduler, EulerAncestralDiscreteScheduler
 import torch
 import os
 import gc
-from config import MODEL_PATHS
+import hashlib
+import threading
+import onnx_backend
+import device_pool
+import model_snapshot
+from config import (MODEL_PATHS, SHAREABLE_COMPONENTS, INFERENCE_BACKEND, MODEL_LOAD_MODE, QUANTIZED_COMPONENTS,
+                    FAST_LOAD_ENABLED)
 
-def load_model(selected_style):
-    # Change device selection to use GPU 1 if available
-    # device = "cuda" if torch.cuda.is_available() else "cpu"
-    device = "cuda:1" if torch.cuda.device_count() > 1 else ("cuda" if torch.cuda.is_available() else "cpu")
+try:
+    # Built for the UNet's projections unless peft is installed; gone from newer diffusers
+    from diffusers.models.lora import LoRACompatibleLinear
+except ImportError:
+    LoRACompatibleLinear = None
+
+
+class ComponentRegistry:
+    """Reference-counted pool of pipeline submodules shared across models
+
+    Components are identified by a fingerprint of their files on disk plus
+    the dtype and device they were loaded with, so two checkpoints that ship
+    byte-identical tokenizers, text encoders or VAEs end up holding a single
+    in-memory copy.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.file_hashes = {}
+        self.lock = threading.Lock()
+
+    def fingerprint(self, model_path, component, tag):
+        """Fingerprint a component directory, or None if it does not exist"""
+        component_dir = os.path.join(model_path, component)
+        if not os.path.isdir(component_dir):
+            return None
+
+        digest = hashlib.sha256(f"{component}|{tag}".encode())
+        for name in sorted(os.listdir(component_dir)):
+            file_path = os.path.join(component_dir, name)
+            if os.path.isfile(file_path):
+                digest.update(name.encode())
+                digest.update(self._file_hash(file_path).encode())
+        return digest.hexdigest()
+
+    def _file_hash(self, file_path):
+        """sha256 of a file, memoized on (path, size, mtime)"""
+        stat = os.stat(file_path)
+        memo_key = (file_path, stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self.file_hashes:
+            digest = hashlib.sha256()
+            with open(file_path, 'rb') as handle:
+                for chunk in iter(lambda: handle.read(8 * 1024 * 1024), b''):
+                    digest.update(chunk)
+            self.file_hashes[memo_key] = digest.hexdigest()
+        return self.file_hashes[memo_key]
+
+    def acquire(self, fingerprint):
+        """Take a reference to an already loaded component, or return None"""
+        with self.lock:
+            entry = self.entries.get(fingerprint)
+            if entry is None:
+                return None
+            entry['refs'] += 1
+            return entry['module']
+
+    def register(self, fingerprint, module):
+        """Record a freshly loaded component with one reference"""
+        with self.lock:
+            self.entries[fingerprint] = {'module': module, 'refs': 1}
+
+    def release(self, fingerprint):
+        """Drop one reference; returns True when nobody else uses the component"""
+        with self.lock:
+            entry = self.entries.get(fingerprint)
+            if entry is None:
+                return True
+            entry['refs'] -= 1
+            if entry['refs'] > 0:
+                return False
+            del self.entries[fingerprint]
+            return True
+
+    def get_stats(self):
+        """Number of pooled components and how many extra copies they save"""
+        with self.lock:
+            return {
+                'components': len(self.entries),
+                'shared_references': sum(entry['refs'] - 1 for entry in self.entries.values())
+            }
+
+
+component_registry = ComponentRegistry()
+
+class DynamicQuantizedLoRALinear(torch.ao.nn.quantized.dynamic.Linear):
+    """Dynamic int8 Linear standing in for diffusers' LoRACompatibleLinear
+
+    Without peft, diffusers builds the UNet's attention and feed-forward
+    projections as LoRACompatibleLinear, which quantize_dynamic skips (it
+    matches exact types) and which its callers pass an extra LoRA `scale`.
+    Only layers without a LoRA attached are converted, so the scale is unused.
+    """
+
+    def forward(self, x, scale=1.0):
+        return super().forward(x)
+
+    @classmethod
+    def from_float(cls, mod, *args, **kwargs):
+        # The base class only accepts plain nn.Linear; hand it one sharing the weights
+        linear = torch.nn.Linear(mod.in_features, mod.out_features, bias=mod.bias is not None, device='meta')
+        linear.weight = mod.weight
+        linear.bias = mod.bias
+        linear.qconfig = mod.qconfig
+        return super().from_float(linear, *args, **kwargs)
+
+
+# Float module type -> its dynamic int8 replacement
+DYNAMIC_QUANTIZATION_MAPPING = {torch.nn.Linear: torch.ao.nn.quantized.dynamic.Linear}
+if LoRACompatibleLinear is not None:
+    DYNAMIC_QUANTIZATION_MAPPING[LoRACompatibleLinear] = DynamicQuantizedLoRALinear
+
+
+def count_linear_layers(module):
+    """(int8 dynamic, float) Linear layers in a module"""
+    quantized = linear = 0
+    for child in module.modules():
+        if isinstance(child, torch.ao.nn.quantized.dynamic.Linear):
+            quantized += 1
+        elif isinstance(child, torch.nn.Linear):
+            linear += 1
+    return quantized, linear
+
+
+def quantize_components(pipe, components=QUANTIZED_COMPONENTS):
+    """
+    Apply dynamic int8 quantization to the Linear layers of the given
+    components in place; returns {component: layers converted}
+    """
+    converted = {}
+    for component in components:
+        module = getattr(pipe, component, None)
+        if not isinstance(module, torch.nn.Module):
+            continue
+        # Selected by name: a Linear carrying LoRA weights keeps its float path
+        targets = {
+            name: torch.ao.quantization.default_dynamic_qconfig
+            for name, child in module.named_modules()
+            if type(child) in DYNAMIC_QUANTIZATION_MAPPING and getattr(child, 'lora_layer', None) is None
+        }
+        before = count_linear_layers(module)[0]
+        torch.ao.quantization.quantize_dynamic(module, targets, dtype=torch.qint8,
+                                               mapping=DYNAMIC_QUANTIZATION_MAPPING, inplace=True)
+        converted[component] = count_linear_layers(module)[0] - before
+    return converted
+
+def load_model(selected_style, backend=INFERENCE_BACKEND, mode=MODEL_LOAD_MODE, device=None, fast_load=FAST_LOAD_ENABLED):
+    if backend == 'onnx':
+        if onnx_backend.is_available():
+            print(f"🔄 Loading {selected_style} model with ONNX Runtime...")
+            pipe = onnx_backend.load_model(selected_style)
+            print(f"✅ {selected_style.upper()} ONNX model loaded successfully!")
+            return pipe
+        print("⚠️ ONNX backend requested but optimum[onnxruntime] is not installed, using PyTorch")
+
+    # The service passes the execution slot chosen by its DevicePool
+    device = device or device_pool.default_device()
+    is_cuda = device.startswith("cuda")
     print(f"🔄 Loading {selected_style} model from local path...")
     print(f"📂 Path: {MODEL_PATHS[selected_style]}")
     print(f"Using device: {device}")
-    # Force garbage collection before loading
-    gc.collect()
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
     
-    # Load with memory optimizations
-    pipe = StableDiffusionPipeline.from_pretrained(
-        MODEL_PATHS[selected_style],
-        torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-        safety_checker=None,
-        requires_safety_checker=False,
-        low_cpu_mem_usage=True,  # Reduce CPU memory usage during loading
-        variant="fp16" if device == "cuda" else None  # Use fp16 variant for GPU
-    )
+    dtype = torch.float16 if is_cuda else torch.float32
+
+    # Dynamic int8 kernels only exist for CPU
+    if mode == 'quantized' and device != "cpu":
+        print(f"⚠️ Quantized mode is CPU only, loading {selected_style} unquantized on {device}")
+        mode = 'default'
+
+    # Reuse identical components already loaded for another model
+    fingerprints = {}
+    shared = {}
+    for component in SHAREABLE_COMPONENTS:
+        fingerprint = component_registry.fingerprint(MODEL_PATHS[selected_style], component, f"{dtype}|{device}|{mode}")
+        if fingerprint is None:
+            continue
+        fingerprints[component] = fingerprint
+        module = component_registry.acquire(fingerprint)
+        if module is not None:
+            shared[component] = module
+    if shared:
+        print(f"♻️ Reusing shared components: {', '.join(shared)}")
+    
+    try:
+        pipe = None
+        if fast_load:
+            try:
+                if model_snapshot.has_snapshot(selected_style, dtype, MODEL_PATHS[selected_style]):
+                    pipe = model_snapshot.load_snapshot(selected_style, dtype, shared)
+                    print(f"⚡ Loaded {selected_style} from fast-load snapshot")
+            except Exception as e:
+                print(f"⚠️ Fast-load snapshot unusable, falling back to from_pretrained: {e}")
+
+        if pipe is None:
+            # Force garbage collection before a full load
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+            # Load with memory optimizations
+            pipe = StableDiffusionPipeline.from_pretrained(
+                MODEL_PATHS[selected_style],
+                torch_dtype=dtype,
+                safety_checker=None,
+                requires_safety_checker=False,
+                low_cpu_mem_usage=True,  # Reduce CPU memory usage during loading
+                variant="fp16" if is_cuda else None,  # Use fp16 variant for GPU
+                **shared
+            )
+            # Shared components may already be quantized, which a float snapshot cannot hold
+            if fast_load and not (mode == 'quantized' and set(shared) & set(QUANTIZED_COMPONENTS)):
+                try:
+                    print(f"💾 Fast-load snapshot written: {model_snapshot.save_snapshot(pipe, selected_style, dtype, MODEL_PATHS[selected_style])}")
+                except Exception as e:
+                    print(f"⚠️ Could not write fast-load snapshot: {e}")
+    except Exception:
+        for component in shared:
+            component_registry.release(fingerprints[component])
+        raise
     
     pipe = pipe.to(device)
+
+    if mode == 'quantized':
+        # Shared components were quantized when first loaded
+        converted = quantize_components(pipe, [component for component in QUANTIZED_COMPONENTS if component not in shared])
+        print(f"🗜️ Applied dynamic int8 quantization: "
+              f"{', '.join(f'{component} ({count} Linear layers)' for component, count in converted.items())}")
+
+    for component, fingerprint in fingerprints.items():
+        if component not in shared:
+            component_registry.register(fingerprint, getattr(pipe, component))
+    pipe.component_fingerprints = fingerprints
     
     # Enable memory optimizations (use only compatible ones)
     pipe.enable_attention_slicing()
     
     # Additional optimizations for lower memory usage
-    if device == "cuda":
+    if is_cuda:
         pipe.enable_vae_slicing()  # Slice VAE for lower memory usage
         # Don't use CPU offload as it causes meta tensor issues
     
     print(f"✅ {selected_style.upper()} model loaded successfully!")
-    if device == "cuda":
-        print(f"💾 Current VRAM usage: {torch.cuda.memory_allocated() / 1024**3:.2f} GB")
-        print(f"💾 VRAM reserved: {torch.cuda.memory_reserved() / 1024**3:.2f} GB")
+    if is_cuda:
+        print(f"💾 Current VRAM usage: {torch.cuda.memory_allocated(device) / 1024**3:.2f} GB")
+        print(f"💾 VRAM reserved: {torch.cuda.memory_reserved(device) / 1024**3:.2f} GB")
     
     return pipe
 
@@ -47,8 +261,13 @@ def unload_model(pipe):
     """Safely unload a model to free memory"""
     if pipe is not None:
         try:
-            # Move to CPU first
-            pipe = pipe.to("cpu")
+            # Move components to CPU first, leaving ones another model still shares
+            fingerprints = getattr(pipe, 'component_fingerprints', {})
+            for component, module in getattr(pipe, 'components', {}).items():
+                if component in fingerprints and not component_registry.release(fingerprints[component]):
+                    continue
+                if isinstance(module, torch.nn.Module):
+                    module.to("cpu")
             # Delete the pipeline
             del pipe
             # Force garbage collection
@@ -59,6 +278,32 @@ def unload_model(pipe):
         except Exception as e:
             print(f"⚠️ Error unloading model: {e}")
 
+# Samplers selectable per request; 'default' keeps the checkpoint's own scheduler
+SCHEDULER_FACTORIES = {
+    'dpmpp_2m': lambda config: DPMSolverMultistepScheduler.from_config(config, algorithm_type="dpmsolver++"),
+    'dpmpp_2m_karras': lambda config: DPMSolverMultistepScheduler.from_config(
+        config, algorithm_type="dpmsolver++", use_karras_sigmas=True),
+    'unipc': lambda config: UniPCMultistepScheduler.from_config(config),
+    'euler_a': lambda config: EulerAncestralDiscreteScheduler.from_config(config)
+}
+
+def with_scheduler(pipe, scheduler_name, private=False):
+    """Return a pipeline sharing all of pipe's modules but sampling with another scheduler
+
+    With private=True even the default scheduler is a fresh instance, so the
+    returned pipeline can run at the same time as pipe.
+    """
+    if scheduler_name == 'default':
+        if not private:
+            return pipe
+        scheduler = type(pipe.scheduler).from_config(pipe.scheduler.config)
+    else:
+        scheduler = SCHEDULER_FACTORIES[scheduler_name](pipe.scheduler.config)
+    if onnx_backend.is_onnx_pipeline(pipe):
+        return onnx_backend.with_scheduler(pipe, scheduler)
+    components = {**pipe.components, 'scheduler': scheduler}
+    return type(pipe)(**components, requires_safety_checker=False)
+
 # Example usage:
 # pipe = load_model("dreamshaper")
 # unload_model(pipe) 
\ No newline at end of file
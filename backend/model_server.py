@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Model server: one process that holds the model weights for every web worker
+
+Web workers started with GENERATION_MODE=remote build a RemoteImageService
+instead of loading models themselves and send their generation calls here
+over MODEL_SERVER_ADDRESS. Memory for the weights is then paid once per host
+rather than once per worker process. Start it before the web workers, with
+the same MODEL_SERVER_AUTHKEY (a secret of its own) set for both:
+
+    MODEL_SERVER_AUTHKEY=... python model_server.py
+
+Calls arrive pickled, so the server listens on an owner-only unix socket;
+a host:port address also needs MODEL_SERVER_ALLOW_TCP=true.
+"""
+
+import os
+import sys
+import stat
+import logging
+import threading
+from multiprocessing.connection import Listener
+from config import MODEL_SERVER_ADDRESS, MODEL_SERVER_AUTHKEY
+from services.image_service import ImageService
+from services.remote_image_service import model_server_address, model_server_authkey, ModelServerError
+
+logger = logging.getLogger(__name__)
+
+
+class ModelServer:
+    """Serves ImageService calls from RemoteImageService clients"""
+
+    # Methods clients may call; 'cancel' is handled by the server itself
+    EXPOSED_METHODS = (
+        'generate_image',
+        'schedule_generation',
+        'batch_generate',
+        'refine_draft',
+        'get_pending_image',
+        'get_memory_usage',
+        'get_service_status',
+        'get_metrics',
+        'start_warm_pool'
+    )
+
+    def __init__(self, image_service, address=MODEL_SERVER_ADDRESS, authkey=MODEL_SERVER_AUTHKEY):
+        self.image_service = image_service
+        self.address, self.family = model_server_address(address)
+        self.authkey = model_server_authkey(authkey)
+        # call id -> cancel event of generations still running
+        self.running_calls = {}
+        self.calls_lock = threading.Lock()
+
+    def serve_forever(self):
+        """Accept client connections and serve each on its own thread"""
+        if self.family == 'AF_UNIX' and os.path.exists(self.address) and stat.S_ISSOCK(os.stat(self.address).st_mode):
+            # Left behind by a server that did not shut down cleanly
+            os.unlink(self.address)
+
+        # The socket is created owner-only, with no window where other users can connect
+        umask = os.umask(0o177)
+        try:
+            listener = Listener(self.address, family=self.family, authkey=self.authkey)
+        finally:
+            os.umask(umask)
+        with listener:
+            if self.family == 'AF_UNIX':
+                os.chmod(self.address, 0o600)
+            logger.info(f"Model server listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # Failed handshakes (wrong authkey) must not stop the server
+                    logger.warning(f"Rejected model server connection: {e}")
+                    continue
+                threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def _serve_connection(self, conn):
+        """Run calls arriving on one client connection until the client goes away"""
+        send_lock = threading.Lock()
+
+        def send(message):
+            with send_lock:
+                conn.send(message)
+
+        try:
+            while True:
+                try:
+                    _, call_id, method, args, kwargs, stream = conn.recv()
+                except EOFError:
+                    return
+                send(self._handle_call(send, call_id, method, args, kwargs, stream))
+        except Exception as e:
+            logger.error(f"Model server connection failed: {e}")
+        finally:
+            conn.close()
+
+    def _handle_call(self, send, call_id, method, args, kwargs, stream):
+        """Execute one call and return the ('result' | 'error', ...) reply"""
+        if method == 'cancel':
+            return ('result', self._cancel(*args))
+        if method not in self.EXPOSED_METHODS:
+            return ('error', f"Unknown method: {method}")
+
+        if stream.get('progress'):
+            kwargs['progress_callback'] = lambda step, total_steps: send(('progress', step, total_steps))
+        if stream.get('preview'):
+            kwargs['preview_callback'] = lambda step, jpeg_bytes: send(('preview', step, jpeg_bytes))
+
+        cancel_event = None
+        if method in ('generate_image', 'schedule_generation'):
+            cancel_event = threading.Event()
+            kwargs['cancel_event'] = cancel_event
+            with self.calls_lock:
+                self.running_calls[call_id] = cancel_event
+
+        try:
+            return ('result', getattr(self.image_service, method)(*args, **kwargs))
+        except Exception as e:
+            logger.error(f"Model server call {method} failed: {e}")
+            return ('error', str(e))
+        finally:
+            if cancel_event is not None:
+                with self.calls_lock:
+                    self.running_calls.pop(call_id, None)
+
+    def _cancel(self, call_id):
+        """Set the cancel event of a running call; False if it already finished"""
+        with self.calls_lock:
+            cancel_event = self.running_calls.get(call_id)
+        if cancel_event is None:
+            return False
+        cancel_event.set()
+        return True
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    try:
+        model_server_address()
+        model_server_authkey()
+    except ModelServerError as e:
+        # Checked before loading any model
+        sys.exit(f"Refusing to start the model server: {e}")
+    image_service = ImageService()
+    image_service.start_warm_pool()
+    image_service.start_retention()
+    ModelServer(image_service).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Single-file fast-load snapshots of the Stable Diffusion pipelines
+
+The first from_pretrained load of a model in a given dtype is written out as
+one safetensors file holding every module's weights already converted to
+that dtype, plus a JSON file with the resolved module configs. Later loads
+build the modules on the meta device (no random init), then attach tensors
+read lazily from the memory-mapped file. Components another model already
+shares are never read at all. Config resolution and per-component file
+discovery are skipped.
+"""
+
+import os
+import json
+import time
+import shutil
+import diffusers
+import transformers
+import torch
+from accelerate import init_empty_weights
+from safetensors import safe_open
+from safetensors.torch import save_file
+from config import SNAPSHOT_DIR
+
+# Modules stored as tensors; tokenizer, scheduler and feature extractor are small and saved as configs
+TENSOR_COMPONENTS = ('unet', 'vae', 'text_encoder')
+WEIGHTS_FILE = 'weights.safetensors'
+INDEX_FILE = 'pipeline.json'
+
+
+def snapshot_path(selected_style, dtype):
+    """Directory of the snapshot for a model in one dtype"""
+    return os.path.join(SNAPSHOT_DIR, f"{selected_style}-{str(dtype).replace('torch.', '')}")
+
+
+def source_stamp(model_path):
+    """Latest modification time under a model directory, to detect replaced weights"""
+    latest = 0.0
+    for root, _, files in os.walk(model_path):
+        for name in files:
+            latest = max(latest, os.path.getmtime(os.path.join(root, name)))
+    return latest
+
+
+def has_snapshot(selected_style, dtype, model_path):
+    """Whether an up-to-date snapshot exists for the model"""
+    index_path = os.path.join(snapshot_path(selected_style, dtype), INDEX_FILE)
+    if not os.path.exists(index_path):
+        return False
+    with open(index_path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    return index.get('source_stamp') == source_stamp(model_path)
+
+
+def _module_tensors(module):
+    """Every parameter and buffer, including non-persistent ones the state dict leaves out"""
+    tensors = {name: param.detach() for name, param in module.named_parameters()}
+    tensors.update({name: buffer for name, buffer in module.named_buffers()})
+    return tensors
+
+
+def save_snapshot(pipe, selected_style, dtype, model_path):
+    """Write a freshly loaded (still on CPU) pipeline out as a snapshot"""
+    target = snapshot_path(selected_style, dtype)
+    staging = f"{target}.tmp-{os.getpid()}"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    tensors = {}
+    components = {}
+    for name in TENSOR_COMPONENTS:
+        module = getattr(pipe, name)
+        for key, tensor in _module_tensors(module).items():
+            tensors[f"{name}.{key}"] = tensor.to('cpu').contiguous()
+        config = module.config.to_dict() if hasattr(module.config, 'to_dict') else dict(module.config)
+        components[name] = {'class': type(module).__name__, 'config': config}
+    save_file(tensors, os.path.join(staging, WEIGHTS_FILE))
+
+    pipe.tokenizer.save_pretrained(os.path.join(staging, 'tokenizer'))
+    if pipe.feature_extractor is not None:
+        pipe.feature_extractor.save_pretrained(os.path.join(staging, 'feature_extractor'))
+    components['scheduler'] = {'class': type(pipe.scheduler).__name__, 'config': dict(pipe.scheduler.config)}
+
+    with open(os.path.join(staging, INDEX_FILE), 'w', encoding='utf-8') as f:
+        json.dump({
+            'style': selected_style,
+            'dtype': str(dtype),
+            'source_stamp': source_stamp(model_path),
+            'created_at': time.time(),
+            'components': components
+        }, f, default=str)
+
+    # Readers only ever see a complete snapshot
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+    return target
+
+
+def _build_empty(component, spec):
+    """Instantiate a module from its stored config without allocating weights"""
+    if component == 'text_encoder':
+        cls = getattr(transformers, spec['class'])
+        config = cls.config_class.from_dict(spec['config'])
+        with init_empty_weights(include_buffers=True):
+            return cls(config)
+    cls = getattr(diffusers, spec['class'])
+    with init_empty_weights(include_buffers=True):
+        return cls.from_config(spec['config'])
+
+
+def _attach(module, weights, prefix, dtype):
+    """Replace a meta module's parameters and buffers with tensors from the snapshot"""
+    for key in weights.keys():
+        if not key.startswith(prefix):
+            continue
+        name = key[len(prefix):]
+        owner_name, _, attr = name.rpartition('.')
+        owner = module.get_submodule(owner_name) if owner_name else module
+        tensor = weights.get_tensor(key)
+        if attr in owner._parameters:
+            owner._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        else:
+            owner._buffers[attr] = tensor
+
+    missing = [name for name, tensor in _module_tensors(module).items() if tensor.is_meta]
+    if missing:
+        raise RuntimeError(f"snapshot is missing {len(missing)} tensors for {prefix.rstrip('.')}, e.g. {missing[0]}")
+    return module.to(dtype=dtype).eval()
+
+
+def load_snapshot(selected_style, dtype, shared=None):
+    """Assemble a StableDiffusionPipeline from its snapshot, reusing `shared` modules as given"""
+    shared = shared or {}
+    target = snapshot_path(selected_style, dtype)
+    with open(os.path.join(target, INDEX_FILE), 'r', encoding='utf-8') as f:
+        specs = json.load(f)['components']
+
+    modules = dict(shared)
+    with safe_open(os.path.join(target, WEIGHTS_FILE), framework='pt', device='cpu') as weights:
+        for component in TENSOR_COMPONENTS:
+            if component not in modules:
+                modules[component] = _attach(_build_empty(component, specs[component]), weights, f"{component}.", dtype)
+
+    if 'tokenizer' not in modules:
+        modules['tokenizer'] = transformers.CLIPTokenizer.from_pretrained(os.path.join(target, 'tokenizer'))
+    if 'feature_extractor' not in modules:
+        feature_extractor_dir = os.path.join(target, 'feature_extractor')
+        modules['feature_extractor'] = (transformers.CLIPImageProcessor.from_pretrained(feature_extractor_dir)
+                                        if os.path.isdir(feature_extractor_dir) else None)
+    scheduler_spec = specs['scheduler']
+    modules['scheduler'] = getattr(diffusers, scheduler_spec['class']).from_config(scheduler_spec['config'])
+
+    return diffusers.StableDiffusionPipeline(
+        **modules,
+        safety_checker=None,
+        requires_safety_checker=False
+    )
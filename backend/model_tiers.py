@@ -0,0 +1,210 @@
+"""
+Lower residency tiers for models evicted from the device: host RAM and disk snapshots
+
+A model leaving the accelerator is demoted rather than destroyed: its
+modules move to pinned host memory (HostTier), from where promoting it back
+is a host-to-device copy instead of a full load. When the host tier is full
+its least recently demoted model drops to the disk tier, the fast-load
+snapshot written by model_snapshot, which loads from a memory-mapped file
+without from_pretrained's config resolution. On CPU-only hosts the device
+tier already is host RAM, so models demote straight to the disk tier.
+"""
+
+import os
+import time
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+import torch
+import model_snapshot
+from config import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def is_torch_pipeline(pipe):
+    """Whether a pipeline's weights live in torch modules (ONNX pipelines cannot be moved)"""
+    return isinstance(getattr(pipe, 'unet', None), torch.nn.Module)
+
+
+def _pin(module):
+    """Re-home a CPU module's tensors in page-locked memory for faster copies back to the device"""
+    for submodule in module.modules():
+        for name, param in submodule._parameters.items():
+            if param is not None and not param.is_pinned():
+                param.data = param.data.pin_memory()
+        for name, buffer in submodule._buffers.items():
+            if buffer is not None and not buffer.is_pinned():
+                submodule._buffers[name] = buffer.pin_memory()
+
+
+def move_to_host(pipe, keep=(), pin=True):
+    """Move a pipeline's modules to CPU, leaving modules in `keep` (shared with device-resident models) alone"""
+    keep_ids = {id(module) for module in keep}
+    pin = pin and torch.cuda.is_available()
+    for module in pipe.components.values():
+        if isinstance(module, torch.nn.Module) and id(module) not in keep_ids:
+            module.to('cpu')
+            if pin:
+                _pin(module)
+    return pipe
+
+
+def move_to_device(pipe, device):
+    """Promote a host-tier pipeline back onto an execution device"""
+    non_blocking = str(device).startswith('cuda')
+    for module in pipe.components.values():
+        if isinstance(module, torch.nn.Module):
+            module.to(device, non_blocking=non_blocking)
+    if non_blocking:
+        torch.cuda.synchronize(device)
+    return pipe
+
+
+class HostTier:
+    """Demoted pipelines kept in host memory, bounded by bytes, least recently demoted leaves first"""
+
+    def __init__(self, capacity_bytes):
+        self.capacity_bytes = capacity_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {
+            'demotions': 0,
+            'promotions': 0,
+            'evictions': 0
+        }
+
+    @property
+    def enabled(self):
+        return self.capacity_bytes > 0
+
+    def put(self, style, pipe, size):
+        """Store a demoted pipeline; returns the (style, pipe) entries pushed out to make room"""
+        with self.lock:
+            self.entries.pop(style, None)
+            self.entries[style] = (pipe, size)
+            self.stats['demotions'] += 1
+            overflow = []
+            while self.entries and self._used() > self.capacity_bytes:
+                victim, (victim_pipe, _) = self.entries.popitem(last=False)
+                overflow.append((victim, victim_pipe))
+                self.stats['evictions'] += 1
+            return overflow
+
+    def take(self, style):
+        """Remove and return a pipeline for promotion, or None"""
+        with self.lock:
+            entry = self.entries.pop(style, None)
+            if entry is None:
+                return None
+            self.stats['promotions'] += 1
+            return entry[0]
+
+    def drain(self):
+        with self.lock:
+            entries = [(style, pipe) for style, (pipe, _) in self.entries.items()]
+            self.entries.clear()
+            return entries
+
+    def _used(self):
+        return sum(size for _, size in self.entries.values())
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                **self.stats,
+                'models': list(self.entries),
+                'used_mb': round(self._used() / 1024 ** 2),
+                'capacity_mb': round(self.capacity_bytes / 1024 ** 2)
+            }
+
+
+class DiskTier:
+    """Fast-load snapshots in SNAPSHOT_DIR, bounded by bytes, least recently used deleted first
+
+    Deleting a snapshot only makes the next load of that model a full
+    from_pretrained load, which writes it again.
+    """
+
+    def __init__(self, capacity_bytes, snapshot_dir=SNAPSHOT_DIR):
+        # 0 leaves the snapshot directory unbounded
+        self.capacity_bytes = capacity_bytes
+        self.snapshot_dir = snapshot_dir
+        self.lock = threading.Lock()
+        self.last_used = {}
+        self.stats = {
+            'demotions': 0,
+            'promotions': 0,
+            'evictions': 0
+        }
+
+    def has(self, model_key, dtype, model_path):
+        return model_snapshot.has_snapshot(model_key, dtype, model_path)
+
+    def touch(self, model_key, dtype, promoted=False):
+        with self.lock:
+            self.last_used[model_snapshot.snapshot_path(model_key, dtype)] = time.time()
+            if promoted:
+                self.stats['promotions'] += 1
+
+    def demote(self, pipe, model_key, dtype, model_path):
+        """Make sure a snapshot exists for a pipeline about to be released; False if none can be written"""
+        if self.has(model_key, dtype, model_path):
+            self.touch(model_key, dtype)
+            with self.lock:
+                self.stats['demotions'] += 1
+            return True
+        try:
+            # Snapshots are stored as CPU tensors, so this also works for device-resident pipelines
+            model_snapshot.save_snapshot(pipe, model_key, dtype, model_path)
+        except Exception as e:
+            logger.warning(f"Could not write snapshot for {model_key}: {e}")
+            return False
+        self.touch(model_key, dtype)
+        with self.lock:
+            self.stats['demotions'] += 1
+        self.enforce()
+        return True
+
+    def snapshots(self):
+        """(path, bytes, last used) of every snapshot on disk"""
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        found = []
+        for name in os.listdir(self.snapshot_dir):
+            path = os.path.join(self.snapshot_dir, name)
+            weights = os.path.join(path, model_snapshot.WEIGHTS_FILE)
+            if '.tmp-' in name or not os.path.isfile(weights):
+                continue
+            with self.lock:
+                last_used = self.last_used.get(path, os.path.getmtime(weights))
+            found.append((path, os.path.getsize(weights), last_used))
+        return found
+
+    def enforce(self):
+        """Delete least recently used snapshots until the tier fits its capacity"""
+        if self.capacity_bytes <= 0:
+            return
+        snapshots = sorted(self.snapshots(), key=lambda snapshot: snapshot[2])
+        used = sum(size for _, size, _ in snapshots)
+        for path, size, _ in snapshots:
+            if used <= self.capacity_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            used -= size
+            with self.lock:
+                self.last_used.pop(path, None)
+                self.stats['evictions'] += 1
+            logger.info(f"Removed model snapshot {os.path.basename(path)} to stay within the disk tier")
+
+    def get_stats(self):
+        snapshots = self.snapshots()
+        with self.lock:
+            stats = dict(self.stats)
+        return {
+            **stats,
+            'snapshots': [os.path.basename(path) for path, _, _ in snapshots],
+            'used_mb': round(sum(size for _, size, _ in snapshots) / 1024 ** 2),
+            'capacity_mb': round(self.capacity_bytes / 1024 ** 2)
+        }
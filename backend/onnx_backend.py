@@ -0,0 +1,89 @@
+"""
+ONNX Runtime CPU backend for the Stable Diffusion pipelines
+
+Each MODEL_PATHS entry is exported to ONNX (text encoder, UNet, VAE decoder)
+once, cached under ONNX_EXPORT_DIR and then served with ONNX Runtime. The
+returned pipelines are called exactly like the PyTorch ones; the few call
+arguments they spell differently are translated by adapt_call_kwargs().
+Requires the optional `optimum[onnxruntime]` package.
+"""
+
+import os
+import copy
+import numpy as np
+from config import MODEL_PATHS, ONNX_EXPORT_DIR, ONNX_PROVIDER
+
+try:
+    from optimum.onnxruntime import ORTStableDiffusionPipeline
+except ImportError:
+    ORTStableDiffusionPipeline = None
+
+
+def is_available():
+    """Whether optimum/onnxruntime are installed"""
+    return ORTStableDiffusionPipeline is not None
+
+
+def is_onnx_pipeline(pipe):
+    """Whether `pipe` was produced by this backend"""
+    return is_available() and isinstance(pipe, ORTStableDiffusionPipeline)
+
+
+def export_path(selected_style):
+    """Directory holding the exported graphs for a model"""
+    return os.path.join(ONNX_EXPORT_DIR, selected_style)
+
+
+def load_model(selected_style):
+    """Load the ONNX pipeline for a model, exporting it on first use"""
+    if not is_available():
+        raise RuntimeError("ONNX backend requires `pip install optimum[onnxruntime]`")
+
+    onnx_dir = export_path(selected_style)
+    if os.path.exists(os.path.join(onnx_dir, 'model_index.json')):
+        print(f"📦 Loading cached ONNX export: {onnx_dir}")
+        return ORTStableDiffusionPipeline.from_pretrained(onnx_dir, provider=ONNX_PROVIDER)
+
+    print(f"🔧 Exporting {selected_style} to ONNX (one-time)...")
+    pipe = ORTStableDiffusionPipeline.from_pretrained(
+        MODEL_PATHS[selected_style],
+        export=True,
+        provider=ONNX_PROVIDER
+    )
+    os.makedirs(onnx_dir, exist_ok=True)
+    pipe.save_pretrained(onnx_dir)
+    print(f"💾 ONNX export cached at {onnx_dir}")
+    return pipe
+
+
+def with_scheduler(pipe, scheduler):
+    """Pipeline sharing pipe's ONNX sessions but sampling with `scheduler`"""
+    variant = copy.copy(pipe)
+    variant.scheduler = scheduler
+    return variant
+
+
+def seeded_latents(seeds, width, height, channels=4):
+    """Initial latents drawn from one RandomState per prompt, so batching does not change results"""
+    return np.stack([
+        np.random.RandomState(seed).standard_normal((channels, height // 8, width // 8))
+        for seed in seeds
+    ]).astype(np.float32)
+
+
+def adapt_call_kwargs(pipe, generation_kwargs, seeds):
+    """Translate PyTorch pipeline call arguments to the ONNX pipeline's spelling"""
+    generation_kwargs = dict(generation_kwargs)
+
+    # torch.Generator objects are replaced by explicitly seeded numpy latents
+    generation_kwargs.pop('generator', None)
+    generation_kwargs['latents'] = seeded_latents(seeds, generation_kwargs['width'], generation_kwargs['height'])
+
+    # The step-end hook becomes the legacy per-step callback
+    on_step_end = generation_kwargs.pop('callback_on_step_end', None)
+    if on_step_end is not None:
+        generation_kwargs['callback'] = lambda step, timestep, latents: on_step_end(
+            pipe, step, timestep, {'latents': latents})
+        generation_kwargs['callback_steps'] = 1
+
+    return generation_kwargs
@@ -2,22 +2,30 @@
 Image generation routes for AI image creation
 """
 
+import base64
 import logging
-from flask import Blueprint, request, jsonify, send_from_directory
+from flask import Blueprint, Response, request, jsonify, send_from_directory
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from services.image_service import ImageService
 from services.user_service import UserService
-from utils.validators import validate_prompt, validate_file_upload
+from services.job_service import JobService
+from services.image_derivatives import DerivativeStore, DERIVATIVE_MIMETYPE
+from services.image_storage import create_image_storage
+from utils.validators import validate_prompt, validate_generation_options, validate_file_upload
 from middleware.error_handler import handle_errors
 from middleware.rate_limiter import rate_limit
-from config import IMAGES_DIR
+from config import (IMAGES_DIR, DERIVATIVES_DIR, DERIVATIVE_SIZES, DERIVATIVE_MAX_AGE, FEATURES,
+                    BATCH_GENERATE_MAX_PROMPTS, REFINE_STRENGTH)
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-def create_image_routes(image_service: ImageService, user_service: UserService):
+def create_image_routes(image_service: ImageService, user_service: UserService, job_service: JobService):
     """Create image generation blueprint with routes"""
     image_bp = Blueprint('image', __name__)
+    # Resolve and serve files in this process, also when generation runs on the model server
+    storage = create_image_storage()
+    derivatives = DerivativeStore(storage)
     
     @image_bp.route('/api/generate', methods=['POST'])
     @jwt_required()
@@ -39,6 +47,10 @@ def create_image_routes(image_service: ImageService, user_service: UserService):
             if not is_valid:
                 return jsonify({'error': error_msg}), 400
             
+            is_valid, error_msg, options = validate_generation_options(data)
+            if not is_valid:
+                return jsonify({'error': error_msg}), 400
+            
             # Check user credits
             user = user_service.get_user_by_username(username)
             if not user:
@@ -49,22 +61,32 @@ def create_image_routes(image_service: ImageService, user_service: UserService):
             
             logger.info(f"Image generation request from {username}: {prompt[:100]}...")
             
-            # Generate image
-            result = image_service.generate_image(prompt, style)
+            # Generate image (concurrent requests are micro-batched)
+            result = image_service.schedule_generation(prompt, style, **options)
             
             if result['success']:
                 # Deduct credits
                 credit_result = user_service.deduct_credits(username, 1)
                 if not credit_result['success']:
                     logger.error(f"Failed to deduct credits for {username}")
+
+                # Inline delivery skips the follow-up GET of image_url
+                image_data = None
+                if data.get('inline') is True and result.get('image_bytes') is not None:
+                    image_data = f"data:{result['mimetype']};base64,{base64.b64encode(result['image_bytes']).decode('ascii')}"
+
                 return jsonify({
                     'status': 'success',
                     'data': {
                         'message': 'Image generated successfully',
+                        'image_data': image_data,
                         'image_url': f"/images/{result['filename']}",
                         'filename': result['filename'],
                         'generation_time': result['generation_time'],
-                        'style_used': result['style_used'],
+                        'style_used': result['style'],
+                        'seed': result['metadata'].get('seed'),
+                        'cache_hit': result['metadata'].get('cache_hit', False),
+                        'draft_id': result.get('draft_id'),
                         'credits_remaining': user.get('credits', 0) - 1
                     }
                 }), 200
@@ -79,6 +101,129 @@ def create_image_routes(image_service: ImageService, user_service: UserService):
             print(f"Image generation error: {e}")  # Print error to terminal for debugging
             return jsonify({'error': 'Image generation failed'}), 500
     
+    @image_bp.route('/api/generate/batch', methods=['POST'])
+    @jwt_required()
+    @handle_errors
+    @rate_limit(max_requests=2, window=60)
+    def generate_batch():
+        """Queue AI image generation for a list of prompts as one job; poll it through /api/jobs"""
+        try:
+            if not FEATURES['batch_generation']:
+                return jsonify({'error': 'Batch generation is not enabled'}), 403
+
+            username = get_jwt_identity()
+            data = request.get_json()
+
+            if not data:
+                return jsonify({'error': 'Request data is required'}), 400
+            prompts = data.get('prompts')
+            style = data.get('artStyle')
+
+            if not isinstance(prompts, list) or not prompts:
+                return jsonify({'error': 'A non-empty list of prompts is required'}), 400
+            if len(prompts) > BATCH_GENERATE_MAX_PROMPTS:
+                return jsonify({'error': f'Too many prompts (max {BATCH_GENERATE_MAX_PROMPTS})'}), 400
+
+            # Validate every prompt before spending any compute
+            prompts = [prompt.strip() if isinstance(prompt, str) else '' for prompt in prompts]
+            for index, prompt in enumerate(prompts):
+                is_valid, error_msg = validate_prompt(prompt)
+                if not is_valid:
+                    return jsonify({'error': f'Prompt {index}: {error_msg}'}), 400
+
+            # Check user credits for the whole batch
+            user = user_service.get_user_by_username(username)
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+
+            if user.get('credits', 0) < len(prompts):
+                return jsonify({'error': 'Insufficient credits'}), 402
+
+            logger.info(f"Batch generation request from {username}: {len(prompts)} prompts")
+
+            def charge(results):
+                # Charged chunk by chunk, only for images actually produced
+                credit_result = user_service.deduct_credits(username, len(results))
+                if not credit_result['success']:
+                    logger.error(f"Failed to deduct {len(results)} credits for {username}")
+
+            job = job_service.submit_batch(username, prompts, style, on_success=charge)
+            if job is None:
+                return jsonify({'error': 'Generation queue is full, please retry shortly'}), 503
+
+            return jsonify({
+                'status': 'success',
+                'data': {
+                    'job_id': job.id,
+                    'status_url': f"/api/jobs/{job.id}",
+                    'events_url': f"/api/jobs/{job.id}/events"
+                }
+            }), 202
+
+        except Exception as e:
+            logger.error(f"Batch generation error: {e}")
+            return jsonify({'error': 'Batch generation failed'}), 500
+
+    @image_bp.route('/api/generate/refine', methods=['POST'])
+    @jwt_required()
+    @handle_errors
+    @rate_limit(max_requests=5, window=60)
+    def refine_image():
+        """Render a draft from /api/generate (draft: true) at its full target size"""
+        try:
+            username = get_jwt_identity()
+            data = request.get_json()
+
+            if not data:
+                return jsonify({'error': 'Request data is required'}), 400
+            draft_id = data.get('draftId')
+            if not isinstance(draft_id, str) or not draft_id:
+                return jsonify({'error': 'draftId is required'}), 400
+
+            strength = data.get('strength', REFINE_STRENGTH)
+            if isinstance(strength, bool) or not isinstance(strength, (int, float)) or not 0 < strength <= 1:
+                return jsonify({'error': 'strength must be a number between 0 and 1'}), 400
+
+            # Check user credits
+            user = user_service.get_user_by_username(username)
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+
+            if user.get('credits', 0) < 1:
+                return jsonify({'error': 'Insufficient credits'}), 402
+
+            logger.info(f"Refine request from {username}: draft {draft_id}")
+
+            result = image_service.refine_draft(draft_id, strength=float(strength))
+
+            if not result['success']:
+                status = 404 if result['error'] == 'Draft not found or expired' else 500
+                return jsonify({
+                    'status': 'error',
+                    'message': result['error']
+                }), status
+
+            credit_result = user_service.deduct_credits(username, 1)
+            if not credit_result['success']:
+                logger.error(f"Failed to deduct credits for {username}")
+            return jsonify({
+                'status': 'success',
+                'data': {
+                    'message': 'Image refined successfully',
+                    'image_url': f"/images/{result['filename']}",
+                    'filename': result['filename'],
+                    'generation_time': result['generation_time'],
+                    'style_used': result['style'],
+                    'seed': result['metadata'].get('seed'),
+                    'size': result['metadata'].get('size'),
+                    'credits_remaining': user.get('credits', 0) - 1
+                }
+            }), 200
+
+        except Exception as e:
+            logger.error(f"Image refine error: {e}")
+            return jsonify({'error': 'Image refine failed'}), 500
+
     @image_bp.route('/api/gallery', methods=['GET'])
     @jwt_required()
     @handle_errors
@@ -121,6 +266,8 @@ def create_image_routes(image_service: ImageService, user_service: UserService):
                     'id': str(img['_id']),
                     'filename': img['filename'],
                     'image_url': f"/images/{img['filename']}",
+                    'thumbnail_url': f"/images/{img['filename']}?size=thumb",
+                    'preview_url': f"/images/{img['filename']}?size=preview",
                     'prompt': img['prompt'],
                     'style': img.get('style', 'unknown'),
                     'created_at': img['created_at'],
@@ -149,9 +296,24 @@ def create_image_routes(image_service: ImageService, user_service: UserService):
     @image_bp.route('/images/<filename>')
     @handle_errors
     def serve_image(filename):
-        """Serve generated images"""
+        """Serve generated images, or a downscaled derivative with ?size=thumb|preview"""
+        size = request.args.get('size')
+        if size is not None and size not in DERIVATIVE_SIZES:
+            return jsonify({'error': f"Invalid size. Must be one of: {', '.join(DERIVATIVE_SIZES)}"}), 400
+
         try:
-            return send_from_directory(IMAGES_DIR, filename)
+            # Freshly generated images are served from memory until their disk write lands
+            pending = image_service.get_pending_image(filename)
+            if size is not None:
+                derivative = derivatives.get(filename, size, source_bytes=pending[0] if pending else None)
+                if derivative is None:
+                    return jsonify({'error': 'Image not found'}), 404
+                return send_from_directory(DERIVATIVES_DIR, derivative, mimetype=DERIVATIVE_MIMETYPE,
+                                           max_age=DERIVATIVE_MAX_AGE)
+            if pending is not None:
+                image_bytes, mimetype = pending
+                return Response(image_bytes, mimetype=mimetype)
+            return send_from_directory(IMAGES_DIR, storage.relative_path(filename))
         except Exception as e:
             logger.error(f"Error serving image {filename}: {e}")
             return jsonify({'error': 'Image not found'}), 404
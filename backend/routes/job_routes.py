@@ -0,0 +1,161 @@
+"""
+Asynchronous generation job routes with polling and progress streaming
+"""
+
+import json
+import base64
+import logging
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from services.job_service import JobService
+from services.user_service import UserService
+from utils.validators import validate_prompt, validate_generation_options
+from middleware.error_handler import handle_errors
+from middleware.rate_limiter import rate_limit
+from config import JOB_STREAM_KEEPALIVE
+
+logger = logging.getLogger(__name__)
+
+def create_job_routes(job_service: JobService, user_service: UserService):
+    """Create generation job blueprint with routes"""
+    job_bp = Blueprint('jobs', __name__)
+
+    @job_bp.route('/api/jobs', methods=['POST'])
+    @jwt_required()
+    @handle_errors
+    @rate_limit(max_requests=5, window=60)
+    def submit_job():
+        """Queue an image generation job and return its id immediately"""
+        try:
+            username = get_jwt_identity()
+            data = request.get_json()
+
+            if not data:
+                return jsonify({'error': 'Request data is required'}), 400
+            prompt = data.get('prompt', '').strip()
+            style = data.get('artStyle')
+
+            # Validate prompt
+            is_valid, error_msg = validate_prompt(prompt)
+            if not is_valid:
+                return jsonify({'error': error_msg}), 400
+
+            is_valid, error_msg, options = validate_generation_options(data)
+            if not is_valid:
+                return jsonify({'error': error_msg}), 400
+
+            # Check user credits
+            user = user_service.get_user_by_username(username)
+            if not user:
+                return jsonify({'error': 'User not found'}), 404
+
+            if user.get('credits', 0) < 1:
+                return jsonify({'error': 'Insufficient credits'}), 402
+
+            def charge(result):
+                credit_result = user_service.deduct_credits(username, 1)
+                if not credit_result['success']:
+                    logger.error(f"Failed to deduct credits for {username}")
+
+            job = job_service.submit(username, prompt, style, on_success=charge, **options)
+            if job is None:
+                return jsonify({'error': 'Generation queue is full, please retry shortly'}), 503
+
+            return jsonify({
+                'status': 'success',
+                'data': {
+                    'job_id': job.id,
+                    'status_url': f"/api/jobs/{job.id}",
+                    'events_url': f"/api/jobs/{job.id}/events"
+                }
+            }), 202
+
+        except Exception as e:
+            logger.error(f"Job submission error: {e}")
+            return jsonify({'error': 'Failed to submit generation job'}), 500
+
+    @job_bp.route('/api/jobs/<job_id>', methods=['GET'])
+    @jwt_required()
+    @handle_errors
+    def get_job(job_id):
+        """Poll the state of a generation job"""
+        job = job_service.get_job(job_id, get_jwt_identity())
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+
+        return jsonify({
+            'status': 'success',
+            'data': job.to_dict()
+        }), 200
+
+    @job_bp.route('/api/jobs/<job_id>/events', methods=['GET'])
+    @jwt_required()
+    @handle_errors
+    def stream_job(job_id):
+        """Stream job progress as server-sent events until it finishes"""
+        job = job_service.get_job(job_id, get_jwt_identity())
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+
+        def events():
+            version = -1
+            preview_step = 0
+            while True:
+                current = job.wait_for_change(version, JOB_STREAM_KEEPALIVE)
+                if current == version:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+
+                version = current
+                if job.preview is not None and job.preview_step != preview_step and not job.finished:
+                    preview_step = job.preview_step
+                    preview = {
+                        'step': preview_step,
+                        'image': 'data:image/jpeg;base64,' + base64.b64encode(job.preview).decode('ascii')
+                    }
+                    yield f"event: preview\ndata: {json.dumps(preview)}\n\n"
+
+                snapshot = job.to_dict()
+                event = snapshot['status'] if job.finished else 'progress'
+                yield f"event: {event}\ndata: {json.dumps(snapshot)}\n\n"
+                if job.finished:
+                    return
+
+        return Response(
+            stream_with_context(events()),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    @job_bp.route('/api/jobs/<job_id>/preview', methods=['GET'])
+    @jwt_required()
+    @handle_errors
+    def get_job_preview(job_id):
+        """Latest low-resolution preview of a running job as JPEG"""
+        job = job_service.get_job(job_id, get_jwt_identity())
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        if job.preview is None:
+            return jsonify({'error': 'No preview available yet'}), 404
+
+        return Response(job.preview, mimetype='image/jpeg', headers={'Cache-Control': 'no-store'})
+
+    @job_bp.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+    @jwt_required()
+    @handle_errors
+    def cancel_job(job_id):
+        """Stop a queued or running job; credits are only charged for completed jobs"""
+        job = job_service.get_job(job_id, get_jwt_identity())
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+
+        if not job_service.cancel(job):
+            return jsonify({'error': f'Job already {job.status}'}), 409
+
+        return jsonify({
+            'status': 'success',
+            'data': job.to_dict()
+        }), 202
+
+    return job_bp
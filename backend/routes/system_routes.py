@@ -2,18 +2,36 @@
 System routes for health checks and system status
 """
 
+import time
 import logging
 import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, g
 from services.image_service import ImageService
 from services.user_service import UserService
+from services import metrics
 from middleware.error_handler import handle_errors
+from config import ENABLE_MONITORING
 
 logger = logging.getLogger(__name__)
 
-def create_system_routes(image_service: ImageService, user_service: UserService, mongo):
+def create_system_routes(image_service: ImageService, user_service: UserService, mongo, job_service=None):
     """Create system blueprint with routes"""
     system_bp = Blueprint('system', __name__)
+
+    @system_bp.before_app_request
+    def start_request_timer():
+        g.request_start = time.perf_counter()
+
+    @system_bp.after_app_request
+    def observe_request(response):
+        start = g.pop('request_start', None)
+        if start is not None:
+            # The route pattern, not the path, keeps one series per endpoint; streamed
+            # responses are timed to their first byte
+            endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint,
+                                                 method=request.method, status=response.status_code)
+        return response
     
     @system_bp.route('/api/hello')
     @handle_errors
@@ -47,6 +65,14 @@ def create_system_routes(image_service: ImageService, user_service: UserService,
             'memory_usage': memory_usage
         })
     
+    @system_bp.route('/metrics')
+    @handle_errors
+    def get_metrics():
+        """Prometheus scrape endpoint"""
+        if not ENABLE_MONITORING:
+            return jsonify({'error': 'Monitoring is disabled'}), 404
+        return Response(image_service.get_metrics(), content_type=metrics.CONTENT_TYPE)
+    
     @system_bp.route('/api/stats', methods=['GET'])
     @handle_errors
     def get_user_stats():
@@ -76,6 +102,7 @@ def create_system_routes(image_service: ImageService, user_service: UserService,
         try:
             # Get image service status
             image_status = image_service.get_service_status()
+            job_status = job_service.get_status() if job_service is not None else None
             
             # Get database stats
             try:
@@ -99,6 +126,8 @@ def create_system_routes(image_service: ImageService, user_service: UserService,
                         'total_feedback': total_feedback
                     },
                     'image_service': image_status,
+                    'jobs': job_status,
+                    'http_latency': metrics.HTTP_REQUEST_SECONDS.summary(),
                     'uptime': 'running'  # TODO: Implement actual uptime tracking
                 }
             }), 200
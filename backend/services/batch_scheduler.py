@@ -0,0 +1,218 @@
+"""
+Micro-batching scheduler for concurrent image generation requests
+"""
+
+import time
+import logging
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, INFERENCE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+
+class GenerationRequest:
+    """A single prompt waiting to be generated as part of a batch"""
+
+    def __init__(self, prompt, params, progress_callback=None, preview_callback=None, cancel_event=None):
+        self.prompt = prompt
+        self.params = params
+        self.progress_callback = progress_callback
+        self.preview_callback = preview_callback
+        self.cancel_event = cancel_event
+        # Final latents, captured for draft requests so they can be refined later
+        self.draft_latents = None
+        self.future = Future()
+
+    @property
+    def cancelled(self):
+        """Whether the caller has asked for this generation to stop"""
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+
+class _PendingBatch:
+    """Requests sharing one batch key, collected until full or expired"""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.requests = []
+
+
+class BatchScheduler:
+    """Coalesces compatible generation requests into batched pipeline calls
+
+    Requests are compatible when they share the model style and every
+    pipeline setting that must be identical across a batch (size, steps,
+    guidance scale and scheduler). The first request for a key opens a window of
+    ``max_wait`` seconds; the batch is dispatched when the window closes or
+    when ``max_batch_size`` requests have arrived, whichever comes first.
+
+    Ready batches run on a pool of ``workers`` inference threads. A batch is
+    only taken off the pending list when a worker is free and its style has
+    fewer running batches than ``capacity(style)`` (one by default), so
+    requests keep coalescing while their model is busy and different styles
+    denoise side by side.
+    """
+
+    def __init__(self, run_batch, max_batch_size=BATCH_MAX_SIZE, max_wait=BATCH_MAX_WAIT_MS / 1000,
+                 workers=INFERENCE_WORKERS, capacity=None):
+        """
+        Args:
+            run_batch: callable(style, requests) returning one result per request
+            max_batch_size: largest number of prompts sent to a single pipeline call
+            max_wait: seconds to hold the first request of a batch for companions
+            workers: number of batches that may run at the same time
+            capacity: callable(style) giving how many batches of one style may
+                run at once, e.g. the number of execution slots holding its model
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self.workers = max(1, int(workers))
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference-worker')
+        self.capacity = capacity or (lambda style: 1)
+        self._busy_styles = Counter()
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._running = False
+        self.stats = {
+            'batches_run': 0,
+            'requests_batched': 0,
+            'largest_batch': 0
+        }
+
+    @staticmethod
+    def batch_key(style, params):
+        """Key under which requests may share a pipeline call"""
+        return (
+            style,
+            params['width'],
+            params['height'],
+            params['num_inference_steps'],
+            params['guidance_scale'],
+            params['scheduler']
+        )
+
+    def submit(self, style, prompt, params, progress_callback=None, preview_callback=None, cancel_event=None):
+        """Queue a prompt for batched generation and return its Future"""
+        request = GenerationRequest(prompt, params, progress_callback, preview_callback, cancel_event)
+        key = self.batch_key(style, params)
+
+        with self._condition:
+            self._ensure_running()
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = _PendingBatch(time.monotonic() + self.max_wait)
+                self._pending[key] = batch
+            batch.requests.append(request)
+            self._condition.notify()
+
+        return request.future
+
+    def pending_count(self):
+        """Number of requests waiting to be dispatched"""
+        with self._condition:
+            return sum(len(batch.requests) for batch in self._pending.values())
+
+    def active_workers(self):
+        """Number of workers currently running a batch"""
+        with self._condition:
+            return sum(self._busy_styles.values())
+
+    def busy_styles(self):
+        """Styles with a batch currently running"""
+        with self._condition:
+            return sorted(style for style, running in self._busy_styles.items() if running)
+
+    def shutdown(self):
+        """Stop the dispatcher thread after the current batch"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._pool.shutdown(wait=False)
+
+    def _ensure_running(self):
+        """Start the dispatcher thread on first use (caller holds the lock)"""
+        if self._thread is None or not self._thread.is_alive():
+            self._running = True
+            self._thread = threading.Thread(
+                target=self._dispatch_loop,
+                name='batch-scheduler',
+                daemon=True
+            )
+            self._thread.start()
+
+    def _next_ready(self):
+        """Pop the next dispatchable batch, or return the seconds to wait (caller holds the lock)"""
+        if sum(self._busy_styles.values()) >= self.workers:
+            # Woken again when a worker finishes
+            return None, None
+
+        now = time.monotonic()
+        earliest = None
+
+        for key, batch in self._pending.items():
+            if self._busy_styles[key[0]] >= self.capacity(key[0]):
+                # Every slot holding its model is busy; keep collecting until one finishes
+                continue
+            if len(batch.requests) >= self.max_batch_size or batch.deadline <= now:
+                requests = batch.requests[:self.max_batch_size]
+                remaining = batch.requests[self.max_batch_size:]
+                if remaining:
+                    # Overflow has already waited long enough, send it next
+                    batch.requests = remaining
+                    batch.deadline = now
+                else:
+                    del self._pending[key]
+                return key, requests
+
+            if earliest is None or batch.deadline < earliest:
+                earliest = batch.deadline
+
+        return None, (None if earliest is None else max(0.0, earliest - now))
+
+    def _dispatch_loop(self):
+        """Dispatcher thread: run batches as they become ready"""
+        while True:
+            with self._condition:
+                while True:
+                    if not self._running:
+                        return
+                    key, ready = self._next_ready()
+                    if key is not None:
+                        break
+                    self._condition.wait(timeout=ready)
+
+                self._busy_styles[key[0]] += 1
+                self.stats['batches_run'] += 1
+                self.stats['requests_batched'] += len(ready)
+                self.stats['largest_batch'] = max(self.stats['largest_batch'], len(ready))
+
+            self._pool.submit(self._run, key[0], ready)
+
+    def _run(self, style, requests):
+        """Worker: execute one batch and hand each result back to its caller"""
+        logger.info(f"Dispatching batch of {len(requests)} for style {style}")
+
+        try:
+            results = self.run_batch(style, requests)
+        except Exception as e:
+            logger.error(f"Batch execution failed for style {style}: {e}")
+            for request in requests:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        finally:
+            with self._condition:
+                self._busy_styles[style] -= 1
+                if self._busy_styles[style] <= 0:
+                    del self._busy_styles[style]
+                self._condition.notify_all()
+
+        for request, result in zip(requests, results):
+            if not request.future.done():
+                request.future.set_result(result)
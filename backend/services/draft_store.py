@@ -0,0 +1,79 @@
+"""
+Final latents of low-resolution drafts, kept for a later refine pass
+"""
+
+import time
+import uuid
+import logging
+import threading
+import torch
+from collections import OrderedDict
+from config import DRAFT_STORE_SIZE, DRAFT_TTL
+
+logger = logging.getLogger(__name__)
+
+
+class DraftStore:
+    """Bounded LRU of draft latents keyed by an opaque draft id
+
+    A draft is only refined by whoever holds its id, so entries expire after
+    DRAFT_TTL seconds and the oldest are evicted once DRAFT_STORE_SIZE drafts
+    are held. Latents live on the CPU; a 512x512 draft is 64 KB.
+    """
+
+    def __init__(self, max_entries=DRAFT_STORE_SIZE, ttl=DRAFT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {
+            'stored': 0,
+            'hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'evictions': 0
+        }
+
+    def put(self, style, prompt, params, latents):
+        """Keep one draft's final latents and return its draft id"""
+        draft_id = uuid.uuid4().hex
+        entry = {
+            'style': style,
+            'prompt': prompt,
+            'params': dict(params),
+            'latents': torch.as_tensor(latents).detach().to('cpu'),
+            'created_at': time.time()
+        }
+        with self.lock:
+            self.entries[draft_id] = entry
+            self.stats['stored'] += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return draft_id
+
+    def get(self, draft_id):
+        """Return the stored draft, or None if unknown or expired"""
+        with self.lock:
+            entry = self.entries.get(draft_id)
+            if entry is not None and time.time() - entry['created_at'] > self.ttl:
+                del self.entries[draft_id]
+                self.stats['expired'] += 1
+                entry = None
+
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            self.entries.move_to_end(draft_id)
+            self.stats['hits'] += 1
+            return entry
+
+    def get_stats(self):
+        """Counters for status endpoints"""
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                **self.stats
+            }
@@ -0,0 +1,105 @@
+"""
+Per-model cache of CLIP text-encoder outputs for prompts and negative prompts
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+import torch
+from config import EMBEDDING_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class PromptEmbeddingCache:
+    """LRU cache of prompt embeddings keyed by (model key, text)
+
+    Entries added through warm() are pinned and never evicted, which keeps the
+    fixed negative prompt presets resident for as long as their model is.
+    """
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = {}
+        self.pinned = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0
+        }
+
+    @staticmethod
+    def supports(pipe):
+        """Whether the pipeline can take precomputed prompt embeddings from a PyTorch text encoder"""
+        return hasattr(pipe, 'encode_prompt') and isinstance(getattr(pipe, 'text_encoder', None), torch.nn.Module)
+
+    def get_embeddings(self, model_key, pipe, texts):
+        """Return stacked embeddings for `texts`, encoding only the misses"""
+        found = {}
+        missing = []
+        with self.lock:
+            model_entries = self.entries.setdefault(model_key, OrderedDict())
+            model_pinned = self.pinned.get(model_key, {})
+            for text in texts:
+                if text in found:
+                    continue
+                if text in model_pinned:
+                    found[text] = model_pinned[text]
+                elif text in model_entries:
+                    model_entries.move_to_end(text)
+                    found[text] = model_entries[text]
+                else:
+                    missing.append(text)
+            self.stats['hits'] += len(texts) - len(missing)
+            self.stats['misses'] += len(missing)
+
+        if missing:
+            encoded = self._encode(pipe, missing)
+            with self.lock:
+                model_entries = self.entries.setdefault(model_key, OrderedDict())
+                for text, embedding in zip(missing, encoded):
+                    found[text] = embedding
+                    model_entries[text] = embedding
+                while len(model_entries) > self.max_entries:
+                    model_entries.popitem(last=False)
+                    self.stats['evictions'] += 1
+
+        return torch.stack([found[text] for text in texts])
+
+    def warm(self, model_key, pipe, texts):
+        """Encode and pin `texts` for a freshly loaded model"""
+        texts = list(dict.fromkeys(texts))
+        encoded = self._encode(pipe, texts)
+        with self.lock:
+            self.pinned.setdefault(model_key, {}).update(zip(texts, encoded))
+        logger.info(f"Pre-warmed {len(texts)} prompt embeddings for {model_key}")
+
+    def drop_model(self, model_key):
+        """Forget every embedding produced by an unloaded model"""
+        with self.lock:
+            self.entries.pop(model_key, None)
+            self.pinned.pop(model_key, None)
+
+    def get_stats(self):
+        """Counters and occupancy for monitoring"""
+        with self.lock:
+            return {
+                **self.stats,
+                'entries': sum(len(entries) for entries in self.entries.values()),
+                'pinned': sum(len(entries) for entries in self.pinned.values()),
+                'max_entries_per_model': self.max_entries
+            }
+
+    @staticmethod
+    def _encode(pipe, texts):
+        """Run the text encoder once for a list of texts"""
+        with torch.no_grad():
+            prompt_embeds, _ = pipe.encode_prompt(
+                texts,
+                pipe._execution_device,
+                1,
+                False
+            )
+        # Clone so each entry owns its storage instead of pinning the whole batch
+        return [embedding.clone() for embedding in prompt_embeds]
@@ -0,0 +1,115 @@
+"""
+Thumbnail and preview derivatives of generated images, cached on disk
+"""
+
+import io
+import os
+import logging
+import threading
+from PIL import Image
+from config import DERIVATIVES_DIR, DERIVATIVE_SIZES, DERIVATIVE_QUALITY
+from services.image_storage import create_image_storage
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_MIMETYPE = 'image/webp'
+
+
+class DerivativeStore:
+    """Downscaled WebP copies of generated images, one file per (image, size)
+
+    Derivatives are stored in DERIVATIVES_DIR, sharded like the originals,
+    as '<original filename>.<size>.webp'. Each is made at most once per
+    process: concurrent requests for a missing derivative wait for the first
+    one. Writes are atomic, so another process never reads a partial file.
+    """
+
+    def __init__(self, storage=None, derivatives_dir=DERIVATIVES_DIR, sizes=DERIVATIVE_SIZES):
+        self.storage = storage or create_image_storage()
+        self.derivative_storage = create_image_storage(derivatives_dir)
+        self.sizes = dict(sizes)
+        self.key_locks = {}
+        self.lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'created': 0,
+            'created_on_save': 0,
+            'failures': 0
+        }
+
+    def derivative_name(self, filename, size):
+        return f"{filename}.{size}.webp"
+
+    def get(self, filename, size, source_bytes=None):
+        """
+        Path of the derivative relative to derivatives_dir, creating it if
+        needed. The original is read from `source_bytes` when given (an image
+        whose write is still queued), otherwise from storage. Returns None
+        when the original does not exist.
+        """
+        if size not in self.sizes:
+            raise ValueError(f"Unknown derivative size: {size}")
+        name = self.derivative_name(filename, size)
+        if self.derivative_storage.exists(name):
+            self.stats['hits'] += 1
+            return self.derivative_storage.relative_path(name)
+
+        with self._key_lock(filename, size):
+            # Made by the request we waited for
+            if self.derivative_storage.exists(name):
+                self.stats['hits'] += 1
+                return self.derivative_storage.relative_path(name)
+
+            if source_bytes is not None:
+                source = io.BytesIO(source_bytes)
+            else:
+                if os.sep in filename or filename.startswith('.') or not self.storage.exists(filename):
+                    return None
+                source = self.storage.path(filename)
+            try:
+                with Image.open(source) as image:
+                    self._write(image, filename, [size])
+            except Exception as e:
+                self.stats['failures'] += 1
+                logger.error(f"Failed to create {size} derivative of {filename}: {e}")
+                raise
+            self.stats['created'] += 1
+            return self.derivative_storage.relative_path(name)
+
+    def create_all(self, filename, image):
+        """Write every derivative size of a freshly generated PIL image"""
+        try:
+            self._write(image, filename, list(self.sizes))
+            self.stats['created_on_save'] += len(self.sizes)
+        except Exception as e:
+            self.stats['failures'] += 1
+            logger.error(f"Failed to create derivatives of {filename}: {e}")
+
+    def remove(self, filename):
+        """Delete the derivatives of an original that was removed"""
+        for size in self.sizes:
+            self.derivative_storage.delete(self.derivative_name(filename, size))
+
+    def get_stats(self):
+        return {
+            **self.stats,
+            'sizes': dict(self.sizes)
+        }
+
+    def _write(self, image, filename, sizes):
+        """Downscale largest size first and reuse each result as the source of the next"""
+        image = image.convert('RGB')
+        for size in sorted(sizes, key=self.sizes.get, reverse=True):
+            image = image.copy()
+            # reducing_gap resamples from a cheap box-reduced copy, much faster for big reductions
+            image.thumbnail((self.sizes[size], self.sizes[size]), Image.LANCZOS, reducing_gap=2.0)
+            buffer = io.BytesIO()
+            image.save(buffer, 'WEBP', quality=DERIVATIVE_QUALITY, method=4)
+            self.derivative_storage.write(self.derivative_name(filename, size), buffer.getvalue())
+
+    def _key_lock(self, filename, size):
+        with self.lock:
+            if len(self.key_locks) > 1024:
+                # Drop locks nobody holds; they are recreated on demand
+                self.key_locks = {key: lock for key, lock in self.key_locks.items() if lock.locked()}
+            return self.key_locks.setdefault((filename, size), threading.Lock())
@@ -0,0 +1,109 @@
+"""
+Off-thread image encoding and asynchronous disk writes
+"""
+
+import io
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import ENCODER_WORKERS, OUTPUT_FORMATS
+from utils.image_formats import available_formats
+
+logger = logging.getLogger(__name__)
+
+
+def encode_image(image, output_format):
+    """Encode a PIL image to bytes in one of OUTPUT_FORMATS"""
+    _, _, pil_format, options = OUTPUT_FORMATS[output_format]
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+class ImageEncoder:
+    """Encodes generated images on a worker pool and writes them to disk in the background
+
+    Encoded bytes are handed back to the caller straight away so responses do
+    not wait for the disk. Until a file is written its bytes stay available
+    through pending(), which lets /images/<filename> serve it in the meantime.
+    """
+
+    def __init__(self, workers=ENCODER_WORKERS):
+        self.encode_pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='image-encoder')
+        self.write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-writer')
+        self.pending_writes = {}
+        self.lock = threading.Lock()
+        self.stats = {name: {'images': 0, 'bytes': 0, 'encode_seconds': 0.0} for name in OUTPUT_FORMATS}
+        self.stats_lock = threading.Lock()
+
+    def submit(self, image, output_format):
+        """Start encoding an image; returns a Future of the encoded bytes"""
+        return self.encode_pool.submit(self._encode, image, output_format)
+
+    def _encode(self, image, output_format):
+        start = time.perf_counter()
+        data = encode_image(image, output_format)
+        elapsed = time.perf_counter() - start
+        with self.stats_lock:
+            stats = self.stats[output_format]
+            stats['images'] += 1
+            stats['bytes'] += len(data)
+            stats['encode_seconds'] += elapsed
+        return data
+
+    def write_async(self, storage, filename, data, mimetype):
+        """Queue a write to an ImageStorage; returns a Future that resolves once the file exists"""
+        with self.lock:
+            self.pending_writes[filename] = (data, mimetype)
+        return self.write_pool.submit(self._write, storage, filename, data)
+
+    def _write(self, storage, filename, data):
+        try:
+            storage.write(filename, data)
+        except Exception as e:
+            logger.error(f"Failed to write image {filename}: {e}")
+            raise
+        finally:
+            with self.lock:
+                self.pending_writes.pop(filename, None)
+
+    def pending(self, filename):
+        """(bytes, mimetype) of an image still waiting to be written, or None"""
+        with self.lock:
+            return self.pending_writes.get(filename)
+
+    def is_pending(self, filename):
+        with self.lock:
+            return filename in self.pending_writes
+
+    def flush(self, timeout=None):
+        """Wait for queued disk writes to finish"""
+        self.write_pool.submit(lambda: None).result(timeout=timeout)
+
+    def get_stats(self):
+        """Per-format counters plus the write backlog"""
+        with self.stats_lock:
+            formats = {
+                name: {
+                    **stats,
+                    'average_bytes': int(stats['bytes'] / stats['images']) if stats['images'] else 0,
+                    'average_encode_ms': round(1000 * stats['encode_seconds'] / stats['images'], 1) if stats['images'] else 0
+                }
+                for name, stats in self.stats.items() if stats['images']
+            }
+        with self.lock:
+            pending = len(self.pending_writes)
+        return {
+            'formats': formats,
+            'available_formats': available_formats(),
+            'pending_writes': pending
+        }
+
+    def shutdown(self):
+        """Finish queued encodes, then the disk writes they led to"""
+        self.encode_pool.shutdown(wait=True)
+        self.flush()
+        self.write_pool.shutdown(wait=True)
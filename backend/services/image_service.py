@@ -9,20 +9,40 @@ import gc
 import torch
 from PIL import Image
 import io
-import glob
 import psutil
 from datetime import datetime
-from diffusers import StableDiffusionPipeline
+from diffusers import StableDiffusionPipeline, StableDiffusionImg2ImgPipeline
 import sys
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import model_loader
+import model_tiers
+import onnx_backend
+from device_pool import DevicePool
+from model_budget import ModelBudget
 from config import *
 import threading
-from concurrent.futures import ThreadPoolExecutor
-import hashlib
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import random
+from services.batch_scheduler import BatchScheduler, GenerationRequest
+from services.result_cache import ResultCache
+from services.embedding_cache import PromptEmbeddingCache
+from services.draft_store import DraftStore
+from services.image_encoder import ImageEncoder, OUTPUT_FORMATS
+from services.image_derivatives import DerivativeStore
+from services.retention import RetentionManager
+from services.image_storage import create_image_storage
+from services import latent_preview
+from services import metrics
+from utils.style_detector import StyleDetector, STYLE_MODEL_IDS
 
 logger = logging.getLogger(__name__)
 
+
+class GenerationCancelled(Exception):
+    """Raised from the step callback once every request in a batch was cancelled"""
+
 # Add this mapping at the top of the file (after imports)
 STYLE_TO_MODEL_KEY = {
     'realistic': 'realistic_vision',
@@ -36,7 +56,55 @@ class ImageService:
         self.model_last_used = {}
         self.generation_lock = threading.Lock()
         self.executor = ThreadPoolExecutor(max_workers=2)
-        self.generation_queue = []
+        # One loader thread keeps the MAX_MODELS_IN_MEMORY accounting exact
+        self.loader_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-loader')
+        self.model_futures = {}
+        # Pipeline calls running per style; eviction leaves their modules on the device until they finish
+        self.model_users = {}
+        self.model_idle = threading.Condition(self.generation_lock)
+        self.model_locks = {}
+        self.pipeline_variants = {}
+        self.loader_stats = {
+            'loads_started': 0,
+            'deduplicated_requests': 0,
+            'failed_loads': 0,
+            'waits_for_running_models': 0,
+            'last_load_seconds': 0
+        }
+        self.active_generations = 0
+        self.active_lock = threading.Lock()
+        self.device_pool = DevicePool()
+        self.model_budget = ModelBudget(devices=[slot.device for slot in self.device_pool.slots])
+        # Device RAM already is host RAM on CPU-only hosts, so they demote straight to disk
+        self.host_tier = model_tiers.HostTier(0 if self.device_pool.cpu_only else HOST_TIER_MB * 1024 * 1024)
+        self.disk_tier = model_tiers.DiskTier(DISK_TIER_MB * 1024 * 1024)
+        self.tier_stats = {
+            'device_hits': 0,
+            'cold_loads': 0
+        }
+        self.batch_scheduler = BatchScheduler(
+            self._generate_batch,
+            workers=max(INFERENCE_WORKERS, len(self.device_pool.slots)),
+            capacity=self.device_pool.capacity
+        )
+        self._configure_worker_threads()
+        self.encoder = ImageEncoder()
+        self.result_cache = ResultCache(is_pending=self.encoder.is_pending)
+        self.embedding_cache = PromptEmbeddingCache()
+        self.draft_store = DraftStore()
+        self.style_detector = StyleDetector()
+        self.routing_stats = {
+            'decisions': 0,
+            'near_ties': 0,
+            'residency_overrides': 0,
+            'swaps_avoided': 0,
+            'cold_routes': 0
+        }
+        self.routing_history = deque(maxlen=ROUTING_HISTORY_SIZE)
+        self.storage = create_image_storage()
+        self.derivatives = DerivativeStore(self.storage)
+        self.retention = RetentionManager(self.storage, on_evict=self.derivatives.remove,
+                                          is_pending=self.encoder.is_pending)
         self.stats = {
             'total_generations': 0,
             'successful_generations': 0,
@@ -44,274 +112,908 @@ class ImageService:
             'average_generation_time': 0,
             'total_generation_time': 0
         }
+        # Requests finish on many threads at once
+        self.stats_lock = threading.Lock()
+        self._register_gauges()
         # Add mongo reference for database operations
         self.mongo = None
 
+    def _configure_worker_threads(self):
+        """Size CPU intra-op threads to one slot's core set so concurrent slots do not oversubscribe"""
+        cpu_slots = [slot for slot in self.device_pool.slots if slot.is_cpu]
+        if not cpu_slots or (len(cpu_slots) == 1 and not INFERENCE_THREADS_PER_WORKER):
+            # A single slot keeps torch's default of every core
+            return
+        threads = INFERENCE_THREADS_PER_WORKER or min(slot.threads for slot in cpu_slots)
+        torch.set_num_threads(threads)
+        logger.info(f"Inference workers: {self.batch_scheduler.workers}, torch threads per call: {threads}")
+
+    def _register_gauges(self):
+        """Gauges read when /metrics is scraped rather than kept up to date on every change"""
+        metrics.QUEUE_DEPTH.set_function(self.batch_scheduler.pending_count)
+        metrics.ACTIVE_GENERATIONS.set_function(lambda: self.active_generations)
+        metrics.MODELS_RESIDENT.set_function(lambda: {
+            ('device',): len(self.model_cache),
+            ('loading',): len(self.model_futures),
+            ('host',): len(self.host_tier.entries)
+        })
+        metrics.MEMORY_BYTES.set_function(self._memory_gauges)
+
+    def _memory_gauges(self):
+        values = {
+            ('process_rss',): psutil.Process().memory_info().rss,
+            ('models_device',): self.model_budget.resident_bytes(dict(self.model_cache))
+        }
+        for device, budget in self.model_budget.budgets.items():
+            values[(f"models_budget:{device}",)] = budget
+        if torch.cuda.is_available():
+            values[('gpu_allocated',)] = torch.cuda.memory_allocated()
+            values[('gpu_reserved',)] = torch.cuda.memory_reserved()
+        return values
+
+    def get_metrics(self):
+        """This process's metrics in the Prometheus text format"""
+        return metrics.registry.render()
+
     def set_mongo(self, mongo):
         """Set MongoDB reference for database operations"""
         self.mongo = mongo
 
     def get_model(self, style):
-        """Get model with enhanced memory management and caching"""
+        """Get model with enhanced memory management and caching
+
+        Warm models are returned immediately; cold ones are loaded on the
+        background loader and this call waits only for its own model.
+        """
+        return self.request_model(style).result()
+
+    def request_model(self, style):
+        """Return a Future for a model, starting at most one background load per cold model"""
         with self.generation_lock:
             self.unload_unused_models()
 
-            if len(self.model_cache) >= MAX_MODELS_IN_MEMORY:
-                if style not in self.model_cache:
-                    lru_style = min(self.model_last_used, key=self.model_last_used.get)
-                    logger.info(f"Unloading LRU model: {lru_style}")
-                    self._unload_model(lru_style)
+            if style in self.model_cache:
+                self.model_last_used[style] = time.time()
+                self.model_budget.hit(style)
+                self.tier_stats['device_hits'] += 1
+                metrics.CACHE_LOOKUPS.inc(cache='model', result='hit')
+                future = Future()
+                future.set_result(self.model_cache[style])
+                return future
 
-            if style not in self.model_cache:
-                logger.info(f"Loading model: {style}")
-                try:
-                    # Map frontend style to backend model key
-                    model_key = STYLE_TO_MODEL_KEY.get(style, style)
-                    self.model_cache[style] = model_loader.load_model(model_key)
-                    logger.info(f"Model {style} loaded successfully")
-                except Exception as e:
-                    logger.error(f"Failed to load model {style}: {e}")
-                    raise
+            future = self.model_futures.get(style)
+            if future is not None:
+                self.loader_stats['deduplicated_requests'] += 1
+                metrics.CACHE_LOOKUPS.inc(cache='model', result='loading')
+                return future
+
+            logger.info(f"Scheduling background load for model: {style}")
+            self.loader_stats['loads_started'] += 1
+            metrics.CACHE_LOOKUPS.inc(cache='model', result='miss')
+            future = self.loader_executor.submit(self._load_model, style)
+            self.model_futures[style] = future
+            return future
+
+    def start_warm_pool(self, styles=WARM_POOL_STYLES):
+        """Preload a configured set of styles in the background"""
+        styles = list(styles)[:MAX_MODELS_IN_MEMORY]
+        for style in styles:
+            self.request_model(style)
+        if styles:
+            logger.info(f"Warm pool preloading: {', '.join(styles)}")
 
+    def _load_model(self, style):
+        """Background loader: make room, load without holding the cache lock, then publish"""
+        try:
+            # Map frontend style to backend model key
+            model_key = STYLE_TO_MODEL_KEY.get(style, style)
+            slot = self.device_pool.place(style)
+            try:
+                with self.generation_lock:
+                    # Admission runs before the load, so a model that cannot fit never starts loading
+                    estimate = self.model_budget.estimate(style, model_key, 2 if slot.device.startswith('cuda') else 4)
+                    victims = []
+                    for victim in self.model_budget.plan_admission(style, estimate, self.model_cache, slot.device,
+                                                                   busy=self.model_users):
+                        logger.info(f"Evicting model {victim} for {style} ({self.model_budget.policy.name} policy)")
+                        victims.append((victim, self._detach_model(victim, 'budget')))
+                # Already on the loader thread: free the victims' memory before loading. Victims
+                # still running a pipeline call are released once it returns.
+                for victim, victim_pipe in victims:
+                    self._release_model(victim, victim_pipe)
+
+                load_start = time.time()
+                pipe = self.host_tier.take(style)
+                source = 'host'
+                if pipe is not None:
+                    logger.info(f"Promoting model {style} from host memory to {slot.name}")
+                    pipe = model_tiers.move_to_device(pipe, slot.device)
+                else:
+                    dtype = self._snapshot_dtype(slot.device)
+                    from_disk = self._disk_tier_usable() and self.disk_tier.has(model_key, dtype, MODEL_PATHS[model_key])
+                    logger.info(f"Loading model: {style}" + (" from its snapshot" if from_disk else ""))
+                    pipe = model_loader.load_model(model_key, device=slot.device)
+                    source = 'snapshot' if from_disk else 'cold'
+                    if from_disk:
+                        self.disk_tier.touch(model_key, dtype, promoted=True)
+                    else:
+                        self.tier_stats['cold_loads'] += 1
+            except Exception:
+                self.device_pool.evict(style)
+                raise
+            load_seconds = time.time() - load_start
+            metrics.MODEL_LOAD_SECONDS.observe(load_seconds, model=style, source=source)
+            self._warm_embeddings(style, pipe)
+            self.loader_stats['last_load_seconds'] = round(load_seconds, 2)
+            logger.info(f"Model {style} loaded successfully")
+        except Exception as e:
+            logger.error(f"Failed to load model {style}: {e}")
+            self.loader_stats['failed_loads'] += 1
+            metrics.FAILURES.inc(stage='model_load')
+            with self.generation_lock:
+                self.model_futures.pop(style, None)
+            raise
+
+        with self.generation_lock:
+            self.model_cache[style] = pipe
             self.model_last_used[style] = time.time()
-            return self.model_cache[style]
+            self.model_budget.loaded(style, pipe, load_seconds, estimate, slot.device)
+            self.model_futures.pop(style, None)
+        return pipe
 
-    def _unload_model(self, style):
-        """Safely unload a model"""
+    @contextmanager
+    def _checkout_model(self, style):
+        """
+        A loaded model and the least-loaded slot holding it. The model counts
+        as running until the block exits, so eviction cannot take its modules
+        off the device in the middle of a pipeline call.
+        """
+        while True:
+            model = self.get_model(style)
+            with self.generation_lock:
+                # Evicted between its load and here: request it again
+                if self.model_cache.get(style) is model:
+                    self.model_users[style] = self.model_users.get(style, 0) + 1
+                    break
         try:
-            if style in self.model_cache:
-                model_loader.unload_model(self.model_cache[style])
-                del self.model_cache[style]
-                del self.model_last_used[style]
-                gc.collect()
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
-                logger.info(f"Model {style} unloaded successfully")
+            with self.device_pool.use(style) as slot:
+                yield model, slot
+        finally:
+            with self.model_idle:
+                self.model_users[style] -= 1
+                if not self.model_users[style]:
+                    del self.model_users[style]
+                    self.model_idle.notify_all()
+
+    def _wait_until_idle(self, style):
+        """Block until no pipeline call is running on a style's modules"""
+        with self.model_idle:
+            if self.model_users.get(style):
+                logger.info(f"Waiting for running generations on {style} before releasing it")
+                self.loader_stats['waits_for_running_models'] += 1
+            while self.model_users.get(style):
+                self.model_idle.wait()
+
+    def _pipeline_variant(self, style, pipe, scheduler_name, slot=None):
+        """
+        Pipeline for `style` sampling with `scheduler_name` on `slot`, sharing
+        the loaded modules. Slots other than the model's home get their own
+        scheduler instance so calls on several CPU slots can overlap.
+        """
+        private = slot is not None and slot is not self.device_pool.home_slot(style)
+        if scheduler_name == 'default' and not private:
+            return pipe
+
+        key = (style, scheduler_name, slot.name if private else None)
+        with self.generation_lock:
+            variant = self.pipeline_variants.get(key)
+            # A reloaded model brings new modules, so rebuild stale variants
+            if variant is None or variant.unet is not pipe.unet:
+                variant = model_loader.with_scheduler(pipe, scheduler_name, private=private)
+                self.pipeline_variants[key] = variant
+            return variant
+
+    def _img2img_variant(self, style, pipe, scheduler_name, slot):
+        """Image-to-image pipeline reusing the modules of a loaded text-to-image pipeline"""
+        key = (style, scheduler_name, slot.name, 'img2img')
+        with self.generation_lock:
+            variant = self.pipeline_variants.get(key)
+            if variant is None or variant.unet is not pipe.unet:
+                variant = StableDiffusionImg2ImgPipeline(**pipe.components, requires_safety_checker=False)
+                self.pipeline_variants[key] = variant
+            return variant
+
+    def _model_lock(self, style, slot):
+        """Lock serializing pipeline calls for one model on one execution slot"""
+        with self.generation_lock:
+            return self.model_locks.setdefault((style, slot.name), threading.Lock())
+
+    def _warm_embeddings(self, style, pipe):
+        """Pre-encode the fixed negative prompt presets for a freshly loaded model"""
+        if not PromptEmbeddingCache.supports(pipe):
+            return
+        try:
+            self.embedding_cache.warm(style, pipe, NEGATIVE_PROMPT_PRESETS.values())
+        except Exception as e:
+            logger.warning(f"Could not pre-warm prompt embeddings for {style}: {e}")
+
+    def _unload_model(self, style, demote=True, reason='idle'):
+        """
+        Take a model off its device (caller holds generation_lock) and queue its
+        demotion, or destruction, on the loader thread
+        """
+        pipe = self._detach_model(style, reason)
+        if pipe is not None:
+            # The loader runs one task at a time, so a later load of this style finds it demoted
+            self.loader_executor.submit(self._release_model, style, pipe, demote)
+
+    def _detach_model(self, style, reason):
+        """Remove a model from the cache and its bookkeeping; returns its pipeline, or None"""
+        if style not in self.model_cache:
+            return None
+        self.embedding_cache.drop_model(style)
+        self.device_pool.evict(style)
+        for key in [key for key in self.pipeline_variants if key[0] == style]:
+            del self.pipeline_variants[key]
+        pipe = self.model_cache.pop(style)
+        del self.model_last_used[style]
+        self.model_budget.evicted(style)
+        metrics.MODEL_EVICTIONS.inc(model=style, reason=reason)
+        return pipe
+
+    def _release_model(self, style, pipe, demote=True):
+        """Demote a detached pipeline to a lower tier, or destroy it; too slow to run under generation_lock"""
+        # Loads run on the loader thread too, so the style cannot be reloaded while this waits
+        self._wait_until_idle(style)
+        try:
+            if demote:
+                self._demote(style, pipe)
+            else:
+                model_loader.unload_model(pipe)
+            del pipe
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            logger.info(f"Model {style} {'demoted' if demote else 'unloaded'} successfully")
         except Exception as e:
             logger.error(f"Error unloading model {style}: {e}")
 
+    @staticmethod
+    def _snapshot_dtype(device):
+        # Matches the dtype model_loader loads with on that device
+        return torch.float16 if str(device).startswith('cuda') else torch.float32
+
+    def _disk_tier_usable(self):
+        """Snapshots exist only for PyTorch float loads with fast-load enabled"""
+        return FAST_LOAD_ENABLED and INFERENCE_BACKEND == 'pytorch' and MODEL_LOAD_MODE != 'quantized'
+
+    def _demote(self, style, pipe):
+        """Move a model leaving its device to host memory, or to its disk snapshot"""
+        if not model_tiers.is_torch_pipeline(pipe):
+            model_loader.unload_model(pipe)
+            return
+        if self.host_tier.enabled:
+            # Modules shared with models still on a device must stay there
+            with self.generation_lock:
+                resident = list(self.model_cache.values())
+            keep = [module for other in resident for module in other.components.values()]
+            model_tiers.move_to_host(pipe, keep, pin=PIN_HOST_MEMORY)
+            for victim, victim_pipe in self.host_tier.put(style, pipe, self.model_budget.sizes.get(style, 0)):
+                self._demote_to_disk(victim, victim_pipe)
+            return
+        self._demote_to_disk(style, pipe)
+
+    def _demote_to_disk(self, style, pipe):
+        """Release a pipeline, keeping (or writing) its snapshot so the next load is a fast one"""
+        if self._disk_tier_usable():
+            model_key = STYLE_TO_MODEL_KEY.get(style, style)
+            self.disk_tier.demote(pipe, model_key, pipe.unet.dtype, MODEL_PATHS[model_key])
+        model_loader.unload_model(pipe)
+
     def unload_unused_models(self):
-        """Unload models that haven't been used recently"""
+        """Unload models idle for longer than their timeout, which grows with request rate and reload cost"""
         current_time = time.time()
         models_to_unload = [
             style for style, last_used in self.model_last_used.items()
-            if current_time - last_used > MODEL_TIMEOUT
+            if current_time - last_used > self.model_budget.idle_timeout(style) and style not in self.model_users
         ]
 
         for style in models_to_unload:
             self._unload_model(style)
 
     def unload_all_models(self):
-        """Unload all models in the cache"""
-        styles = list(self.model_cache.keys())
-        for style in styles:
-            self._unload_model(style)
+        """Unload all models in the cache and the host tier"""
+        with self.generation_lock:
+            detached = [(style, self._detach_model(style, 'unload_all')) for style in list(self.model_cache)]
+        for style, pipe in detached:
+            self._release_model(style, pipe, demote=False)
+        for _, pipe in self.host_tier.drain():
+            model_loader.unload_model(pipe)
 
     def detect_visual_style(self, prompt):
-        """Enhanced style detection with better scoring and caching"""
-        # Create a hash of the prompt for caching
-        prompt_hash = hashlib.md5(prompt.lower().encode()).hexdigest()
-        
-        prompt_lower = prompt.lower()
-        dreamshaper_score = 0
-        realistic_score = 0
-        found_dreamshaper = []
-        found_realistic = []
-
-        # Enhanced keyword scoring
-        for keyword, score in DREAMSHAPER_KEYWORDS.items():
-            if keyword in prompt_lower:
-                dreamshaper_score += score
-                found_dreamshaper.append(f"{keyword} (+{score})")
-
-        for keyword, score in REALISTIC_KEYWORDS.items():
-            if keyword in prompt_lower:
-                realistic_score += score
-                found_realistic.append(f"{keyword} (+{score})")
-
-        # Additional context-based scoring
-        if any(word in prompt_lower for word in ['anime', 'cartoon', 'manga', 'illustration']):
-            dreamshaper_score += 5
-        if any(word in prompt_lower for word in ['photograph', 'photo', 'realistic', 'real']):
-            realistic_score += 5
-
-        logger.info(f"Style detection - Dreamshaper: {dreamshaper_score}, Realistic: {realistic_score}")
-
-        if dreamshaper_score > realistic_score:
-            return ("dreamshaper", "Lykon/dreamshaper-8", dreamshaper_score, realistic_score, found_dreamshaper, found_realistic)
-        else:
-            return ("realistic_vision", "SG161222/Realistic_Vision_V5.1_noVAE", dreamshaper_score, realistic_score, found_dreamshaper, found_realistic)
-
-    def generate_image(self, prompt, style=None, images_dir=IMAGES_DIR, **kwargs):
+        """Pick the model for a prompt from its style keywords; see StyleDetector"""
+        result = self.style_detector.detect(prompt)
+        logger.info(f"Style detection - Dreamshaper: {result[2]}, Realistic: {result[3]}")
+        return result
+
+    def route_style(self, prompt, detection=None):
+        """
+        Auto-detected style for a prompt, preferring a resident model on near ties.
+
+        Below ROUTING_MARGIN the keyword scores say little about which model
+        suits the prompt better, while loading the cold one evicts the other
+        when MAX_MODELS_IN_MEMORY is reached and the next near tie swaps it
+        back. Loaded and loading models count as resident. `detection` is the
+        prompt's StyleDetector result when the caller already has it.
+        """
+        detected, _, dreamshaper_score, realistic_score, _, _ = detection or self.detect_visual_style(prompt)
+        margin = abs(dreamshaper_score - realistic_score)
+        with self.generation_lock:
+            # Cache keys may be frontend aliases ('realistic'); compare model keys
+            loaded = list(self.model_cache) + list(self.model_futures)
+            full = len(loaded) >= MAX_MODELS_IN_MEMORY
+        resident = {}
+        for key in loaded:
+            resident.setdefault(STYLE_TO_MODEL_KEY.get(key, key), key)
+
+        style = detected
+        near_tie = margin < ROUTING_MARGIN
+        if RESIDENCY_ROUTING_ENABLED and near_tie and detected not in resident:
+            alternatives = [candidate for candidate in STYLE_MODEL_IDS if candidate != detected and candidate in resident]
+            if alternatives:
+                style = alternatives[0]
+
+        with self.stats_lock:
+            self.routing_stats['decisions'] += 1
+            self.routing_stats['near_ties'] += near_tie
+            if style != detected:
+                self.routing_stats['residency_overrides'] += 1
+                # Only with a full cache would the detected model have evicted another
+                self.routing_stats['swaps_avoided'] += full
+            elif style not in resident:
+                self.routing_stats['cold_routes'] += 1
+            self.routing_history.append({
+                'detected': detected,
+                'routed': style,
+                'dreamshaper_score': dreamshaper_score,
+                'realistic_score': realistic_score,
+                'margin': margin,
+                'resident': sorted(resident),
+                'at': time.time()
+            })
+        # Reuse the loaded entry under whichever key it was loaded with
+        return resident.get(style, style)
+
+    def _prepare_generation(self, prompt, style=None, detection=None, **kwargs):
+        """Resolve the model style and pipeline settings for a request"""
+        # Auto-detect style if not provided
+        if style is None:
+            style = self.route_style(prompt, detection)
+            logger.info(f"Auto-detected style: {style}")
+
+        # Quality presets set the output size and full-quality step count
+        quality = QUALITY_PRESETS.get(kwargs.get('quality'), {})
+        width = kwargs.get('width', quality.get('width', IMAGE_SIZE))
+        height = kwargs.get('height', quality.get('height', IMAGE_SIZE))
+        steps = kwargs.get('num_inference_steps', quality.get('steps'))
+        draft = kwargs.get('draft', False)
+
+        # Speed modes pick the sampler and its default step count
+        speed_mode_name = kwargs.get('speed_mode', DRAFT_SPEED_MODE if draft else None)
+        speed_mode = SPEED_MODES.get(speed_mode_name, {'scheduler': 'default', 'steps': DEFAULT_INFERENCE_STEPS})
+
+        params = {
+            "negative_prompt": kwargs.get('negative_prompt', NEGATIVE_PROMPT_PRESETS['default']),
+            "num_inference_steps": speed_mode['steps'] if draft or steps is None else steps,
+            "scheduler": kwargs.get('scheduler', speed_mode['scheduler']),
+            "guidance_scale": kwargs.get('guidance_scale', quality.get('guidance_scale', DEFAULT_GUIDANCE_SCALE)),
+            "width": width,
+            "height": height,
+            "seed": kwargs.get('seed'),
+            "output_format": kwargs.get('output_format', OUTPUT_FORMAT),
+            "use_cache": CACHE_ENABLED and kwargs.get('use_cache', True)
+        }
+
+        if draft:
+            # Denoise at a reduced size and remember the target for the refine pass
+            scale = min(1.0, DRAFT_MAX_SIZE / max(width, height))
+            params.update({
+                "width": max(64, int(width * scale) // 8 * 8),
+                "height": max(64, int(height * scale) // 8 * 8),
+                "draft": True,
+                "target_width": width,
+                "target_height": height,
+                "target_steps": steps or DEFAULT_INFERENCE_STEPS,
+                # Cached results carry no latents to refine from
+                "use_cache": False
+            })
+
+        if params["seed"] is None:
+            # Derive the seed from the request itself so identical requests
+            # produce identical images and can be served from the result cache
+            if params["use_cache"]:
+                params["seed"] = ResultCache.seed_for_key(self._cache_key(style, prompt, params))
+            else:
+                params["seed"] = random.randrange(2 ** 32)
+
+        return style, params
+
+    def _cache_key(self, style, prompt, params):
+        """Result cache key, with frontend style aliases folded onto model keys"""
+        return ResultCache.make_key(STYLE_TO_MODEL_KEY.get(style, style), prompt, params)
+
+    def _cached_result(self, style, prompt, params):
+        """Return the stored result of an identical earlier request, if any"""
+        if not params["use_cache"]:
+            return None
+
+        start_time = time.time()
+        entry = self.result_cache.get(self._cache_key(style, prompt, params))
+        metrics.CACHE_LOOKUPS.inc(cache='result', result='miss' if entry is None else 'hit')
+        if entry is None:
+            return None
+
+        logger.info(f"Result cache hit for {style}: {entry['filename']}")
+        return {
+            "success": True,
+            "filename": entry['filename'],
+            "filepath": entry['filepath'],
+            "style": entry['style'],
+            "prompt": entry['prompt'],
+            "timestamp": entry['timestamp'],
+            "metadata": {**entry['metadata'], "cache_hit": True},
+            "generation_time": time.time() - start_time
+        }
+
+    def generate_image(self, prompt, style=None, images_dir=IMAGES_DIR, progress_callback=None,
+                       preview_callback=None, cancel_event=None, **kwargs):
         """
         Enhanced image generation with better error handling and performance
+
+        progress_callback, if given, is called as progress_callback(step, total_steps)
+        after every denoising step. preview_callback is called as
+        preview_callback(step, jpeg_bytes) every PREVIEW_INTERVAL steps with a
+        cheap approximation of the image so far. Setting cancel_event (a
+        threading.Event) stops the generation at the next step.
+        """
+        if not prompt or not prompt.strip():
+            return {
+                "success": False,
+                "error": "Prompt is required"
+            }
+
+        prompt = prompt.strip()
+        style, params = self._prepare_generation(prompt, style, **kwargs)
+        cached = self._cached_result(style, prompt, params)
+        if cached is not None:
+            return cached
+
+        request = GenerationRequest(prompt, params, progress_callback, preview_callback, cancel_event)
+        return self._generate_batch(style, [request], images_dir)[0]
+
+    def schedule_generation(self, prompt, style=None, progress_callback=None, preview_callback=None,
+                            cancel_event=None, **kwargs):
+        """
+        Generate an image through the micro-batching scheduler, so that
+        concurrent compatible requests share a single pipeline call
         """
+        if not BATCHING_ENABLED:
+            return self.generate_image(prompt, style, progress_callback=progress_callback,
+                                       preview_callback=preview_callback, cancel_event=cancel_event, **kwargs)
+
+        if not prompt or not prompt.strip():
+            return {
+                "success": False,
+                "error": "Prompt is required"
+            }
+
+        prompt = prompt.strip()
+        style, params = self._prepare_generation(prompt, style, **kwargs)
+        cached = self._cached_result(style, prompt, params)
+        if cached is not None:
+            return cached
+
+        # Start a cold model loading while the request waits in the batch window
+        self.request_model(style)
+        future = self.batch_scheduler.submit(style, prompt, params, progress_callback, preview_callback, cancel_event)
+
+        try:
+            return future.result(timeout=GENERATION_TIMEOUT)
+        except FutureTimeoutError:
+            logger.error(f"Scheduled generation timed out after {GENERATION_TIMEOUT}s: {prompt[:100]}...")
+            return {
+                "success": False,
+                "error": ERROR_MESSAGES['generation_failed']
+            }
+        except Exception as e:
+            logger.error(f"Scheduled generation failed: {e}")
+            return {
+                "success": False,
+                "error": str(e)
+            }
+
+    def _generate_batch(self, style, requests, images_dir=IMAGES_DIR):
+        """
+        Generate images for requests sharing one batch key in a single
+        pipeline call and return one result dict per request
+        """
+        if any(request.cancelled for request in requests):
+            # Drop requests cancelled while queued before paying for the batch
+            live = [request for request in requests if not request.cancelled]
+            results = iter(self._generate_batch(style, live, images_dir) if live else [])
+            return [self._cancelled_result() if request.cancelled else next(results) for request in requests]
+
         start_time = time.time()
         generation_id = f"gen_{int(start_time)}"
-        
+        params = requests[0].params
+
         try:
-            logger.info(f"Starting image generation {generation_id}: {prompt[:100]}...")
-            
-            # Validate inputs
-            
-            if not prompt or not prompt.strip():
-                return {
-                    "success": False,
-                    "error": "Prompt is required"
+            logger.info(f"Starting image generation {generation_id}: {len(requests)} prompt(s), first: {requests[0].prompt[:100]}...")
+
+            # Get model and the least-loaded execution slot holding it; it stays
+            # on its device until the pipeline call returns
+            with self._checkout_model(style) as (model, slot):
+                pipe = self._pipeline_variant(style, model, params['scheduler'], slot)
+                logger.info(f"Using model: {style} on {slot.name} (scheduler: {params['scheduler']})")
+
+                # Models stay on the device they were placed on; ONNX Runtime
+                # sessions run on their execution provider
+                device = "cpu" if onnx_backend.is_onnx_pipeline(pipe) else slot.device
+
+                # Enhanced generation parameters
+                generation_kwargs = {
+                    "prompt": [request.prompt for request in requests],
+                    "negative_prompt": [request.params['negative_prompt'] for request in requests],
+                    "num_inference_steps": params['num_inference_steps'],
+                    "guidance_scale": params['guidance_scale'],
+                    "width": params['width'],
+                    "height": params['height'],
+                    "num_images_per_prompt": 1,
+                    # One seeded generator per prompt keeps results independent of batching
+                    "generator": [torch.Generator(device=device).manual_seed(request.params['seed']) for request in requests]
                 }
-            
-            prompt = prompt.strip()
-            
-            # Auto-detect style if not provided
-            if style is None:
-                style, model_path, dreamshaper_score, realistic_score, found_dreamshaper, found_realistic = self.detect_visual_style(prompt)
-                logger.info(f"Auto-detected style: {style} (dreamshaper: {dreamshaper_score}, realistic: {realistic_score})")
-
-            # Get model
-            pipe = self.get_model(style)
-            logger.info(f"Using model: {style}")
-
-            # Enhanced generation parameters
-            generation_kwargs = {
-                "prompt": prompt,
-                "negative_prompt": kwargs.get('negative_prompt', "blurry, low quality, distorted, deformed, ugly, bad anatomy"),
-                "num_inference_steps": kwargs.get('num_inference_steps', DEFAULT_INFERENCE_STEPS),
-                "guidance_scale": kwargs.get('guidance_scale', DEFAULT_GUIDANCE_SCALE),
-                "width": kwargs.get('width', IMAGE_SIZE),
-                "height": kwargs.get('height', IMAGE_SIZE),
-                "num_images_per_prompt": 1
-            }
 
-            # Device management
-            device = "cuda:1" if torch.cuda.device_count() > 1 else ("cuda" if torch.cuda.is_available() else "cpu")
-            if pipe.device.type != device:
-                logger.info(f"Moving model to device: {device}")
-                pipe = pipe.to(device)
+                callback = self._step_callback(requests, params['num_inference_steps'])
+                if callback is not None:
+                    generation_kwargs["callback_on_step_end"] = callback
 
-            # Generate image
-            logger.info(f"Generating image with parameters: {generation_kwargs}")
-            result = pipe(**generation_kwargs)
-            
-            if not result.images or len(result.images) == 0:
-                return {
+                # Generate images
+                logger.info(f"Generating image with parameters: {generation_kwargs}")
+
+                if onnx_backend.is_onnx_pipeline(pipe):
+                    generation_kwargs = onnx_backend.adapt_call_kwargs(
+                        pipe, generation_kwargs, [request.params['seed'] for request in requests])
+
+                # Reuse cached text-encoder outputs instead of re-encoding every prompt
+                if PromptEmbeddingCache.supports(pipe):
+                    generation_kwargs["prompt_embeds"] = self.embedding_cache.get_embeddings(
+                        style, pipe, generation_kwargs.pop("prompt"))
+                    generation_kwargs["negative_prompt_embeds"] = self.embedding_cache.get_embeddings(
+                        style, pipe, generation_kwargs.pop("negative_prompt"))
+
+                # Pipelines keep per-call scheduler state, so one call per model and
+                # slot at a time; other models and slots run concurrently
+                with self._model_lock(style, slot):
+                    with self.active_lock:
+                        self.active_generations += len(requests)
+                    try:
+                        result = slot.run(pipe, **generation_kwargs)
+                    finally:
+                        with self.active_lock:
+                            self.active_generations -= len(requests)
+
+            if not result.images or len(result.images) < len(requests):
+                return [{
                     "success": False,
                     "error": "No image was generated"
-                }
-            
-            image = result.images[0]
+                } for _ in requests]
+
             generation_time = time.time() - start_time
+            os.makedirs(images_dir, exist_ok=True)
 
-            # Generate filename with timestamp and style
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"generated_{timestamp}_{style}.png"
-            filepath = os.path.join(images_dir, filename)
+            # Encode batch members in parallel on the encoder pool
+            encoded = [
+                None if request.cancelled else self.encoder.submit(result.images[index], request.params['output_format'])
+                for index, request in enumerate(requests)
+            ]
 
-            # Ensure directory exists
-            os.makedirs(images_dir, exist_ok=True)
+            def save(index):
+                request = requests[index]
+                if encoded[index] is None:
+                    return self._cancelled_result()
+                item_id = generation_id if len(requests) == 1 else f"{generation_id}_{index}"
+                saved = self._save_result(
+                    result.images[index], style, request, generation_kwargs,
+                    generation_time, device, item_id, images_dir, len(requests), encoded[index]
+                )
+                if saved['success'] and request.draft_latents is not None:
+                    saved['draft_id'] = self.draft_store.put(style, request.prompt, request.params, request.draft_latents)
+                return saved
 
-            # Save image with optimization
-            try:
-                image.save(filepath, "PNG", optimize=True, quality=95)
-                file_size = os.path.getsize(filepath)
-                logger.info(f"Image saved: {filename} ({file_size} bytes)")
-            except Exception as e:
-                logger.error(f"Failed to save image: {e}")
-                return {
-                    "success": False,
-                    "error": f"Failed to save image: {str(e)}"
-                }
+            return [save(index) for index in range(len(requests))]
+
+        except GenerationCancelled:
+            logger.info(f"Image generation {generation_id} cancelled")
+            return [self._cancelled_result() for _ in requests]
+
+        except Exception as e:
+            generation_time = time.time() - start_time
+            for _ in requests:
+                self._update_stats(style, generation_time, False)
+
+            logger.error(f"Error in image generation {generation_id}: {e}")
+
+            # Other models (and other batches of this one) keep running; only a
+            # CUDA OOM frees the failing model's memory
+            if self._is_out_of_memory(e):
+                with self.generation_lock:
+                    self._unload_model(style, demote=False, reason='oom')
+
+            error_message = "Model loading issue. Please try again." if "meta tensor" in str(e).lower() else str(e)
+            return [{
+                "success": False,
+                "error": error_message,
+                "generation_time": generation_time
+            } for _ in requests]
+
+    @staticmethod
+    def _is_out_of_memory(error):
+        oom_error = getattr(torch.cuda, 'OutOfMemoryError', None)
+        return (oom_error is not None and isinstance(error, oom_error)) or 'cuda out of memory' in str(error).lower()
 
-            # Update statistics
-            self._update_stats(generation_time, True)
-
-            # Enhanced metadata
-            metadata = {
-                "model": style,
-                "steps": generation_kwargs['num_inference_steps'],
-                "guidance_scale": generation_kwargs['guidance_scale'],
-                "size": f"{generation_kwargs['width']}x{generation_kwargs['height']}",
-                "generation_time": f"{generation_time:.2f}s",
-                "device": device,
-                "file_size": file_size,
-                "prompt_length": len(prompt),
-                "generation_id": generation_id
+    def _step_callback(self, requests, total_steps):
+        """
+        Build a diffusers step callback fanning progress and previews out to
+        every request in a batch, and stopping the call once all are cancelled
+        """
+        callbacks = [request.progress_callback for request in requests if request.progress_callback]
+        previews = [(index, request) for index, request in enumerate(requests) if request.preview_callback]
+        drafts = [(index, request) for index, request in enumerate(requests) if request.params.get('draft')]
+        cancellable = any(request.cancel_event is not None for request in requests)
+        if not callbacks and not previews and not drafts and not cancellable:
+            return None
+
+        def on_step_end(pipe, step, timestep, callback_kwargs):
+            if cancellable and all(request.cancelled for request in requests):
+                raise GenerationCancelled()
+
+            for callback in callbacks:
+                try:
+                    callback(step + 1, total_steps)
+                except Exception as e:
+                    logger.warning(f"Progress callback failed: {e}")
+
+            if previews and PREVIEW_INTERVAL > 0 and (step + 1) % PREVIEW_INTERVAL == 0 and step + 1 < total_steps:
+                self._send_previews(previews, callback_kwargs['latents'], step + 1)
+
+            if drafts and step + 1 == total_steps:
+                # Keep the final latents before the VAE decode for refine_draft
+                for index, request in drafts:
+                    request.draft_latents = callback_kwargs['latents'][index:index + 1]
+            return callback_kwargs
+
+        return on_step_end
+
+    def refine_draft(self, draft_id, images_dir=IMAGES_DIR, strength=REFINE_STRENGTH):
+        """
+        Turn a kept draft into the full-size image: upscale its final latents
+        to the target size and run a short image-to-image pass over them,
+        so only `strength` of the target step count is denoised at full size
+        """
+        draft = self.draft_store.get(draft_id)
+        if draft is None:
+            return {
+                "success": False,
+                "error": "Draft not found or expired"
             }
 
-            logger.info(f"Image generation {generation_id} completed successfully in {generation_time:.2f}s")
+        style, prompt, params = draft['style'], draft['prompt'], draft['params']
+        width, height = params['target_width'], params['target_height']
+        start_time = time.time()
+        generation_id = f"refine_{int(start_time)}"
+
+        try:
+            logger.info(f"Refining draft {draft_id} to {width}x{height} (strength {strength})")
+            with self._checkout_model(style) as (model, slot):
+                if onnx_backend.is_onnx_pipeline(model):
+                    return {
+                        "success": False,
+                        "error": "Refining drafts is not supported by the ONNX backend"
+                    }
+                pipe = self._pipeline_variant(style, model, params['scheduler'], slot)
+                refiner = self._img2img_variant(style, pipe, params['scheduler'], slot)
+                device = slot.device
+
+                latents = draft['latents'].to(device=pipe.device, dtype=pipe.unet.dtype)
+                latents = torch.nn.functional.interpolate(latents, size=(height // 8, width // 8), mode='bicubic')
+
+                generation_kwargs = {
+                    # Four-channel input is taken as initial latents, skipping the VAE encode
+                    "image": latents,
+                    "strength": strength,
+                    "num_inference_steps": params['target_steps'],
+                    "guidance_scale": params['guidance_scale'],
+                    "generator": torch.Generator(device=device).manual_seed(params['seed'])
+                }
+                if PromptEmbeddingCache.supports(pipe):
+                    generation_kwargs["prompt_embeds"] = self.embedding_cache.get_embeddings(style, pipe, [prompt])
+                    generation_kwargs["negative_prompt_embeds"] = self.embedding_cache.get_embeddings(
+                        style, pipe, [params['negative_prompt']])
+                else:
+                    generation_kwargs["prompt"] = prompt
+                    generation_kwargs["negative_prompt"] = params['negative_prompt']
+
+                with self._model_lock(style, slot):
+                    with self.active_lock:
+                        self.active_generations += 1
+                    try:
+                        result = slot.run(refiner, **generation_kwargs)
+                    finally:
+                        with self.active_lock:
+                            self.active_generations -= 1
 
+            request = GenerationRequest(prompt, {**params, "width": width, "height": height, "use_cache": False})
+            os.makedirs(images_dir, exist_ok=True)
+            saved = self._save_result(
+                result.images[0], style, request, {**generation_kwargs, "width": width, "height": height},
+                time.time() - start_time, device, generation_id, images_dir, 1
+            )
+            if saved['success']:
+                saved['metadata'].update({"refined_from": draft_id, "strength": strength})
+            return saved
+
+        except Exception as e:
+            generation_time = time.time() - start_time
+            self._update_stats(style, generation_time, False)
+            logger.error(f"Error refining draft {draft_id}: {e}")
             return {
-                "success": True,
-                "filename": filename,
-                "filepath": filepath,
-                "style": style,
-                "prompt": prompt,
-                "timestamp": timestamp,
-                "metadata": metadata,
+                "success": False,
+                "error": str(e),
                 "generation_time": generation_time
             }
 
+    def _send_previews(self, previews, latents, step):
+        """Decode the batch latents approximately and hand each request its JPEG preview"""
+        try:
+            images = latent_preview.latents_to_images(latents[[index for index, _ in previews]])
         except Exception as e:
-            generation_time = time.time() - start_time
-            self._update_stats(generation_time, False)
-            
-            logger.error(f"Error in image generation {generation_id}: {e}")
-            
-            # Cleanup on error
-            self.unload_all_models()
-            gc.collect()
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
+            logger.warning(f"Preview decoding failed: {e}")
+            return
 
-            error_message = "Model loading issue. Please try again." if "meta tensor" in str(e).lower() else str(e)
+        for image, (_, request) in zip(images, previews):
+            if request.cancelled:
+                continue
+            try:
+                request.preview_callback(step, latent_preview.encode_preview(image, PREVIEW_MAX_SIZE, PREVIEW_JPEG_QUALITY))
+            except Exception as e:
+                logger.warning(f"Preview callback failed: {e}")
+
+    @staticmethod
+    def _cancelled_result():
+        return {
+            "success": False,
+            "cancelled": True,
+            "error": ERROR_MESSAGES['generation_cancelled']
+        }
+
+    def _save_result(self, image, style, request, generation_kwargs, generation_time, device, generation_id, images_dir,
+                     batch_size, encoded=None):
+        """
+        Encode one generated image, queue its disk write and build its result
+        dict; `encoded` is a Future from self.encoder.submit when the caller
+        started encoding already
+        """
+        output_format = request.params.get('output_format', OUTPUT_FORMAT)
+        extension, mimetype, _, _ = OUTPUT_FORMATS[output_format]
+
+        # A uuid filename cannot collide with concurrent generations
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        in_images_dir = os.path.abspath(images_dir) == os.path.abspath(IMAGES_DIR)
+        storage = self.storage if in_images_dir else create_image_storage(images_dir)
+        filename = storage.new_filename(style, extension)
+        filepath = storage.path(filename)
+
+        try:
+            image_bytes = (encoded or self.encoder.submit(image, output_format)).result()
+            file_size = len(image_bytes)
+            # The response does not wait for the disk; the bytes are served from memory until written
+            self.encoder.write_async(storage, filename, image_bytes, mimetype)
+            logger.info(f"Image encoded: {filename} ({file_size} bytes)")
+            if in_images_dir:
+                self.retention.add(filename, file_size)
+                if DERIVATIVES_ON_SAVE:
+                    # Gallery thumbnails are ready before the first page load asks for them
+                    self.executor.submit(self.derivatives.create_all, filename, image)
+        except Exception as e:
+            logger.error(f"Failed to save image: {e}")
+            metrics.FAILURES.inc(stage='save')
+            self._update_stats(style, generation_time, False)
             return {
                 "success": False,
-                "error": error_message,
-                "generation_time": generation_time
+                "error": f"Failed to save image: {str(e)}"
             }
 
-    def _update_stats(self, generation_time, success):
+        # Update statistics
+        self._update_stats(style, generation_time, True)
+
+        # Enhanced metadata
+        metadata = {
+            "model": style,
+            "steps": generation_kwargs['num_inference_steps'],
+            "scheduler": request.params['scheduler'],
+            "guidance_scale": generation_kwargs['guidance_scale'],
+            "size": f"{generation_kwargs['width']}x{generation_kwargs['height']}",
+            "generation_time": f"{generation_time:.2f}s",
+            "device": device,
+            "file_size": file_size,
+            "prompt_length": len(request.prompt),
+            "generation_id": generation_id,
+            "batch_size": batch_size,
+            "seed": request.params['seed'],
+            "output_format": output_format
+        }
+
+        logger.info(f"Image generation {generation_id} completed successfully in {generation_time:.2f}s")
+
+        result = {
+            "success": True,
+            "filename": filename,
+            "filepath": filepath,
+            "style": style,
+            "prompt": request.prompt,
+            "timestamp": timestamp,
+            "metadata": metadata,
+            "generation_time": generation_time,
+            "image_bytes": image_bytes,
+            "mimetype": mimetype
+        }
+        if request.params['use_cache']:
+            # The encoded bytes live in the file once written; do not keep a second copy in the cache
+            cached = {key: value for key, value in result.items() if key != 'image_bytes'}
+            self.result_cache.put(self._cache_key(style, request.prompt, request.params), cached)
+        return result
+
+    def _update_stats(self, style, generation_time, success):
         """Update generation statistics"""
-        self.stats['total_generations'] += 1
-        self.stats['total_generation_time'] += generation_time
-        
-        if success:
-            self.stats['successful_generations'] += 1
-        else:
-            self.stats['failed_generations'] += 1
-        
-        # Calculate average generation time
-        if self.stats['total_generations'] > 0:
+        metrics.GENERATION_SECONDS.observe(generation_time, model=style, outcome='success' if success else 'failure')
+        if not success:
+            metrics.FAILURES.inc(stage='generation')
+
+        with self.stats_lock:
+            self.stats['total_generations'] += 1
+            self.stats['total_generation_time'] += generation_time
+
+            if success:
+                self.stats['successful_generations'] += 1
+            else:
+                self.stats['failed_generations'] += 1
+
+            # Calculate average generation time
             self.stats['average_generation_time'] = self.stats['total_generation_time'] / self.stats['total_generations']
 
+    def get_generation_stats(self):
+        """Totals plus per-model latency percentiles of recent generations"""
+        with self.stats_lock:
+            stats = dict(self.stats)
+        stats['latency'] = metrics.GENERATION_SECONDS.summary()
+        stats['model_load_latency'] = metrics.MODEL_LOAD_SECONDS.summary()
+        return stats
+
+    def get_pending_image(self, filename):
+        """(bytes, mimetype) of a generated image whose disk write is still queued, or None"""
+        return self.encoder.pending(filename)
+
+    def start_retention(self, interval=CLEANUP_INTERVAL):
+        """Enforce MAX_IMAGES_TO_KEEP and MAX_IMAGES_MB every CLEANUP_INTERVAL seconds in the background"""
+        self.retention.start(interval)
+
     def cleanup_old_images(self, max_images=MAX_IMAGES_TO_KEEP):
-        """Enhanced image cleanup with better error handling"""
+        """Remove the oldest images beyond `max_images` or the byte budget; returns the number removed"""
         try:
-            logger.info(f"Starting image cleanup (max: {max_images})")
-            
-            image_files = []
-            for ext in ["*.png", "*.jpg", "*.jpeg", "*.webp"]:
-                image_files.extend(glob.glob(os.path.join(IMAGES_DIR, ext)))
-
-            if len(image_files) > max_images:
-                # Sort by modification time (oldest first)
-                image_files.sort(key=os.path.getmtime)
-                files_to_remove = image_files[:-max_images]
-                
-                removed_count = 0
-                for old_file in files_to_remove:
-                    try:
-                        os.remove(old_file)
-                        removed_count += 1
-                        logger.info(f"Removed old image: {os.path.basename(old_file)}")
-                    except Exception as e:
-                        logger.error(f"Failed to remove {old_file}: {e}")
-                
-                logger.info(f"Image cleanup completed: {removed_count} files removed")
-            else:
-                logger.info("No cleanup needed - image count within limits")
-                
+            return self.retention.enforce(max_images=max_images)
         except Exception as e:
             logger.error(f"Error during image cleanup: {e}")
+            return 0
 
     def get_memory_usage(self):
         """Enhanced memory usage monitoring"""
@@ -334,7 +1036,25 @@ class ImageService:
                 "gpu_memory_allocated_mb": round(gpu_memory_allocated, 2),
                 "gpu_memory_reserved_mb": round(gpu_memory_reserved, 2),
                 "models_loaded": len(self.model_cache),
-                "generation_stats": self.stats
+                "generation_stats": self.get_generation_stats(),
+                "result_cache": self.result_cache.get_stats(),
+                "embedding_cache": self.embedding_cache.get_stats(),
+                "draft_store": self.draft_store.get_stats(),
+                "style_detector": self.style_detector.get_stats(),
+                "encoder": self.encoder.get_stats(),
+                "derivatives": self.derivatives.get_stats(),
+                "retention": self.retention.get_stats(),
+                "shared_components": model_loader.component_registry.get_stats(),
+                "model_budget": self.model_budget.get_status(dict(self.model_cache)),
+                "tiers": {
+                    "device": {
+                        "hits": self.tier_stats['device_hits'],
+                        "models": sorted(self.model_cache)
+                    },
+                    "host": self.host_tier.get_stats(),
+                    "disk": self.disk_tier.get_stats(),
+                    "cold_loads": self.tier_stats['cold_loads']
+                }
             }
         except Exception as e:
             logger.error(f"Error getting memory usage: {e}")
@@ -356,6 +1076,10 @@ class ImageService:
             disk_usage = psutil.disk_usage(IMAGES_DIR)
             disk_free_gb = disk_usage.free / (1024**3)
             
+            with self.stats_lock:
+                routing_stats = dict(self.routing_stats)
+                routing_history = list(self.routing_history)
+
             # Check if models are accessible
             models_status = {}
             for style in ['realistic_vision', 'dreamshaper']:
@@ -363,10 +1087,37 @@ class ImageService:
             
             return {
                 "status": "healthy",
+                "inference_backend": INFERENCE_BACKEND,
+                "model_load_mode": MODEL_LOAD_MODE,
                 "memory_usage": memory_usage,
                 "disk_free_gb": round(disk_free_gb, 2),
                 "models_status": models_status,
-                "active_generations": len(self.generation_queue),
+                "routing": {
+                    **routing_stats,
+                    "enabled": RESIDENCY_ROUTING_ENABLED,
+                    "margin": ROUTING_MARGIN,
+                    "recent": routing_history
+                },
+                "model_loading": {
+                    **self.loader_stats,
+                    "in_flight": sorted(self.model_futures)
+                },
+                "active_generations": self.active_generations,
+                "batching": {
+                    **self.batch_scheduler.stats,
+                    "enabled": BATCHING_ENABLED,
+                    "max_batch_size": self.batch_scheduler.max_batch_size,
+                    "max_wait_ms": int(self.batch_scheduler.max_wait * 1000),
+                    "pending_requests": self.batch_scheduler.pending_count()
+                },
+                "devices": self.device_pool.get_status(),
+                "workers": {
+                    "inference_workers": self.batch_scheduler.workers,
+                    "active_workers": self.batch_scheduler.active_workers(),
+                    "queue_depth": self.batch_scheduler.pending_count(),
+                    "busy_models": self.batch_scheduler.busy_styles(),
+                    "torch_threads": torch.get_num_threads()
+                },
                 "uptime": time.time() - getattr(self, '_start_time', time.time())
             }
         except Exception as e:
@@ -376,26 +1127,98 @@ class ImageService:
                 "error": str(e)
             }
 
-    def batch_generate(self, prompts, style=None, **kwargs):
-        """Generate multiple images in batch"""
-        results = []
-        
-        for i, prompt in enumerate(prompts):
-            logger.info(f"Batch generation {i+1}/{len(prompts)}: {prompt[:50]}...")
-            result = self.generate_image(prompt, style, **kwargs)
-            results.append(result)
-            
-            # Small delay between generations to prevent overload
-            if i < len(prompts) - 1:
-                time.sleep(1)
-        
+    def _max_batch_for_memory(self, width, height, style=None):
+        """Largest chunk of prompts that fits in the currently free memory of the model's slot"""
+        try:
+            slot = self.device_pool.home_slot(style) or self.device_pool.slots[0]
+            if slot.device.startswith("cuda"):
+                free_mb = torch.cuda.mem_get_info(torch.device(slot.device))[0] / 1024 / 1024
+            else:
+                free_mb = psutil.virtual_memory().available / 1024 / 1024
+        except Exception as e:
+            logger.warning(f"Could not read free memory, using single-image batches: {e}")
+            return 1
+
+        # Activation memory grows with the pixel count of each image
+        per_image_mb = BATCH_MEMORY_PER_IMAGE_MB * (width * height) / (512 * 512)
+        return max(1, min(BATCH_GENERATE_MAX_CHUNK, int(free_mb // per_image_mb)))
+
+    def batch_generate(self, prompts, style=None, images_dir=IMAGES_DIR, **kwargs):
+        """
+        Generate multiple images in batch. Prompts are grouped by style so
+        each model is loaded once, and each group runs as batched pipeline
+        calls sized to the available memory. Results keep the prompt order.
+        """
+        results = [None] * len(prompts)
+        # Detect the styles of the whole batch in one pass instead of prompt by prompt
+        stripped = [prompt.strip() if prompt else '' for prompt in prompts]
+        detections = iter(self.style_detector.detect_batch([prompt for prompt in stripped if prompt])
+                          if style is None else ())
+
+        # style -> batch key -> [(index, request)]
+        groups = {}
+        for index, prompt in enumerate(stripped):
+            if not prompt:
+                results[index] = {
+                    "success": False,
+                    "error": "Prompt is required"
+                }
+                continue
+
+            detection = next(detections, None)
+            prompt_style, params = self._prepare_generation(prompt, style, detection, **kwargs)
+            cached = self._cached_result(prompt_style, prompt, params)
+            if cached is not None:
+                results[index] = cached
+                continue
+
+            key = BatchScheduler.batch_key(prompt_style, params)
+            groups.setdefault(prompt_style, {}).setdefault(key, []).append(
+                (index, GenerationRequest(prompt, params))
+            )
+
+        for prompt_style, keyed_groups in groups.items():
+            # Load the model up front so the memory sizing below accounts for it
+            try:
+                self.get_model(prompt_style)
+            except Exception as e:
+                logger.error(f"Batch generation could not load {prompt_style}: {e}")
+                for members in keyed_groups.values():
+                    for index, _ in members:
+                        results[index] = {
+                            "success": False,
+                            "error": ERROR_MESSAGES['model_loading_error']
+                        }
+                continue
+
+            for key, members in keyed_groups.items():
+                params = members[0][1].params
+                chunk_size = self._max_batch_for_memory(params['width'], params['height'], prompt_style)
+                logger.info(f"Batch generation for {prompt_style}: {len(members)} prompt(s) in chunks of {chunk_size}")
+
+                for offset in range(0, len(members), chunk_size):
+                    chunk = members[offset:offset + chunk_size]
+                    chunk_results = self._generate_batch(prompt_style, [request for _, request in chunk], images_dir)
+                    for (index, _), result in zip(chunk, chunk_results):
+                        results[index] = result
+
         return results
 
     def __del__(self):
         """Cleanup on service shutdown"""
         try:
+            if hasattr(self, 'batch_scheduler'):
+                self.batch_scheduler.shutdown()
             self.unload_all_models()
             if hasattr(self, 'executor'):
                 self.executor.shutdown(wait=True)
+            if hasattr(self, 'retention'):
+                self.retention.stop()
+            if hasattr(self, 'encoder'):
+                self.encoder.shutdown()
+            if hasattr(self, 'loader_executor'):
+                self.loader_executor.shutdown(wait=False)
+            if hasattr(self, 'device_pool'):
+                self.device_pool.shutdown()
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
@@ -0,0 +1,127 @@
+"""
+Storage layout for generated images: unique names, sharded directories, atomic writes
+"""
+
+import os
+import re
+import uuid
+import threading
+from abc import ABC, abstractmethod
+from config import IMAGES_DIR, IMAGE_STORAGE
+
+# generated_<32 hex uuid>_<style>.<ext>; older flat files are named generated_<timestamp>_<style>.<ext>
+SHARDED_NAME = re.compile(r'^generated_([0-9a-f]{32})_')
+SHARD_DIR = re.compile(r'^[0-9a-f]{2}$')
+
+
+class ImageStorage(ABC):
+    """Where generated images live, addressed only by filename
+
+    Callers never build paths themselves, so another backend (an object
+    store, or a local stand-in for one) can replace LocalImageStorage
+    behind create_image_storage() without touching them.
+    """
+
+    def new_filename(self, style, extension):
+        """A unique filename for a new image"""
+        return f"generated_{uuid.uuid4().hex}_{style}.{extension}"
+
+    @abstractmethod
+    def path(self, filename):
+        """Local filesystem path of an image"""
+
+    @abstractmethod
+    def write(self, filename, data):
+        """Store an image atomically; returns its path"""
+
+    @abstractmethod
+    def exists(self, filename):
+        """Whether an image is stored"""
+
+    @abstractmethod
+    def delete(self, filename):
+        """Remove an image; False if it did not exist"""
+
+    @abstractmethod
+    def scan(self, extensions=None):
+        """Yield (mtime, filename, size) for every stored image, optionally only these extensions"""
+
+
+class LocalImageStorage(ImageStorage):
+    """Images under a root directory, sharded two levels deep by their uuid
+
+    generated_3fa2c1...png lives at <root>/3f/a2/generated_3fa2c1...png, so no
+    directory holds more than a few hundred entries even with millions of
+    images. Writes go to a temporary file in the target directory and are
+    renamed into place, so readers see either nothing or the whole file.
+    Names without a uuid (images saved before sharding) resolve to the root.
+    """
+
+    def __init__(self, root=IMAGES_DIR):
+        self.root = root
+
+    def relative_path(self, filename):
+        """Path of an image relative to the root, for send_from_directory"""
+        match = SHARDED_NAME.match(filename)
+        if match is None:
+            return filename
+        key = match.group(1)
+        return os.path.join(key[:2], key[2:4], filename)
+
+    def path(self, filename):
+        return os.path.join(self.root, self.relative_path(filename))
+
+    def write(self, filename, data):
+        target = self.path(filename)
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        staging = os.path.join(directory, f".{filename}.tmp-{os.getpid()}-{threading.get_ident()}")
+        try:
+            with open(staging, 'wb') as f:
+                f.write(data)
+            os.replace(staging, target)
+        except BaseException:
+            try:
+                os.remove(staging)
+            except FileNotFoundError:
+                pass
+            raise
+        return target
+
+    def exists(self, filename):
+        return os.path.isfile(self.path(filename))
+
+    def delete(self, filename):
+        try:
+            os.remove(self.path(filename))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def scan(self, extensions=None):
+        """Flat legacy files in the root plus everything in the shard directories"""
+        def wanted(name):
+            return not name.startswith('.') and (extensions is None or name.lower().endswith(extensions))
+
+        with os.scandir(self.root) as iterator:
+            entries = list(iterator)
+        for entry in entries:
+            if entry.is_file() and wanted(entry.name):
+                stat = entry.stat()
+                yield stat.st_mtime, entry.name, stat.st_size
+            elif entry.is_dir() and SHARD_DIR.match(entry.name):
+                with os.scandir(entry.path) as shards:
+                    shard_dirs = [shard.path for shard in shards if shard.is_dir() and SHARD_DIR.match(shard.name)]
+                for shard_dir in shard_dirs:
+                    with os.scandir(shard_dir) as images:
+                        for image in images:
+                            if image.is_file() and wanted(image.name):
+                                stat = image.stat()
+                                yield stat.st_mtime, image.name, stat.st_size
+
+
+def create_image_storage(root=IMAGES_DIR):
+    """Storage backend selected by IMAGE_STORAGE"""
+    if IMAGE_STORAGE == 'local':
+        return LocalImageStorage(root)
+    raise ValueError(f"Unknown IMAGE_STORAGE: {IMAGE_STORAGE}")
@@ -0,0 +1,290 @@
+"""
+Asynchronous generation jobs with progress tracking
+"""
+
+import uuid
+import time
+import queue
+import logging
+import threading
+from config import JOB_QUEUE_SIZE, JOB_WORKERS, JOB_RESULT_TTL, BATCH_JOB_CHUNK
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class GenerationJob:
+    """State of one queued image generation"""
+
+    def __init__(self, username, prompt, style, options, on_success=None):
+        self.id = uuid.uuid4().hex
+        self.username = username
+        self.prompt = prompt
+        self.style = style
+        self.options = options
+        self.on_success = on_success
+        self.status = JOB_QUEUED
+        self.step = 0
+        self.total_steps = 0
+        # Latest low-resolution JPEG preview and the step it was taken at
+        self.preview = None
+        self.preview_step = 0
+        self.cancel_event = threading.Event()
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        # Bumped on every change so streaming clients can wait for updates
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        """Apply field changes and wake up anyone waiting on this job"""
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait_for_change(self, version, timeout):
+        """Block until the job moves past `version` or the timeout expires"""
+        with self.changed:
+            if self.version == version:
+                self.changed.wait(timeout=timeout)
+            return self.version
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def to_dict(self):
+        """Public view of the job for API responses"""
+        data = {
+            'job_id': self.id,
+            'status': self.status,
+            'progress': {
+                'step': self.step,
+                'total_steps': self.total_steps,
+                'percent': round(100 * self.step / self.total_steps, 1) if self.total_steps else 0
+            },
+            'preview_step': self.preview_step,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+        if self.status == JOB_COMPLETED:
+            data['result'] = self.result_view()
+        elif self.status == JOB_FAILED:
+            data['error'] = self.error
+        return data
+
+    def result_view(self):
+        return {
+            'image_url': f"/images/{self.result['filename']}",
+            'filename': self.result['filename'],
+            'generation_time': self.result['generation_time'],
+            'style_used': self.result['style'],
+            'seed': self.result['metadata'].get('seed'),
+            'cache_hit': self.result['metadata'].get('cache_hit', False),
+            'draft_id': self.result.get('draft_id')
+        }
+
+
+class BatchGenerationJob(GenerationJob):
+    """State of one queued batch generation; progress counts finished prompts"""
+
+    def __init__(self, username, prompts, style, options, on_success=None):
+        super().__init__(username, None, style, options, on_success)
+        self.prompts = prompts
+        self.total_steps = len(prompts)
+        self.results = []
+
+    def to_dict(self):
+        data = super().to_dict()
+        # Finished prompts are visible while the rest of the batch still runs
+        data['result'] = self.result_view()
+        return data
+
+    def result_view(self):
+        images = []
+        for prompt, result in zip(self.prompts, self.results):
+            if result['success']:
+                images.append({
+                    'success': True,
+                    'prompt': prompt,
+                    'image_url': f"/images/{result['filename']}",
+                    'filename': result['filename'],
+                    'generation_time': result['generation_time'],
+                    'style_used': result['style']
+                })
+            else:
+                images.append({
+                    'success': False,
+                    'prompt': prompt,
+                    'error': result['error']
+                })
+        return {
+            'images': images,
+            'generated': sum(1 for image in images if image['success']),
+            'total': len(self.prompts)
+        }
+
+
+class JobService:
+    """Bounded job queue drained by background generation workers"""
+
+    def __init__(self, image_service, max_queue=JOB_QUEUE_SIZE, workers=JOB_WORKERS):
+        self.image_service = image_service
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        self.workers = []
+        for index in range(max(1, workers)):
+            worker = threading.Thread(target=self._worker_loop, name=f'generation-worker-{index}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+        logger.info(f"Job service started with {len(self.workers)} workers (queue size {max_queue})")
+
+    def submit(self, username, prompt, style=None, on_success=None, **options):
+        """Queue a generation job; returns None when the queue is full"""
+        return self._enqueue(GenerationJob(username, prompt, style, options, on_success))
+
+    def _enqueue(self, job):
+        self._prune_finished()
+        with self.jobs_lock:
+            self.jobs[job.id] = job
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self.jobs_lock:
+                del self.jobs[job.id]
+            logger.warning(f"Job queue full, rejecting job from {job.username}")
+            return None
+
+        logger.info(f"Queued job {job.id} for {job.username} (queue depth {self.queue.qsize()})")
+        return job
+
+    def submit_batch(self, username, prompts, style=None, on_success=None, **options):
+        """
+        Queue a batch generation job; returns None when the queue is full.
+        on_success is called with the successful results of every chunk.
+        """
+        return self._enqueue(BatchGenerationJob(username, prompts, style, options, on_success))
+
+    def get_job(self, job_id, username=None):
+        """Look up a job, optionally restricted to its owner"""
+        with self.jobs_lock:
+            job = self.jobs.get(job_id)
+        if job is None or (username is not None and job.username != username):
+            return None
+        return job
+
+    def cancel(self, job):
+        """Ask a job to stop; returns False when it has already finished"""
+        if job.finished:
+            return False
+        job.cancel_event.set()
+        if job.status == JOB_QUEUED:
+            # Not picked up yet: the worker will skip it
+            job.update(status=JOB_CANCELLED, finished_at=time.time())
+        logger.info(f"Cancellation requested for job {job.id}")
+        return True
+
+    def get_status(self):
+        """Queue and worker counters for status endpoints"""
+        with self.jobs_lock:
+            jobs = list(self.jobs.values())
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_capacity': self.queue.maxsize,
+            'workers': len(self.workers),
+            'running_jobs': sum(1 for job in jobs if job.status == JOB_RUNNING),
+            'cancelled_jobs': sum(1 for job in jobs if job.status == JOB_CANCELLED),
+            'tracked_jobs': len(jobs)
+        }
+
+    def _prune_finished(self):
+        """Forget finished jobs older than JOB_RESULT_TTL"""
+        cutoff = time.time() - JOB_RESULT_TTL
+        with self.jobs_lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                del self.jobs[job_id]
+
+    def _worker_loop(self):
+        """Worker thread: take jobs off the queue and run them"""
+        while True:
+            job = self.queue.get()
+            try:
+                if isinstance(job, BatchGenerationJob):
+                    self._run_batch_job(job)
+                else:
+                    self._run_job(job)
+            except Exception as e:
+                logger.error(f"Job {job.id} crashed: {e}")
+                job.update(status=JOB_FAILED, error=str(e), finished_at=time.time())
+            finally:
+                self.queue.task_done()
+
+    def _run_batch_job(self, job, chunk_size=BATCH_JOB_CHUNK):
+        """Generate a batch chunk by chunk, so progress, charges and cancellation follow the work"""
+        if job.cancel_event.is_set():
+            return
+        job.update(status=JOB_RUNNING, started_at=time.time())
+
+        for offset in range(0, len(job.prompts), chunk_size):
+            if job.cancel_event.is_set():
+                job.update(status=JOB_CANCELLED, finished_at=time.time())
+                logger.info(f"Batch job {job.id} cancelled after {job.step}/{job.total_steps} prompts")
+                return
+            results = self.image_service.batch_generate(job.prompts[offset:offset + chunk_size], job.style, **job.options)
+            produced = [result for result in results if result['success']]
+            if produced and job.on_success is not None:
+                try:
+                    job.on_success(produced)
+                except Exception as e:
+                    logger.error(f"Batch job {job.id} success hook failed: {e}")
+            job.update(results=job.results + results, step=offset + len(results))
+
+        job.update(status=JOB_COMPLETED, finished_at=time.time())
+        logger.info(f"Batch job {job.id} completed: {len(job.prompts)} prompts")
+
+    def _run_job(self, job):
+        """Generate the job's image, reporting every denoising step and preview"""
+        if job.cancel_event.is_set():
+            return
+        job.update(status=JOB_RUNNING, started_at=time.time())
+
+        def on_progress(step, total_steps):
+            job.update(step=step, total_steps=total_steps)
+
+        def on_preview(step, jpeg_bytes):
+            job.update(preview=jpeg_bytes, preview_step=step)
+
+        result = self.image_service.schedule_generation(
+            job.prompt, job.style, progress_callback=on_progress, preview_callback=on_preview,
+            cancel_event=job.cancel_event, **job.options
+        )
+
+        if result.get('cancelled') or (job.cancel_event.is_set() and not result['success']):
+            job.update(status=JOB_CANCELLED, finished_at=time.time())
+            logger.info(f"Job {job.id} cancelled at step {job.step}/{job.total_steps}")
+        elif result['success']:
+            if job.on_success is not None:
+                try:
+                    job.on_success(result)
+                except Exception as e:
+                    logger.error(f"Job {job.id} success hook failed: {e}")
+            job.update(status=JOB_COMPLETED, result=result, finished_at=time.time())
+            logger.info(f"Job {job.id} completed in {result['generation_time']:.2f}s")
+        else:
+            job.update(status=JOB_FAILED, error=result['error'], finished_at=time.time())
+            logger.warning(f"Job {job.id} failed: {result['error']}")
@@ -0,0 +1,288 @@
+"""
+Thread-safe service metrics exported in the Prometheus text format
+"""
+
+import time
+import bisect
+import logging
+import threading
+from config import ENABLE_MONITORING, METRICS_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds in seconds, from API calls to cold model loads
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """A metric family: one value (or histogram) per combination of label values"""
+
+    type = 'untyped'
+
+    def __init__(self, name, help, labelnames=(), enabled=ENABLE_MONITORING):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, label values, extra labels, value) of every series"""
+        with self.lock:
+            return [('', key, (), value) for key, value in self.series.items()]
+
+    def render(self):
+        lines = []
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        if not lines:
+            # Families without samples are left out, so merged outputs never repeat a header
+            return ''
+        return '\n'.join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"] + lines) + '\n'
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.series.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    """Value that goes up and down; set directly or read from a function at export time"""
+
+    type = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), enabled=ENABLE_MONITORING):
+        super().__init__(name, help, labelnames, enabled)
+        self.function = None
+
+    def set(self, value, **labels):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.series[self._key(labels)] = value
+
+    def set_function(self, function):
+        """Read the gauge from `function` on export: a number, or {label values tuple: number}"""
+        self.function = function
+
+    def samples(self):
+        if self.function is None:
+            return super().samples()
+        try:
+            values = self.function()
+        except Exception as e:
+            logger.warning(f"Could not read gauge {self.name}: {e}")
+            return []
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [('', key, (), value) for key, value in values.items()]
+
+
+class HistogramSeries:
+    """Bucket counts of one label combination, all time and for the current and previous window"""
+
+    def __init__(self, size, now):
+        self.counts = [0] * size
+        self.sum = 0.0
+        self.count = 0
+        self.current = [0] * size
+        self.previous = [0] * size
+        self.window_start = now
+
+    def rotate(self, now, window):
+        elapsed = now - self.window_start
+        if elapsed < window:
+            return
+        self.previous = self.current if elapsed < 2 * window else [0] * len(self.counts)
+        self.current = [0] * len(self.counts)
+        self.window_start = now
+
+
+class Histogram(Metric):
+    """Bucketed distribution of observed values
+
+    Prometheus gets the cumulative buckets. The p50/p95/p99 in summary()
+    cover the last one to two METRICS_INTERVAL windows, so they follow the
+    current load instead of settling on the process lifetime. Quantiles are
+    interpolated inside buckets, like Prometheus' histogram_quantile.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS, window=METRICS_INTERVAL,
+                 enabled=ENABLE_MONITORING):
+        super().__init__(name, help, labelnames, enabled)
+        self.buckets = tuple(buckets)
+        self.window = window
+
+    def observe(self, value, **labels):
+        if not self.enabled:
+            return
+        key = self._key(labels)
+        # The last slot counts values above the largest bucket
+        index = bisect.bisect_left(self.buckets, value)
+        now = time.monotonic()
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = HistogramSeries(len(self.buckets) + 1, now)
+            series.rotate(now, self.window)
+            series.counts[index] += 1
+            series.current[index] += 1
+            series.sum += value
+            series.count += 1
+
+    def time(self, **labels):
+        """Context manager observing the seconds spent inside it"""
+        return _Timer(self, labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, series in self.series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), series.counts):
+                    cumulative += count
+                    samples.append(('_bucket', key, (('le', _format_value(bound)),), cumulative))
+                samples.append(('_sum', key, (), series.sum))
+                samples.append(('_count', key, (), series.count))
+        return samples
+
+    def quantile(self, q, counts):
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if count and cumulative + count >= rank:
+                if index == len(self.buckets):
+                    # Above the largest bucket nothing better than its bound is known
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def summary(self):
+        """{label values joined by '/': count, mean and recent p50/p95/p99}"""
+        now = time.monotonic()
+        summary = {}
+        with self.lock:
+            for key, series in self.series.items():
+                series.rotate(now, self.window)
+                recent = [a + b for a, b in zip(series.current, series.previous)]
+                entry = {
+                    'count': series.count,
+                    'mean': round(series.sum / series.count, 4) if series.count else 0,
+                    'recent_count': sum(recent)
+                }
+                for q in QUANTILES:
+                    value = self.quantile(q, recent)
+                    entry[f"p{round(q * 100)}"] = round(value, 4) if value is not None else None
+                summary['/'.join(str(value) for value in key) or 'all'] = entry
+        return summary
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class MetricsRegistry:
+    """The metric families of this process, in registration order"""
+
+    def __init__(self, enabled=ENABLE_MONITORING):
+        self.enabled = enabled
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, *args, enabled=self.enabled, **kwargs)
+            return self.metrics[name]
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._register(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        """Every family in the Prometheus text exposition format"""
+        if not self.enabled:
+            return ''
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return ''.join(metric.render() for metric in metrics)
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by route', ('endpoint', 'method', 'status'))
+GENERATION_SECONDS = registry.histogram(
+    'image_generation_duration_seconds', 'Image generation time per request, by model', ('model', 'outcome'))
+MODEL_LOAD_SECONDS = registry.histogram(
+    'model_load_duration_seconds', 'Model load time, by the tier it was loaded from', ('model', 'source'))
+CACHE_LOOKUPS = registry.counter(
+    'cache_lookups_total', 'Result cache and loaded model lookups', ('cache', 'result'))
+MODEL_EVICTIONS = registry.counter(
+    'model_evictions_total', 'Models taken off their device', ('model', 'reason'))
+FAILURES = registry.counter(
+    'failures_total', 'Failed model loads, generations and image saves', ('stage',))
+QUEUE_DEPTH = registry.gauge(
+    'generation_queue_depth', 'Requests waiting in the batch scheduler')
+ACTIVE_GENERATIONS = registry.gauge(
+    'active_generations', 'Requests inside a pipeline call')
+MODELS_RESIDENT = registry.gauge(
+    'models_resident', 'Models held per residency tier', ('tier',))
+MEMORY_BYTES = registry.gauge(
+    'memory_bytes', 'Process, accelerator and model memory', ('kind',))
@@ -0,0 +1,236 @@
+"""
+Client for the model server: an ImageService stand-in for web worker processes
+"""
+
+import uuid
+import time
+import logging
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client
+from services import metrics
+from config import (IMAGES_DIR, GENERATION_TIMEOUT, ERROR_MESSAGES, REFINE_STRENGTH, WARM_POOL_STYLES,
+                    MODEL_SERVER_ADDRESS, MODEL_SERVER_AUTHKEY, MODEL_SERVER_ALLOW_TCP, JWT_SECRET_KEY)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of a caller's cancel event while waiting for a reply
+POLL_INTERVAL = 0.5
+
+# Published defaults of the JWT secret, which must never double as the model server key
+DEFAULT_SECRETS = ('super-secret-key-change-in-production', 'super-secret-key')
+
+
+class ModelServerError(Exception):
+    """The model server could not be reached or rejected a call"""
+
+
+def model_server_address(address=MODEL_SERVER_ADDRESS, allow_tcp=MODEL_SERVER_ALLOW_TCP):
+    """(address, family) for multiprocessing.connection from a socket path or host:port"""
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit() and '/' not in address:
+        if not allow_tcp:
+            raise ModelServerError(
+                f"MODEL_SERVER_ADDRESS {address} is a TCP address; set MODEL_SERVER_ALLOW_TCP=true to allow it")
+        return (host, int(port)), 'AF_INET'
+    return address, 'AF_UNIX'
+
+
+def model_server_authkey(authkey=MODEL_SERVER_AUTHKEY):
+    """The model server key as bytes; refuses missing, default or JWT-shared keys"""
+    if not authkey:
+        raise ModelServerError("MODEL_SERVER_AUTHKEY must be set in remote generation mode")
+    if authkey in DEFAULT_SECRETS or authkey == JWT_SECRET_KEY:
+        raise ModelServerError("MODEL_SERVER_AUTHKEY must be its own secret, not a default or the JWT secret")
+    return authkey.encode('utf-8')
+
+
+class RemoteImageService:
+    """Forwards ImageService calls to the model server over a local socket
+
+    Connections are pooled and each carries one call at a time. Progress and
+    preview callbacks are streamed back as messages ahead of the result, and a
+    set cancel_event is forwarded on a separate connection.
+    """
+
+    def __init__(self, address=MODEL_SERVER_ADDRESS, authkey=MODEL_SERVER_AUTHKEY):
+        self.address, self.family = model_server_address(address)
+        self.authkey = model_server_authkey(authkey)
+        self.idle_connections = []
+        self.lock = threading.Lock()
+        self.stats = {
+            'calls': 0,
+            'connection_errors': 0,
+            'cancels_forwarded': 0
+        }
+        self.mongo = None
+
+    def set_mongo(self, mongo):
+        """Set MongoDB reference for database operations"""
+        self.mongo = mongo
+
+    def start_warm_pool(self, styles=WARM_POOL_STYLES):
+        """Ask the server to preload styles; it keeps running if the server is still starting"""
+        try:
+            self._call('start_warm_pool', list(styles))
+        except ModelServerError as e:
+            logger.warning(f"Could not reach model server for warm pool: {e}")
+
+    def start_retention(self):
+        """Image cleanup runs in the model server, which owns IMAGES_DIR"""
+
+    def generate_image(self, prompt, style=None, images_dir=IMAGES_DIR, progress_callback=None,
+                       preview_callback=None, cancel_event=None, **kwargs):
+        """ImageService.generate_image on the model server"""
+        return self._generate('generate_image', (prompt, style), dict(images_dir=images_dir, **kwargs),
+                              progress_callback, preview_callback, cancel_event)
+
+    def schedule_generation(self, prompt, style=None, progress_callback=None, preview_callback=None,
+                            cancel_event=None, **kwargs):
+        """ImageService.schedule_generation on the model server"""
+        return self._generate('schedule_generation', (prompt, style), kwargs,
+                              progress_callback, preview_callback, cancel_event)
+
+    def refine_draft(self, draft_id, images_dir=IMAGES_DIR, strength=REFINE_STRENGTH):
+        """ImageService.refine_draft on the model server"""
+        return self._generate('refine_draft', (draft_id,), {'images_dir': images_dir, 'strength': strength})
+
+    def batch_generate(self, prompts, style=None, images_dir=IMAGES_DIR, **kwargs):
+        """ImageService.batch_generate on the model server"""
+        try:
+            # Offline batches may legitimately run for a long time
+            return self._call('batch_generate', prompts, style, images_dir=images_dir, **kwargs, _timeout=None)
+        except ModelServerError as e:
+            logger.error(f"Remote batch generation failed: {e}")
+            return [{
+                "success": False,
+                "error": ERROR_MESSAGES['generation_failed']
+            } for _ in prompts]
+
+    def get_pending_image(self, filename):
+        """Image bytes the model server has not written to disk yet, or None"""
+        try:
+            return self._call('get_pending_image', filename, _timeout=30)
+        except ModelServerError as e:
+            logger.warning(f"Could not ask model server for pending image {filename}: {e}")
+            return None
+
+    def get_memory_usage(self):
+        """Memory usage of the model server process"""
+        try:
+            return self._call('get_memory_usage')
+        except ModelServerError as e:
+            logger.error(f"Error getting memory usage from model server: {e}")
+            return {
+                "cpu_memory_mb": 0,
+                "gpu_memory_mb": 0,
+                "models_loaded": 0,
+                "model_server": "unreachable"
+            }
+
+    def get_metrics(self):
+        """This worker's metrics followed by the model server's"""
+        local = metrics.registry.render()
+        try:
+            return local + self._call('get_metrics', _timeout=30)
+        except ModelServerError as e:
+            logger.warning(f"Could not get metrics from model server: {e}")
+            return local
+
+    def get_service_status(self):
+        """Model server status plus this client's counters"""
+        try:
+            status = self._call('get_service_status')
+        except ModelServerError as e:
+            logger.error(f"Error getting service status from model server: {e}")
+            return {
+                "status": "error",
+                "error": str(e)
+            }
+        status["generation_mode"] = "remote"
+        status["model_server_client"] = dict(self.stats)
+        return status
+
+    def _generate(self, method, args, kwargs, progress_callback=None, preview_callback=None, cancel_event=None):
+        """Run a generation call, turning transport failures into an error result"""
+        try:
+            return self._call(method, *args, **kwargs, _progress=progress_callback, _preview=preview_callback,
+                              _cancel_event=cancel_event)
+        except ModelServerError as e:
+            logger.error(f"Remote {method} failed: {e}")
+            return {
+                "success": False,
+                "error": ERROR_MESSAGES['generation_failed']
+            }
+
+    def _call(self, method, *args, _progress=None, _preview=None, _cancel_event=None,
+              _timeout=GENERATION_TIMEOUT + 60, **kwargs):
+        """Send one call and wait for its result, dispatching streamed callbacks meanwhile"""
+        call_id = uuid.uuid4().hex
+        stream = {'progress': _progress is not None, 'preview': _preview is not None}
+        deadline = None if _timeout is None else time.monotonic() + _timeout
+        cancel_sent = False
+        self.stats['calls'] += 1
+
+        conn = self._acquire()
+        try:
+            conn.send(('call', call_id, method, args, kwargs, stream))
+            while True:
+                if _cancel_event is not None and _cancel_event.is_set() and not cancel_sent:
+                    self._forward_cancel(call_id)
+                    cancel_sent = True
+                if deadline is not None and time.monotonic() > deadline:
+                    raise ModelServerError(f"{method} timed out after {_timeout}s")
+                if not conn.poll(POLL_INTERVAL):
+                    continue
+
+                kind, *payload = conn.recv()
+                if kind == 'progress':
+                    self._invoke(_progress, *payload)
+                elif kind == 'preview':
+                    self._invoke(_preview, *payload)
+                elif kind == 'result':
+                    self._release(conn)
+                    conn = None
+                    return payload[0]
+                elif kind == 'error':
+                    self._release(conn)
+                    conn = None
+                    raise ModelServerError(payload[0])
+        except (EOFError, OSError) as e:
+            self.stats['connection_errors'] += 1
+            raise ModelServerError(f"connection to model server lost: {e}")
+        finally:
+            if conn is not None:
+                # Interrupted mid-call: the stream position is unknown, so drop it
+                conn.close()
+
+    @staticmethod
+    def _invoke(callback, *args):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.warning(f"Remote callback failed: {e}")
+
+    def _forward_cancel(self, call_id):
+        """Tell the server to cancel a running call, on a connection of its own"""
+        try:
+            self._call('cancel', call_id, _timeout=30)
+            self.stats['cancels_forwarded'] += 1
+        except ModelServerError as e:
+            logger.warning(f"Could not forward cancellation of {call_id}: {e}")
+
+    def _acquire(self):
+        """Reuse an idle connection or open a new one"""
+        with self.lock:
+            if self.idle_connections:
+                return self.idle_connections.pop()
+        try:
+            return Client(self.address, family=self.family, authkey=self.authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            self.stats['connection_errors'] += 1
+            raise ModelServerError(f"cannot connect to model server at {self.address}: {e}")
+
+    def _release(self, conn):
+        with self.lock:
+            self.idle_connections.append(conn)
@@ -0,0 +1,124 @@
+"""
+Content-addressed cache of generated images
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from config import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_MB
+
+logger = logging.getLogger(__name__)
+
+# Request parameters that do not change the generated pixels
+NON_KEY_PARAMS = ('use_cache',)
+
+
+class ResultCache:
+    """LRU index from canonical generation parameters to stored image files
+
+    The cache only indexes files that already live in IMAGES_DIR; evicting an
+    entry forgets it but leaves the file alone, since the same file is also a
+    user's gallery image and is removed by the normal image cleanup.
+    """
+
+    def __init__(self, max_entries=RESULT_CACHE_MAX_ENTRIES, max_bytes=RESULT_CACHE_MAX_MB * 1024 * 1024,
+                 is_pending=None):
+        self.max_entries = max_entries
+        # filename -> whether its asynchronous disk write is still queued
+        self.is_pending = is_pending or (lambda filename: False)
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'evictions': 0
+        }
+
+    @staticmethod
+    def make_key(style, prompt, params):
+        """Canonical sha256 over everything that determines the output image"""
+        canonical = {
+            'style': style,
+            'prompt': prompt,
+            **{name: value for name, value in params.items() if name not in NON_KEY_PARAMS}
+        }
+        payload = json.dumps(canonical, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def seed_for_key(key):
+        """Deterministic 32-bit seed derived from a cache key"""
+        return int(key[:8], 16)
+
+    def get(self, key):
+        """Return the cached result for `key`, or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if (entry is not None and not self.is_pending(entry['filename'])
+                    and not os.path.exists(entry['filepath'])):
+                # The image was cleaned up underneath us (a queued write is not there yet)
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return dict(entry)
+
+    def put(self, key, result):
+        """Index a successful generation result under `key`"""
+        file_size = result.get('metadata', {}).get('file_size', 0)
+        entry = {
+            'filename': result['filename'],
+            'filepath': result['filepath'],
+            'style': result['style'],
+            'prompt': result['prompt'],
+            'timestamp': result['timestamp'],
+            'metadata': result['metadata'],
+            'file_size': file_size
+        }
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            self.total_bytes += file_size
+            self.stats['stores'] += 1
+
+            while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+                oldest = next(iter(self.entries))
+                self._remove(oldest)
+                self.stats['evictions'] += 1
+
+    def clear(self):
+        """Forget every cached entry"""
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def get_stats(self):
+        """Counters and occupancy for monitoring"""
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': round(self.stats['hits'] / lookups, 4) if lookups else 0,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'size_mb': round(self.total_bytes / 1024 / 1024, 2),
+                'max_size_mb': round(self.max_bytes / 1024 / 1024, 2)
+            }
+
+    def _remove(self, key):
+        """Drop one entry (caller holds the lock)"""
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry['file_size']
@@ -0,0 +1,183 @@
+"""
+Retention of generated images: an incremental index with count and byte limits
+"""
+
+import time
+import logging
+import threading
+from collections import OrderedDict
+from config import MAX_IMAGES_TO_KEEP, MAX_IMAGES_MB, CLEANUP_INTERVAL
+from services.image_storage import create_image_storage
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.avif')
+
+
+class RetentionManager:
+    """Keeps IMAGES_DIR within MAX_IMAGES_TO_KEEP files and MAX_IMAGES_MB bytes
+
+    The storage is scanned once, when the schedule starts. After that every
+    saved image is added to an index ordered by creation time, so enforcing
+    the limits removes the k oldest files in O(k) without listing or statting
+    the directories again. Files written by other processes are only picked
+    up by rescan(), which the schedule runs every RESCAN_EVERY cleanup
+    intervals. Images whose asynchronous write is still queued are never
+    removed, and stay indexed across rescans that cannot see them yet.
+    """
+
+    # Cleanup runs between full directory rescans
+    RESCAN_EVERY = 24
+
+    def __init__(self, storage=None, max_images=MAX_IMAGES_TO_KEEP, max_bytes=MAX_IMAGES_MB * 1024 * 1024,
+                 on_evict=None, is_pending=None):
+        self.storage = storage or create_image_storage()
+        self.max_images = max_images
+        # 0 disables the byte budget
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        # filename -> whether its asynchronous disk write is still queued
+        self.is_pending = is_pending or (lambda filename: False)
+        # filename -> size in bytes, oldest first
+        self.index = OrderedDict()
+        self.total_bytes = 0
+        self.indexed = False
+        # Images added before the first scan or while a rescan runs, merged into its result
+        self.scan_additions = OrderedDict()
+        self.lock = threading.Lock()
+        # Held for a whole rescan; add() only needs self.lock and never waits on one
+        self.scan_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {
+            'added': 0,
+            'evicted': 0,
+            'evicted_bytes': 0,
+            'rescans': 0,
+            'last_scan_seconds': 0,
+            'last_cleanup_at': None
+        }
+
+    def rescan(self):
+        """Rebuild the index from one pass over the storage"""
+        with self.scan_lock:
+            self._rescan()
+
+    def _rescan(self):
+        start = time.perf_counter()
+        with self.lock:
+            if self.scan_additions is None:
+                self.scan_additions = OrderedDict()
+            # Indexed images the scan cannot see yet because their write is still queued
+            unwritten = [(name, size) for name, size in self.index.items() if self.is_pending(name)]
+        entries = sorted(self.storage.scan(IMAGE_EXTENSIONS))
+
+        with self.lock:
+            self.index = OrderedDict((name, size) for _, name, size in entries)
+            # Images added while scanning are newer than anything the scan saw
+            for name, size in unwritten + list(self.scan_additions.items()):
+                self.index.pop(name, None)
+                self.index[name] = size
+            self.scan_additions = None
+            self.total_bytes = sum(self.index.values())
+            self.indexed = True
+            self.stats['rescans'] += 1
+            self.stats['last_scan_seconds'] = time.perf_counter() - start
+
+    def add(self, filename, size):
+        """Record a newly saved image as the newest entry"""
+        with self.lock:
+            previous = self.index.pop(filename, None)
+            if previous is not None:
+                self.total_bytes -= previous
+            self.index[filename] = size
+            self.total_bytes += size
+            if self.scan_additions is not None:
+                self.scan_additions[filename] = size
+            self.stats['added'] += 1
+
+    def enforce(self, max_images=None, max_bytes=None):
+        """Remove the oldest images until both limits hold; returns the number removed"""
+        self._ensure_index()
+        max_images = self.max_images if max_images is None else max_images
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+
+        victims = []
+        with self.lock:
+            count, total_bytes = len(self.index), self.total_bytes
+            for filename, size in self.index.items():
+                if not (count > max_images or (max_bytes and total_bytes > max_bytes)):
+                    break
+                if self.is_pending(filename):
+                    # Deleting now would race the queued write
+                    continue
+                victims.append((filename, size))
+                count -= 1
+                total_bytes -= size
+            for filename, _ in victims:
+                del self.index[filename]
+            self.total_bytes = total_bytes
+
+        # File removal happens outside the lock so add() never waits on the disk
+        for filename, size in victims:
+            try:
+                self.storage.delete(filename)
+            except Exception as e:
+                logger.error(f"Failed to remove {filename}: {e}")
+                continue
+            if self.on_evict is not None:
+                self.on_evict(filename)
+            self.stats['evicted'] += 1
+            self.stats['evicted_bytes'] += size
+
+        self.stats['last_cleanup_at'] = time.time()
+        if victims:
+            logger.info(f"Image cleanup completed: {len(victims)} files removed")
+        return len(victims)
+
+    def start(self, interval=CLEANUP_INTERVAL):
+        """Run enforce() every `interval` seconds on a daemon thread"""
+        if interval <= 0 or (self.thread is not None and self.thread.is_alive()):
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, args=(interval,), daemon=True, name='image-retention')
+        self.thread.start()
+        logger.info(f"Image retention scheduled every {interval}s (max {self.max_images} images)")
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self, interval):
+        try:
+            # Prime the index here rather than on the first request that saves an image
+            self._ensure_index()
+        except Exception as e:
+            logger.error(f"Error indexing images: {e}")
+        runs = 0
+        while not self.stop_event.wait(interval):
+            try:
+                runs += 1
+                if runs % self.RESCAN_EVERY == 0:
+                    self.rescan()
+                self.enforce()
+            except Exception as e:
+                logger.error(f"Error during image cleanup: {e}")
+
+    def _ensure_index(self):
+        if not self.indexed:
+            with self.scan_lock:
+                if not self.indexed:
+                    self._rescan()
+
+    def get_stats(self):
+        with self.lock:
+            images = len(self.index)
+            total_bytes = self.total_bytes
+        return {
+            **self.stats,
+            'images': images,
+            'total_mb': round(total_bytes / 1024 / 1024, 1),
+            'max_images': self.max_images,
+            'max_mb': round(self.max_bytes / 1024 / 1024, 1),
+            'scheduled': self.thread is not None and self.thread.is_alive()
+        }
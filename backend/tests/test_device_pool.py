@@ -0,0 +1,121 @@
+"""
+DevicePool placement, routing and slot threads on CPU-only slots
+"""
+
+import os
+import threading
+import pytest
+from device_pool import DevicePool, ExecutionSlot, parse_slots, parse_core_range, split_cores
+
+pinnable = pytest.mark.skipif(not hasattr(os, 'sched_getaffinity'), reason="needs sched_getaffinity")
+
+
+def cpu_pool(count=2):
+    return DevicePool([ExecutionSlot(f"cpu:{index}", 'cpu') for index in range(count)])
+
+
+def test_parse_slots_cpu_spec():
+    slots = parse_slots('cpu:0-1,cpu:2+4,cpu')
+    assert [slot.name for slot in slots] == ['cpu:0', 'cpu:1', 'cpu:2']
+    assert [slot.cores for slot in slots] == [(0, 1), (2, 4), None]
+    assert all(slot.is_cpu for slot in slots)
+
+
+def test_parse_core_range():
+    assert parse_core_range('0-3+8') == [0, 1, 2, 3, 8]
+
+
+def test_split_cores_near_equal():
+    assert split_cores(3, range(8)) == [[0, 1, 2], [3, 4, 5], [6, 7]]
+    # Never more sets than cores
+    assert split_cores(4, [0, 1]) == [[0], [1]]
+
+
+def test_cpu_placement_is_resident_on_every_slot():
+    pool = cpu_pool(3)
+    home = pool.place('dreamshaper')
+    assert home is pool.slots[0]
+    assert all('dreamshaper' in slot.models for slot in pool.slots)
+    assert pool.place('dreamshaper') is home
+    assert pool.stats['placements'] == 1
+    assert pool.cpu_only
+
+
+def test_capacity_counts_slots_holding_the_model():
+    pool = cpu_pool(3)
+    assert pool.capacity('dreamshaper') == 1
+    pool.place('dreamshaper')
+    assert pool.capacity('dreamshaper') == 3
+    pool.evict('dreamshaper')
+    assert pool.capacity('dreamshaper') == 1
+    assert pool.home_slot('dreamshaper') is None
+
+
+def test_acquire_picks_least_loaded_slot_and_release_frees_it():
+    pool = cpu_pool(2)
+    pool.place('dreamshaper')
+    first = pool.acquire('dreamshaper')
+    second = pool.acquire('dreamshaper')
+    assert {first, second} == set(pool.slots)
+    assert first.active == second.active == 1
+
+    pool.release(first)
+    assert first.active == 0
+    assert pool.acquire('dreamshaper') is first
+    assert pool.stats['calls_routed'] == 3
+
+
+def test_acquire_unplaced_model_raises():
+    with pytest.raises(RuntimeError):
+        cpu_pool().acquire('dreamshaper')
+
+
+def test_use_releases_on_error():
+    pool = cpu_pool(1)
+    pool.place('dreamshaper')
+    with pytest.raises(ValueError):
+        with pool.use('dreamshaper') as slot:
+            assert slot.active == 1
+            raise ValueError()
+    assert pool.slots[0].active == 0
+
+
+def test_unpinned_slot_runs_inline():
+    slot = ExecutionSlot('cpu:0', 'cpu')
+    assert slot.run(threading.current_thread) is threading.current_thread()
+
+
+@pinnable
+def test_pinned_slot_runs_on_its_own_pinned_thread():
+    cores = sorted(os.sched_getaffinity(0))[:1]
+    slot = ExecutionSlot('cpu:0', 'cpu', cores)
+    try:
+        thread = slot.run(threading.current_thread)
+        assert thread is not threading.current_thread()
+        assert slot.run(threading.current_thread) is thread
+        assert slot.run(os.sched_getaffinity, 0) == set(cores)
+    finally:
+        slot.shutdown()
+
+
+@pinnable
+def test_acquire_and_run_leave_caller_affinity_alone():
+    before = os.sched_getaffinity(0)
+    pool = DevicePool([ExecutionSlot('cpu:0', 'cpu', sorted(before)[:1])])
+    try:
+        pool.place('dreamshaper')
+        with pool.use('dreamshaper') as slot:
+            slot.run(sum, [1, 2])
+        assert os.sched_getaffinity(0) == before
+    finally:
+        pool.shutdown()
+
+
+@pinnable
+def test_run_propagates_exceptions():
+    slot = ExecutionSlot('cpu:0', 'cpu', sorted(os.sched_getaffinity(0))[:1])
+    try:
+        with pytest.raises(ZeroDivisionError):
+            slot.run(lambda: 1 / 0)
+    finally:
+        slot.shutdown()
@@ -0,0 +1,80 @@
+"""
+ModelBudget admission: per-device budgets and running models evicted last
+"""
+
+import pytest
+from model_budget import ModelBudget, ModelBudgetExceeded
+
+
+class FakeTensor:
+    is_meta = False
+
+    def __init__(self, device, size):
+        self.device = device
+        self.size = size
+
+    def nelement(self):
+        return self.size
+
+    def element_size(self):
+        return 1
+
+    def data_ptr(self):
+        return id(self)
+
+
+class FakeModule:
+    def __init__(self, device, size):
+        self.tensors = [FakeTensor(device, size)]
+
+    def parameters(self):
+        return self.tensors
+
+    def buffers(self):
+        return []
+
+
+class FakePipe:
+    def __init__(self, device, size):
+        self.unet = FakeModule(device, size)
+
+
+def budget_with(resident, budget_bytes=100, max_models=4):
+    budget = ModelBudget(budget_bytes=budget_bytes, policy='lru', max_models=max_models, devices=['cuda:0', 'cuda:1'])
+    for style, pipe in resident.items():
+        budget.loaded(style, pipe, 1.0, device=pipe.unet.tensors[0].device)
+    return budget
+
+
+def test_budgets_are_per_device():
+    resident = {'a': FakePipe('cuda:0', 60), 'b': FakePipe('cuda:1', 60)}
+    budget = budget_with(resident)
+    # Only the model on the target GPU makes room there
+    assert budget.plan_admission('c', 50, resident, 'cuda:1') == ['b']
+    assert budget.plan_admission('c', 30, resident, 'cuda:0') == []
+    status = budget.get_status(resident)
+    assert set(status['devices']) == {'cuda:0', 'cuda:1'}
+    assert status['models']['a']['device'] == 'cuda:0'
+
+
+def test_rejects_model_larger_than_its_device_budget():
+    resident = {'a': FakePipe('cuda:0', 10)}
+    budget = budget_with(resident)
+    with pytest.raises(ModelBudgetExceeded):
+        budget.plan_admission('c', 150, resident, 'cuda:1')
+    assert budget.stats['rejections'] == 1
+
+
+def test_busy_models_are_evicted_last():
+    resident = {'a': FakePipe('cuda:0', 40), 'b': FakePipe('cuda:0', 40)}
+    budget = budget_with(resident)
+    # 'a' is least recently used, but running
+    assert budget.plan_admission('c', 50, resident, 'cuda:0', busy={'a'}) == ['b']
+    # When idle models are not enough the running one is still named, for the caller to wait on
+    assert budget.plan_admission('c', 90, resident, 'cuda:0', busy={'a'}) == ['b', 'a']
+
+
+def test_model_count_limit_spans_devices():
+    resident = {'a': FakePipe('cuda:0', 10), 'b': FakePipe('cuda:1', 10)}
+    budget = budget_with(resident, max_models=2)
+    assert budget.plan_admission('c', 10, resident, 'cuda:1', busy={'a'}) == ['b']
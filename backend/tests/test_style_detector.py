@@ -0,0 +1,40 @@
+"""
+StyleDetector whole-word and plural keyword matching, single and batched
+"""
+
+from utils.style_detector import StyleDetector, plural
+
+
+def test_keywords_match_whole_words_only():
+    detector = StyleDetector()
+    style, _, dreamshaper, realistic, _, found = detector.detect("surreal filmmaker")
+    # 'real' is inside 'surreal' and 'film' inside 'filmmaker': neither counts
+    assert (dreamshaper, realistic) == (0, 0)
+    assert found == ()
+
+
+def test_plural_keywords_match():
+    detector = StyleDetector()
+    style, _, dreamshaper, realistic, _, found = detector.detect("photos of cameras")
+    assert style == 'realistic_vision'
+    # photo + its context bonus, camera
+    assert realistic == 8 + 5 + 3
+    assert found == ('photo (+8)', 'camera (+3)')
+
+
+def test_multiword_keywords_also_count_their_words():
+    _, _, _, realistic, _, found = StyleDetector().detect("ultra detailed lenses")
+    assert found == ('detailed (+5)', 'ultra detailed (+6)', 'lens (+2)')
+    assert realistic == 13
+
+
+def test_plural_forms():
+    assert [plural(word) for word in ('photo', 'lens', 'sketch', 'sky', 'day')] == \
+        ['photos', 'lenses', 'sketches', 'skies', 'days']
+
+
+def test_detect_batch_matches_detect():
+    prompts = ["anime girl in the rain", "photos of cameras", "surreal filmmaker", "anime girl in the rain", ""]
+    batched = StyleDetector().detect_batch(prompts)
+    single = StyleDetector(cache_size=0)
+    assert batched == [single.detect(prompt) for prompt in prompts]
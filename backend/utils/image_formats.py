@@ -0,0 +1,16 @@
+"""
+Output image formats this installation can write
+"""
+
+from config import OUTPUT_FORMATS
+
+try:
+    # Registers the AVIF codec with Pillow
+    import pillow_avif  # noqa: F401
+except ImportError:
+    pillow_avif = None
+
+
+def available_formats():
+    """Output formats the installed Pillow can write"""
+    return [name for name in OUTPUT_FORMATS if name != 'avif' or pillow_avif is not None]
@@ -0,0 +1,207 @@
+"""
+Prompt style detection with a compiled keyword matcher
+"""
+
+import re
+import threading
+from collections import OrderedDict
+from itertools import chain
+import numpy as np
+from config import DREAMSHAPER_KEYWORDS, REALISTIC_KEYWORDS, STYLE_CONTEXT_BONUSES, STYLE_DETECTION_CACHE_SIZE
+
+# Hugging Face ids of the models each detected style maps to
+STYLE_MODEL_IDS = {
+    'dreamshaper': 'Lykon/dreamshaper-8',
+    'realistic_vision': 'SG161222/Realistic_Vision_V5.1_noVAE'
+}
+
+WORD = re.compile(r'\w+')
+# Trie key marking the end of a keyword
+END = ''
+
+
+def tokenize(text):
+    return WORD.findall(text.lower())
+
+
+def plural(word):
+    """Regular English plural of a word"""
+    if word.endswith(('s', 'x', 'z', 'ch', 'sh')):
+        return word + 'es'
+    if word.endswith('y') and word[-2:-1] not in 'aeiou':
+        return word[:-1] + 'ies'
+    return word + 's'
+
+
+class StyleDetector:
+    """Scores prompts against the style keyword tables in one pass over their words
+
+    The keyword tables are compiled once into a trie over words, so matching
+    walks the prompt's words a single time however many keywords there are,
+    and keywords only match whole words: 'real' does not match inside
+    'surreal'. Whole-word matching would also miss plurals, so every keyword
+    is compiled with the plural of its last word too ('photos', 'cameras').
+    Multiword keywords and the keywords inside them both score ('ultra
+    detailed' also counts 'detailed'). Each keyword counts once per prompt.
+    Results are memoized per prompt in an LRU shared by detect() and
+    detect_batch(), which scores all its unmemoized prompts with one matrix
+    product.
+    """
+
+    def __init__(self, keywords=None, context_bonuses=STYLE_CONTEXT_BONUSES, cache_size=STYLE_DETECTION_CACHE_SIZE):
+        keywords = keywords or {
+            'dreamshaper': DREAMSHAPER_KEYWORDS,
+            'realistic_vision': REALISTIC_KEYWORDS
+        }
+        self.styles = list(keywords)
+        # Trie targets are keyword ids (>= 0, in config order so found lists keep it) or ~bonus id (< 0)
+        self.keywords = []
+        self.trie = {}
+        for style, table in keywords.items():
+            for keyword, score in table.items():
+                self._insert(keyword, len(self.keywords))
+                self.keywords.append((style, score, f"{keyword} (+{score})"))
+        # Context words add their style's bonus once however many of them appear
+        self.bonuses = []
+        for style, (words, bonus) in context_bonuses.items():
+            for word in words:
+                self._insert(word, ~len(self.bonuses))
+            self.bonuses.append((style, bonus))
+
+        # Score of every match target per style: keyword rows, then bonus rows
+        self.weights = np.zeros((len(self.keywords) + len(self.bonuses), len(self.styles)), dtype=np.int64)
+        for target, (style, score, _) in enumerate(self.keywords):
+            self.weights[target, self.styles.index(style)] = score
+        for index, (style, bonus) in enumerate(self.bonuses):
+            self.weights[len(self.keywords) + index, self.styles.index(style)] = bonus
+
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {
+            'hits': 0,
+            'misses': 0
+        }
+
+    def _insert(self, phrase, target):
+        words = tokenize(phrase)
+        for form in (words, words[:-1] + [plural(words[-1])]):
+            node = self.trie
+            for word in form:
+                node = node.setdefault(word, {})
+            if target not in node.get(END, ()):
+                node[END] = node.get(END, ()) + (target,)
+
+    def match(self, prompt):
+        """Trie targets found in a prompt: keyword ids and ~bonus ids"""
+        words = tokenize(prompt)
+        found = set()
+        trie = self.trie
+        count = len(words)
+        for start, word in enumerate(words):
+            node = trie.get(word)
+            position = start + 1
+            while node is not None:
+                if END in node:
+                    found.update(node[END])
+                if position == count:
+                    break
+                node = node.get(words[position])
+                position += 1
+        return found
+
+    def detect(self, prompt):
+        """(style, model id, dreamshaper score, realistic score, dreamshaper keywords, realistic keywords)"""
+        with self.lock:
+            result = self.cache.get(prompt)
+            if result is not None:
+                self.cache.move_to_end(prompt)
+                self.stats['hits'] += 1
+                return result
+            self.stats['misses'] += 1
+        result = self._detect(prompt)
+        self._store({prompt: result})
+        return result
+
+    def _detect(self, prompt):
+        targets = self.match(prompt)
+        scores = dict.fromkeys(self.styles, 0)
+        for target in targets:
+            if target < 0:
+                style, bonus = self.bonuses[~target]
+                scores[style] += bonus
+            else:
+                style, score, _ = self.keywords[target]
+                scores[style] += score
+        return self._result(scores['dreamshaper'], scores['realistic_vision'], targets)
+
+    def detect_batch(self, prompts):
+        """
+        detect() for many prompts: repeated and memoized prompts are looked up,
+        the rest are matched and then scored together as a prompt x target
+        incidence matrix times the target x style weights
+        """
+        found, misses = self._lookup(list(dict.fromkeys(prompts)))
+        if misses:
+            matches = [self.match(prompt) for prompt in misses]
+            offset = len(self.keywords)
+            columns = [[target if target >= 0 else offset + ~target for target in targets] for targets in matches]
+            incidence = np.zeros((len(misses), len(self.weights)), dtype=np.int64)
+            rows = np.repeat(np.arange(len(misses)), [len(targets) for targets in columns])
+            incidence[rows, np.fromiter(chain.from_iterable(columns), dtype=np.int64, count=len(rows))] = 1
+            scores = (incidence @ self.weights).tolist()
+            dreamshaper, realistic = self.styles.index('dreamshaper'), self.styles.index('realistic_vision')
+            computed = {
+                prompt: self._result(row[dreamshaper], row[realistic], targets)
+                for prompt, row, targets in zip(misses, scores, matches)
+            }
+            self._store(computed)
+            found.update(computed)
+        return [found[prompt] for prompt in prompts]
+
+    def _result(self, dreamshaper_score, realistic_score, targets):
+        found = {style: [] for style in self.styles}
+        # Keyword ids follow config order, so the found lists keep it
+        for target in sorted(target for target in targets if target >= 0):
+            style, _, label = self.keywords[target]
+            found[style].append(label)
+        # Ties go to the realistic model, as they always have
+        style = 'dreamshaper' if dreamshaper_score > realistic_score else 'realistic_vision'
+        return (style, STYLE_MODEL_IDS[style], dreamshaper_score, realistic_score,
+                tuple(found['dreamshaper']), tuple(found['realistic_vision']))
+
+    def _lookup(self, prompts):
+        """({prompt: memoized result}, [prompts not memoized])"""
+        found = {}
+        misses = []
+        with self.lock:
+            for prompt in prompts:
+                result = self.cache.get(prompt)
+                if result is None:
+                    misses.append(prompt)
+                else:
+                    self.cache.move_to_end(prompt)
+                    found[prompt] = result
+            self.stats['hits'] += len(found)
+            self.stats['misses'] += len(misses)
+        return found, misses
+
+    def _store(self, results):
+        if self.cache_size <= 0:
+            return
+        with self.lock:
+            self.cache.update(results)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def get_stats(self):
+        with self.lock:
+            hits, misses, size = self.stats['hits'], self.stats['misses'], len(self.cache)
+        lookups = hits + misses
+        return {
+            'keywords': len(self.keywords),
+            'cache_hits': hits,
+            'cache_misses': misses,
+            'cache_size': size,
+            'hit_rate': round(hits / lookups, 3) if lookups else 0
+        }
@@ -4,6 +4,8 @@ Validation utilities for user input
 
 import re
 import logging
+from config import SPEED_MODES, QUALITY_PRESETS
+from utils.image_formats import available_formats
 
 logger = logging.getLogger(__name__)
 
@@ -67,4 +69,46 @@ def validate_file_upload(file, allowed_extensions, max_size_mb):
     if file_length > max_size:
         return False, f"File too large. Maximum allowed size is {max_size_mb}MB"
     
-    return True, "" 
\ No newline at end of file
+    return True, ""
+
+
+def validate_generation_options(data):
+    """Validate optional generation settings and map them to service kwargs"""
+    options = {}
+
+    seed = data.get('seed')
+    if seed is not None:
+        if isinstance(seed, bool) or not isinstance(seed, int) or seed < 0 or seed >= 2 ** 32:
+            return False, "Seed must be an integer between 0 and 4294967295", {}
+        options['seed'] = seed
+
+    if 'useCache' in data:
+        if not isinstance(data['useCache'], bool):
+            return False, "useCache must be true or false", {}
+        options['use_cache'] = data['useCache']
+
+    speed_mode = data.get('speedMode')
+    if speed_mode is not None:
+        if speed_mode not in SPEED_MODES:
+            return False, f"Invalid speed mode. Must be one of: {', '.join(SPEED_MODES)}", {}
+        options['speed_mode'] = speed_mode
+
+    quality = data.get('quality')
+    if quality is not None:
+        if quality not in QUALITY_PRESETS:
+            return False, f"Invalid quality. Must be one of: {', '.join(QUALITY_PRESETS)}", {}
+        options['quality'] = quality
+
+    output_format = data.get('outputFormat')
+    if output_format is not None:
+        formats = available_formats()
+        if output_format not in formats:
+            return False, f"Invalid output format. Must be one of: {', '.join(formats)}", {}
+        options['output_format'] = output_format
+
+    if 'draft' in data:
+        if not isinstance(data['draft'], bool):
+            return False, "draft must be true or false", {}
+        options['draft'] = data['draft']
+
+    return True, "", options